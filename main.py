@@ -1,36 +1,222 @@
 """Main entry point for the Telegram Ozon Supplies Bot."""
+import argparse
 import sys
-import signal
+import time
 from src.config import Config
 from src.utils import setup_logging
 from src.bot import OzonBot
+from src.catalog import ProductCatalog
+from src.sheets_manager import SheetsManager
+from src.standins import FIXTURE_SHEETS_ID, generate_fixture, load_fixture, record_fixture, start_standins
+from src.state_store import StateStore
+from src.sync import BatchSync, format_report
 
 
-def signal_handler(sig, frame):
-    """Handle shutdown signals gracefully."""
-    print("\n🛑 Shutting down bot...")
-    sys.exit(0)
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Telegram Ozon Supplies Bot")
+    parser.add_argument(
+        "--mode",
+        choices=["polling", "webhook"],
+        default=None,
+        help="Update delivery mode (overrides BOT_MODE from .env)"
+    )
+    commands = parser.add_subparsers(dest="command")
+    sync = commands.add_parser(
+        "sync",
+        help="Fetch postings of warehouses into Tasks without Telegram (e.g. from cron)"
+    )
+    sync.add_argument(
+        "--warehouses",
+        nargs="+",
+        default=["all"],
+        help='Warehouse names from the "Ozon" sheet or "all" (default)'
+    )
+    sync.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="Warehouses processed at once (default FETCH_CONCURRENCY)"
+    )
+    sync.add_argument(
+        "--dry-run",
+        metavar="FILE",
+        default=None,
+        help="Write the Tasks rows to this CSV file instead of Google Sheets"
+    )
+    standins = commands.add_parser(
+        "standins",
+        help="Run local Ozon, Sheets and Telegram API stand-ins for offline runs and load tests"
+    )
+    standins.add_argument(
+        "--fixture",
+        metavar="FILE",
+        default=None,
+        help="Fixture written by the record command (default: generated data)"
+    )
+    standins.add_argument(
+        "--warehouses",
+        type=int,
+        default=2,
+        help="Warehouses of the generated data (default 2)"
+    )
+    standins.add_argument(
+        "--postings",
+        type=int,
+        default=500,
+        help="Postings per warehouse of the generated data (default 500)"
+    )
+    standins.add_argument("--host", default="127.0.0.1", help="Listen address")
+    standins.add_argument(
+        "--port",
+        type=int,
+        default=8081,
+        help="Ozon stand-in port, Sheets and Telegram use the next two (default 8081)"
+    )
+    standins.add_argument("--page-size", type=int, default=None, help="Ozon postings per page")
+    standins.add_argument("--latency", type=float, default=0.0, help="Seconds added to Ozon responses")
+    standins.add_argument("--error-rate", type=float, default=0.0, help="Share of Ozon requests answered with 503")
+    standins.add_argument("--throttle-rate", type=float, default=0.0, help="Share of Ozon requests answered with 429")
+    standins.add_argument("--seed", type=int, default=None, help="Random seed of data and error injection")
+    record = commands.add_parser(
+        "record",
+        help="Record \"Ozon\"/\"Access\" sheets and postings into a redacted fixture"
+    )
+    record.add_argument("output", metavar="FILE", help="Fixture file to write")
+    record.add_argument(
+        "--warehouses",
+        nargs="+",
+        default=None,
+        help="Warehouse names to record postings of (default all)"
+    )
+    return parser.parse_args()
+
+
+def run_sync(args) -> int:
+    """
+    Run headless batch sync and print the per-warehouse timing report.
+    
+    Returns:
+        Process exit code (1 if any warehouse failed)
+    """
+    # The state store provides the last "Ozon" sheet snapshot if Sheets is unreachable
+    sheets_manager = SheetsManager(StateStore(), connect=False)
+    try:
+        sheets_manager.connect()
+    except Exception as e:
+        if not args.dry_run:
+            print(f"❌ Google Sheets connection failed: {e}")
+            return 1
+        print(f"⚠️ Google Sheets connection failed, using saved warehouse list: {e}")
+    
+    catalog = ProductCatalog()
+    try:
+        batch = BatchSync(sheets_manager, concurrency=args.concurrency, catalog=catalog)
+        try:
+            warehouses = batch.select_warehouses(args.warehouses)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 1
+        if not warehouses:
+            print("❌ No warehouses found. Check the \"Ozon\" sheet.")
+            return 1
+        
+        started = time.perf_counter()
+        results = batch.run(warehouses, dry_run=args.dry_run)
+        print(format_report(results, time.perf_counter() - started))
+        if args.dry_run:
+            print(f"📄 Dry run written to {args.dry_run}")
+    finally:
+        catalog.close()
+    return 1 if any(result.error for result in results) else 0
+
+
+def run_standins(args) -> int:
+    """
+    Serve API stand-ins until Ctrl+C and print the settings pointing the bot at them.
+    
+    Returns:
+        Process exit code
+    """
+    if args.fixture:
+        fixture = load_fixture(args.fixture)
+    else:
+        fixture = generate_fixture(args.warehouses, args.postings, seed=args.seed)
+    ozon, sheets, telegram = start_standins(
+        fixture,
+        host=args.host,
+        ports=(args.port, args.port + 1, args.port + 2),
+        page_size=args.page_size,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        seed=args.seed
+    )
+    print("✅ Stand-ins are running, start the bot with:")
+    print(f"OZON_API_BASE_URL={ozon.url}")
+    print(f"SHEETS_API_BASE_URL={sheets.url}")
+    print(f"TELEGRAM_API_BASE_URL={telegram.url}")
+    print(f"GOOGLE_SHEETS_ID={FIXTURE_SHEETS_ID}")
+    try:
+        while True:
+            time.sleep(60)
+            print(f"Ozon responses: {ozon.statuses}, Telegram calls: {len(telegram.sent)}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in (ozon, sheets, telegram):
+            server.stop()
+    return 0
+
+
+def run_record(args) -> int:
+    """
+    Record the live spreadsheet and postings into a redacted fixture.
+    
+    Returns:
+        Process exit code
+    """
+    try:
+        sheets_manager = SheetsManager()
+    except Exception as e:
+        print(f"❌ Google Sheets connection failed: {e}")
+        return 1
+    counts = record_fixture(sheets_manager, args.output, args.warehouses)
+    print(
+        f"📼 Recorded {counts['warehouses']} warehouses, {counts['postings']} postings, "
+        f"{counts['access_rows']} access rows to {args.output}"
+    )
+    return 0
 
 
 def main():
     """Main application entry point."""
+    args = parse_args()
+    if args.mode:
+        Config.BOT_MODE = args.mode
+    
     # Setup logging
     setup_logging(Config.LOG_LEVEL, Config.LOG_FILE)
     
+    if args.command == "standins":
+        sys.exit(run_standins(args))
+    
     # Validate configuration
-    if not Config.validate():
+    if not Config.validate(telegram=args.command not in ("sync", "record")):
         print("❌ Configuration validation failed. Please check your .env file.")
         sys.exit(1)
     
-    # Register signal handlers for graceful shutdown
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
+    if args.command == "sync":
+        sys.exit(run_sync(args))
+    if args.command == "record":
+        sys.exit(run_record(args))
     
-    # Initialize and run bot
+    # Initialize and run bot; SIGINT/SIGTERM are handled by the application,
+    # which drains running jobs before it exits
     try:
         bot = OzonBot()
         print("✅ Bot initialized successfully. Starting...")
-        bot.run()
+        bot.run(Config.BOT_MODE)
     except KeyboardInterrupt:
         print("\n🛑 Bot stopped by user")
     except Exception as e:
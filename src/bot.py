@@ -1,7 +1,12 @@
 """Telegram bot handler for Ozon supplies management."""
+import html
 import logging
-from typing import Dict, Any
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
+from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import RetryAfter
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -10,223 +15,262 @@ from telegram.ext import (
 )
 from .config import Config
 from .sheets_manager import SheetsManager
-from .ozon_client import OzonClient
-from .utils import extract_offer_id_number
+from .ozon_client import OzonClient, get_client, invalidate_clients
+from .sort_keys import ShelfBuckets, reset_default_engine
+from .utils import make_callback_data, prepare_pick_list, resolve_callback_name, setup_logging
+from .export import available_formats, build_pick_list, iter_pick_list_rows
+from .catalog import ProductCatalog
+from .metrics import (
+    CACHE_REQUESTS,
+    MESSAGES_DROPPED,
+    OZON_REQUEST_SECONDS,
+    PARSE_SECONDS,
+    QUEUE_DEPTH,
+    REGISTRY,
+    SHEETS_CALL_SECONDS,
+    TELEGRAM_RATE_LIMITED,
+    TELEGRAM_SEND_SECONDS,
+    start_metrics_server
+)
+from .jobs import Job, JobCancelled, JobManager
+from .labels import LabelStore, labels_available
+from .pipeline import StreamingPipeline
+from .poller import PostingPoller
+from .profiling import PROFILE_MODES, LoopWatchdog, ProfileController, ProfileReport
+from .rate_limit import client_states, reconfigure_limits
+from .state_store import StateStore
+from .tracing import configure_tracing, set_attributes, shutdown_tracing, span, start_trace
+from .work_queue import QUEUED, RUNNING, QueuedJob, WorkQueue
+from .workers import WorkerPool
 
 
 logger = logging.getLogger(__name__)
 
+# Only update types the bot has handlers for
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
 
-class OzonBot:
-    """Main bot class for handling Telegram interactions."""
+# Max posting numbers listed in one aggregated product message
+MAX_POSTINGS_IN_MESSAGE = 10
+
+# Job name used for the aggregated run over all accessible warehouses
+ALL_WAREHOUSES_JOB = "Все склады"
+
+# Job name prefix of new postings pushed by the background poller
+NEW_POSTINGS_JOB = "🆕"
+
+# Seconds between bulk writes of new product catalog entries
+CATALOG_FLUSH_INTERVAL = 60
+
+# Seconds between sweeps of old delivered postings (first one shortly after start)
+DELIVERED_PRUNE_INTERVAL = 24 * 60 * 60
+
+# Max characters of a profile summary sent to Telegram
+MAX_PROFILE_SUMMARY = 3500
+
+# Seconds between checks replacing dead worker processes
+WORKER_CHECK_INTERVAL = 5
+
+# Settings applied on reload by restarting the log listener
+LOG_SETTINGS = {"LOG_FILE", "LOG_MAX_BYTES", "LOG_ROTATE_WHEN", "LOG_BACKUP_COUNT", "LOG_JSON"}
+
+# Settings applied on reload to the per-client_id limiters and breakers
+LIMIT_SETTINGS = {
+    "OZON_RATE_LIMIT_RPS", "OZON_RATE_LIMIT_BURST",
+    "OZON_CIRCUIT_FAILURES", "OZON_CIRCUIT_RESET_SECONDS",
+}
+
+# Settings used only while starting up, a reload just reports them
+RESTART_REQUIRED_SETTINGS = {
+    "TELEGRAM_BOT_TOKEN", "BOT_MODE", "WEBHOOK_URL", "WEBHOOK_LISTEN", "WEBHOOK_PORT",
+    "WEBHOOK_PATH", "WEBHOOK_SECRET_TOKEN", "GOOGLE_SHEETS_ID", "GOOGLE_SERVICE_ACCOUNT_JSON",
+    "STATE_DB_PATH", "METRICS_PORT", "METRICS_ADDR", "STATS_WINDOW_SIZE",
+    "LABELS_CACHE_DIR", "LOG_PAGE_SAMPLE", "LOOP_BLOCK_THRESHOLD",
+    "SHEETS_API_BASE_URL", "TELEGRAM_API_BASE_URL",
+}
+
+
+async def _timed_send(method: str, call: Awaitable[Any]) -> Any:
+    """Await Telegram send call recording its latency and rate limiting."""
+    with span(f"telegram.{method}") as send_span, TELEGRAM_SEND_SECONDS.time(method=method):
+        try:
+            result = await call
+            send_span.set_attribute("status", "ok")
+            return result
+        except RetryAfter as e:
+            TELEGRAM_RATE_LIMITED.inc()
+            send_span.set_attribute("status", "retry_after")
+            send_span.set_attribute("retry_after", str(e.retry_after))
+            raise
+
+
+def _traced(callback: Callable[[Update, ContextTypes.DEFAULT_TYPE], Awaitable[None]]):
+    """Run update handler in its own trace (jobs it starts stay in it)."""
+    async def handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        attributes = {}
+        if update.effective_chat:
+            attributes["chat_id"] = update.effective_chat.id
+        if update.callback_query and update.callback_query.data:
+            attributes["data"] = update.callback_query.data
+        with start_trace(f"bot.{callback.__name__}", **attributes):
+            await callback(update, context)
+    return handler
+
+
+class _QueuedJobContext:
+    """Callback context of a job run by a worker process (only .bot is used)."""
     
-    def __init__(self):
-        """Initialize the bot with dependencies."""
-        self.sheets_manager = SheetsManager()
-        self.application = Application.builder().token(Config.TELEGRAM_BOT_TOKEN).build()
-        self._setup_handlers()
+    def __init__(self, bot: Bot):
+        self.bot = bot
+
+
+class WarehouseJobs:
+    """
+    Warehouse runs and their checkpointed deliveries.
     
-    def _setup_handlers(self) -> None:
-        """Set up command and callback handlers."""
-        self.application.add_handler(CommandHandler("start", self.start_command))
-        self.application.add_handler(CommandHandler("check_orders", self.check_orders_command))
-        self.application.add_handler(CallbackQueryHandler(self.warehouse_callback, pattern="^warehouse_"))
-        self.application.add_handler(CallbackQueryHandler(self.navigation_callback, pattern="^(refresh_|back_to_warehouses)"))
+    The bot front-end (OzonBot) runs them in its own process; worker
+    processes use this class alone, as it only needs Sheets, the state
+    store, the product catalog and a Telegram Bot to send messages - no
+    Application, handlers, job queue, poller or worker pool.
+    """
     
-    async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Handle /start command - show warehouse selection menu."""
-        chat_id = str(update.effective_chat.id)
+    def __init__(self, bot: Bot):
+        """
+        Initialize dependencies of the runs.
         
-        try:
-            # Get available warehouses
-            warehouses = self.sheets_manager.get_warehouses()
-            
-            if not warehouses:
-                await update.message.reply_text(
-                    "❌ Не найдено доступных складов. Проверьте настройки."
-                )
-                return
-            
-            # Filter warehouses by user access (supports multiple users per warehouse)
-            warehouse_access = self.sheets_manager.get_warehouse_chat_ids()
-            available_warehouses = [
-                w for w in warehouses
-                if str(chat_id).strip() in warehouse_access.get(w["warehouse_name"], [])
-            ]
-            
-            if not available_warehouses:
-                await update.message.reply_text(
-                    "❌ У вас нет доступа ни к одному складу. "
-                    "Обратитесь к администратору."
-                )
-                logger.warning(f"User {chat_id} has no warehouse access")
-                return
-            
-            # Show warehouse selection menu
-            await self._show_warehouse_menu(update, available_warehouses)
-            logger.info(f"User {chat_id} started the bot")
-            
-        except Exception as e:
-            logger.error(f"Error in start_command: {e}", exc_info=True)
-            await update.message.reply_text(
-                "❌ Произошла ошибка при получении списка складов."
-            )
+        Args:
+            bot: Telegram bot used to send messages
+        """
+        self.bot = bot
+        self.job_manager = JobManager(bot)
+        self.state_store = StateStore()
+        self.sheets_manager = SheetsManager(self.state_store, connect=False)
+        self.catalog = ProductCatalog()
+        # Background poller of the front-end, its cache serves fresh postings
+        # (not shared with worker processes, they always fetch from Ozon)
+        self.poller: Optional[PostingPoller] = None
+        # Set when warehouse jobs run in worker processes
+        self.work_queue: Optional[WorkQueue] = None
     
-    async def _show_warehouse_menu(
+    def _cached_postings(self, warehouse_name: str) -> Optional[List[Dict[str, Any]]]:
+        """Postings from the last background poll if still fresh (None without a poller)."""
+        return self.poller.get_cached_postings(warehouse_name) if self.poller else None
+    
+    def _fetch_postings(
         self,
-        update: Update,
-        warehouses: list,
-        message_text: str = "Выберите склад для получения отправлений:"
-    ) -> None:
-        """Show warehouse selection menu with inline keyboard."""
-        keyboard = []
-        for warehouse in warehouses:
-            warehouse_name = warehouse["warehouse_name"]
-            city = warehouse.get("city", "")
-            button_text = f"{warehouse_name}"
-            if city:
-                button_text = f"{city} - {warehouse_name}"
-            
-            keyboard.append([
-                InlineKeyboardButton(
-                    button_text,
-                    callback_data=f"warehouse_{warehouse_name}"
-                )
-            ])
+        warehouse: Dict[str, str],
+        on_page: Optional[Callable[[int, int], None]] = None
+    ) -> List[Dict[str, Any]]:
+        """Fetch all postings of a warehouse (blocking), refreshing the poller cache if any."""
+        if self.poller:
+            return self.poller.fetch_postings(warehouse, on_page=on_page)
+        ozon_client = get_client(
+            client_id=warehouse["client_id"],
+            api_key=warehouse["api_key"]
+        )
+        return ozon_client.get_all_postings(
+            filter_dict=OzonClient.filter_for_warehouse(warehouse),
+            on_page=on_page
+        )
+    
+    async def run_queued_job(self, queued: QueuedJob) -> Job:
+        """
+        Run job taken from the work queue (in a worker process).
         
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        The job goes through the JobManager as in single-process mode, so
+        progress messages, replies and errors are the same. A cancel tap
+        handled by the front-end is picked up from the queue.
         
-        if update.message:
-            await update.message.reply_text(
-                message_text,
-                reply_markup=reply_markup
-            )
-        elif update.callback_query:
-            await update.callback_query.edit_message_text(
-                message_text,
-                reply_markup=reply_markup
-            )
-    
-    async def check_orders_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Handle /check_orders command - show warehouse selection."""
-        chat_id = str(update.effective_chat.id)
+        Args:
+            queued: Job taken by WorkQueue.claim()
         
-        try:
-            # Get available warehouses
-            warehouses = self.sheets_manager.get_warehouses()
-            
-            if not warehouses:
-                await update.message.reply_text(
-                    "❌ Не найдено доступных складов. Проверьте настройки."
-                )
-                return
-            
-            # Filter warehouses by user access (supports multiple users per warehouse)
-            warehouse_access = self.sheets_manager.get_warehouse_chat_ids()
-            available_warehouses = [
-                w for w in warehouses
-                if str(chat_id).strip() in warehouse_access.get(w["warehouse_name"], [])
-            ]
-            
-            if not available_warehouses:
-                await update.message.reply_text(
-                    "❌ У вас нет доступа ни к одному складу. "
-                    "Обратитесь к администратору."
-                )
-                logger.warning(f"User {chat_id} has no warehouse access")
-                return
-            
-            # Show warehouse selection menu using common function
-            await self._show_warehouse_menu(update, available_warehouses)
-            logger.info(f"User {chat_id} requested warehouse selection")
-            
-        except Exception as e:
-            logger.error(f"Error in check_orders_command: {e}", exc_info=True)
-            await update.message.reply_text(
-                "❌ Произошла ошибка при получении списка складов."
-            )
-    
-    async def warehouse_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Handle warehouse selection callback."""
-        query = update.callback_query
-        await query.answer()
+        Returns:
+            Finished job, interrupted if the worker is being stopped
         
-        chat_id = str(update.effective_chat.id)
-        warehouse_name = query.data.replace("warehouse_", "")
+        Raises:
+            ValueError: If the job refers to an unknown warehouse or kind
+        """
+        context = _QueuedJobContext(self.bot)
+        chat_id = queued.chat_id
+        message = tuple(queued.payload["message"]) if queued.payload.get("message") else None
+        warehouses = await asyncio.to_thread(self.sheets_manager.get_warehouses)
         
-        try:
-            # Verify user has access to this warehouse
-            if not self.sheets_manager.check_user_access(chat_id, warehouse_name):
-                await query.edit_message_text(
-                    "❌ У вас нет доступа к этому складу."
-                )
-                return
-            
-            # Get warehouse details
-            warehouses = self.sheets_manager.get_warehouses()
-            warehouse = next(
-                (w for w in warehouses if w["warehouse_name"] == warehouse_name),
-                None
-            )
-            
-            if not warehouse:
-                await query.edit_message_text(
-                    "❌ Склад не найден."
-                )
-                return
-            
-            # Notify user that fetching has started
-            await query.edit_message_text(
-                f"⏳ Загружаю отправления для склада: {warehouse_name}..."
-            )
-            
-            # Fetch orders from Ozon API
-            await self._process_warehouse_orders(update, context, warehouse)
-            
-        except Exception as e:
-            logger.error(f"Error in warehouse_callback: {e}", exc_info=True)
-            await query.edit_message_text(
-                f"❌ Произошла ошибка при обработке склада {warehouse_name}."
-            )
+        if queued.kind == "warehouse":
+            warehouse = next((w for w in warehouses if w["warehouse_name"] == queued.name), None)
+            if warehouse is None:
+                raise ValueError(f"Warehouse {queued.name} not found")
+            run = lambda job: self._process_warehouse_orders(context, chat_id, warehouse, job)
+        elif queued.kind == "all_warehouses":
+            names = set(queued.payload["warehouses"])
+            selected = [w for w in warehouses if w["warehouse_name"] in names]
+            run = lambda job: self._process_all_warehouses(context, chat_id, selected, job)
+        else:
+            raise ValueError(f"Unknown job kind {queued.kind}")
+        
+        job, _ = self.job_manager.start(chat_id, queued.name, message, run)
+        while not job.task.done():
+            await asyncio.wait({job.task}, timeout=1)
+            if not job.task.done() and await asyncio.to_thread(self.work_queue.is_cancelled, queued.job_id):
+                self.job_manager.cancel(chat_id, queued.name)
+                await asyncio.wait({job.task})
+        return job
     
     async def _process_warehouse_orders(
         self,
-        update: Update,
         context: ContextTypes.DEFAULT_TYPE,
-        warehouse: Dict[str, str]
+        chat_id: str,
+        warehouse: Dict[str, str],
+        job: Optional[Job] = None
     ) -> None:
-        """Process orders for selected warehouse."""
+        """
+        Process orders for selected warehouse.
+        
+        Blocking Ozon and Sheets calls run in worker threads, progress
+        is reported to the job (if any) so it can be shown to the user.
+        A delivery interrupted by a restart is continued instead.
+        """
         warehouse_name = warehouse["warehouse_name"]
-        chat_id = update.effective_chat.id
+        
+        def progress(text: str) -> None:
+            if job:
+                job.set_progress(f"⏳ {warehouse_name}: {text}")
         
         try:
-            # Initialize Ozon client
-            ozon_client = OzonClient(
-                client_id=warehouse["client_id"],
-                api_key=warehouse["api_key"]
-            )
+            if await self._resume_delivery(context.bot, chat_id, warehouse_name, job):
+                return
+            
+            # Serve postings from the last background poll if still fresh,
+            # otherwise fetch all postings (this also refreshes the cache)
+            postings = self._cached_postings(warehouse_name)
+            
+            # Aggregation needs all postings at once, so it always runs staged
+            if (
+                postings is None
+                and Config.PIPELINE_STREAMING
+                and Config.PICK_LIST_MODE != "aggregated"
+            ):
+                await self._process_warehouse_streaming(context, chat_id, warehouse, progress)
+                return
             
-            # Fetch all postings
-            postings = ozon_client.get_all_postings()
+            if postings is None:
+                progress("загрузка отправлений...")
+                postings = await asyncio.to_thread(
+                    self._fetch_postings,
+                    warehouse,
+                    on_page=lambda page, total: progress(
+                        f"страница {page}, отправлений: {total}"
+                    )
+                )
+            
+            # Rows of postings packed or cancelled since the last run
+            await asyncio.to_thread(
+                self.sheets_manager.mark_stale_tasks,
+                {warehouse_name: [posting.get("posting_number", "") for posting in postings]}
+            )
             
             if not postings:
                 # Show message with navigation menu
                 message_text = f"ℹ️ Для склада {warehouse_name} нет новых отправлений."
-                keyboard = [
-                    [
-                        InlineKeyboardButton(
-                            "🔄 Получить отправления",
-                            callback_data=f"refresh_{warehouse_name}"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            "⬅️ Назад к складам",
-                            callback_data="back_to_warehouses"
-                        )
-                    ]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+                reply_markup = self._navigation_markup(warehouse_name)
                 await context.bot.send_message(
                     chat_id=chat_id,
                     text=message_text,
@@ -234,39 +278,29 @@ class OzonBot:
                 )
                 return
             
-            # Process each posting
-            all_products = []
+            # Process each posting: products go straight into shelf buckets,
+            # only those with valid offer_id numbers (1-99) are kept
+            buckets = ShelfBuckets()
+            parsed_count = 0
             processed_postings = set()
             
-            for posting in postings:
-                posting_number = posting.get("posting_number", "")
+            with PARSE_SECONDS.time(mode="warehouse"):
+                for posting in postings:
+                    posting_number = posting.get("posting_number", "")
                 
-                # Parse products from posting
-                products = ozon_client.parse_posting_products(posting)
-                all_products.extend(products)
+                    # Parse products from posting
+                    products = OzonClient.parse_posting_products(posting, self.catalog)
+                    parsed_count += len(products)
+                    buckets.extend(products)
                 
-                # Store unique posting numbers for logging
-                if posting_number:
-                    processed_postings.add(posting_number)
+                    # Store unique posting numbers for logging
+                    if posting_number:
+                        processed_postings.add(posting_number)
             
-            if not all_products:
+            if not parsed_count:
                 # Show message with navigation menu
                 message_text = f"ℹ️ Для склада {warehouse_name} нет товаров в отправлениях."
-                keyboard = [
-                    [
-                        InlineKeyboardButton(
-                            "🔄 Получить отправления",
-                            callback_data=f"refresh_{warehouse_name}"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            "⬅️ Назад к складам",
-                            callback_data="back_to_warehouses"
-                        )
-                    ]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+                reply_markup = self._navigation_markup(warehouse_name)
                 await context.bot.send_message(
                     chat_id=chat_id,
                     text=message_text,
@@ -274,30 +308,8 @@ class OzonBot:
                 )
                 return
             
-            # Filter products: only include those with valid offer_id numbers (1-99)
-            # and sort by extracted number (ascending)
-            filtered_products = []
-            for product in all_products:
-                offer_id = product.get("offer_id", "")
-                number = extract_offer_id_number(offer_id)
-                if number is not None:  # Only include products with valid numbers (1-99)
-                    product["_sort_number"] = number  # Add sort key
-                    filtered_products.append(product)
-                else:
-                    logger.debug(
-                        f"Skipping product with offer_id '{offer_id}' "
-                        f"(no valid number 1-99 found)"
-                    )
-            
-            # Sort by extracted number (ascending: 1, 2, 3, ..., 99)
-            filtered_products.sort(key=lambda x: x.get("_sort_number", 999))
-            
-            # Remove temporary sort key
-            for product in filtered_products:
-                product.pop("_sort_number", None)
-            
-            # Use filtered and sorted products
-            all_products = filtered_products
+            # Emit products ordered by extracted number (ascending)
+            all_products = buckets.pop_all()
             
             if not all_products:
                 # Show message if no valid products after filtering
@@ -305,21 +317,7 @@ class OzonBot:
                     f"ℹ️ Для склада {warehouse_name} нет товаров с "
                     f"валидными Offer ID (номера 1-99)."
                 )
-                keyboard = [
-                    [
-                        InlineKeyboardButton(
-                            "🔄 Получить отправления",
-                            callback_data=f"refresh_{warehouse_name}"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            "⬅️ Назад к складам",
-                            callback_data="back_to_warehouses"
-                        )
-                    ]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+                reply_markup = self._navigation_markup(warehouse_name)
                 await context.bot.send_message(
                     chat_id=chat_id,
                     text=message_text,
@@ -328,24 +326,13 @@ class OzonBot:
                 return
             
             # Save to Tasks sheet
-            success = self.sheets_manager.add_to_tasks(all_products, warehouse_name)
+            progress(f"{len(all_products)} товаров, запись в таблицу...")
+            success = await asyncio.to_thread(
+                self.sheets_manager.add_to_tasks, all_products, warehouse_name
+            )
             
             if not success:
-                keyboard = [
-                    [
-                        InlineKeyboardButton(
-                            "🔄 Получить отправления",
-                            callback_data=f"refresh_{warehouse_name}"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            "⬅️ Назад к складам",
-                            callback_data="back_to_warehouses"
-                        )
-                    ]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+                reply_markup = self._navigation_markup(warehouse_name)
                 await context.bot.send_message(
                     chat_id=chat_id,
                     text="❌ Ошибка при сохранении данных в таблицу.",
@@ -354,43 +341,38 @@ class OzonBot:
                 return
             
             # Log processed orders
-            for posting_number in processed_postings:
-                self.sheets_manager.log_processed_order(posting_number, warehouse_name)
+            progress(f"журнал обработанных отправлений ({len(processed_postings)})...")
+            await asyncio.to_thread(
+                self.sheets_manager.log_processed_orders,
+                {warehouse_name: sorted(processed_postings)}
+            )
             
-            # Send individual messages with photos for each product
-            messages_sent = 0
-            for product in all_products:
-                try:
-                    await self._send_product_message(context, chat_id, product, warehouse_name)
-                    messages_sent += 1
-                except Exception as e:
-                    logger.error(f"Error sending product message: {e}", exc_info=True)
-                    # Continue with next product even if one fails
+            # Send individual messages with photos for each product,
+            # checkpointed so a restart continues from the next one;
+            # Tasks keeps one row per posting even in aggregated mode
+            pick_list = prepare_pick_list(all_products)
+            run = {
+                "items": [{"warehouse": warehouse_name, "product": product} for product in pick_list],
+                "postings": {warehouse_name: sorted(processed_postings)},
+                "messages": job.messages if job else [],
+            }
+            await asyncio.to_thread(
+                self.state_store.save_run, chat_id, warehouse_name, "warehouse", run
+            )
+            messages_sent = await self._deliver_run(
+                context.bot, chat_id, warehouse_name, dict(run, cursor=0), job, progress
+            )
             
             # Send summary message with navigation menu
             summary_text = (
                 f"✅ Обработка завершена для склада: {warehouse_name}\n\n"
                 f"📦 Отправлений: {len(processed_postings)}\n"
-                f"🛍️ Товаров: {len(all_products)}\n"
+                f"🛍️ Товаров: {len(pick_list)}\n"
                 f"💬 Сообщений отправлено: {messages_sent}"
             )
             
             # Create navigation menu
-            keyboard = [
-                [
-                    InlineKeyboardButton(
-                        "🔄 Получить отправления",
-                        callback_data=f"refresh_{warehouse_name}"
-                    )
-                ],
-                [
-                    InlineKeyboardButton(
-                        "⬅️ Назад к складам",
-                        callback_data="back_to_warehouses"
-                    )
-                ]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = self._navigation_markup(warehouse_name)
             
             await context.bot.send_message(
                 chat_id=chat_id,
@@ -403,6 +385,8 @@ class OzonBot:
                 f"with {len(all_products)} products for warehouse {warehouse_name}"
             )
             
+        except JobCancelled:
+            raise
         except Exception as e:
             logger.error(f"Error processing warehouse orders: {e}", exc_info=True)
             
@@ -444,76 +428,351 @@ class OzonBot:
                 reply_markup=reply_markup
             )
     
-    async def navigation_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Handle navigation callbacks (refresh warehouse or back to warehouses)."""
-        query = update.callback_query
-        await query.answer()
+    async def _process_warehouse_streaming(
+        self,
+        context: ContextTypes.DEFAULT_TYPE,
+        chat_id: str,
+        warehouse: Dict[str, str],
+        progress: Callable[[str], None]
+    ) -> None:
+        """Process warehouse with the overlapped streaming pipeline."""
+        warehouse_name = warehouse["warehouse_name"]
+        ozon_client = get_client(
+            client_id=warehouse["client_id"],
+            api_key=warehouse["api_key"]
+        )
         
-        chat_id = str(update.effective_chat.id)
-        callback_data = query.data
+        async def send_product(product: Dict[str, Any]) -> None:
+            await self._send_product_message(context.bot, chat_id, product, warehouse_name)
         
-        try:
-            if callback_data == "back_to_warehouses":
-                # Show warehouse selection menu
-                warehouses = self.sheets_manager.get_warehouses()
-                warehouse_access = self.sheets_manager.get_warehouse_chat_ids()
-                available_warehouses = [
-                    w for w in warehouses
-                    if str(chat_id).strip() in warehouse_access.get(w["warehouse_name"], [])
-                ]
-                
-                if available_warehouses:
-                    await self._show_warehouse_menu(
-                        update,
-                        available_warehouses,
-                        "Выберите склад для получения отправлений:"
-                    )
-                else:
-                    await query.edit_message_text(
-                        "❌ У вас нет доступа ни к одному складу."
-                    )
-                    
-            elif callback_data.startswith("refresh_"):
-                # Refresh orders for selected warehouse
-                warehouse_name = callback_data.replace("refresh_", "")
-                
-                # Verify user has access
-                if not self.sheets_manager.check_user_access(chat_id, warehouse_name):
-                    await query.edit_message_text(
-                        "❌ У вас нет доступа к этому складу."
-                    )
-                    return
-                
-                # Get warehouse details
-                warehouses = self.sheets_manager.get_warehouses()
-                warehouse = next(
-                    (w for w in warehouses if w["warehouse_name"] == warehouse_name),
-                    None
+        progress("загрузка отправлений...")
+        pipeline = StreamingPipeline(
+            ozon_client,
+            self.sheets_manager,
+            warehouse_name,
+            send_product,
+            progress,
+            filter_dict=OzonClient.filter_for_warehouse(warehouse),
+            catalog=self.catalog
+        )
+        stats = await pipeline.run()
+        set_attributes(
+            pages=stats["pages"],
+            postings=len(stats["postings"]),
+            products=stats["products"],
+            messages_sent=stats["messages_sent"]
+        )
+        
+        # Background poller must not push these postings again
+        await asyncio.to_thread(
+            self.state_store.mark_delivered, warehouse_name, stats["postings"]
+        )
+        await asyncio.to_thread(
+            self.sheets_manager.mark_stale_tasks, {warehouse_name: sorted(stats["postings"])}
+        )
+        
+        if not stats["postings"]:
+            message_text = f"ℹ️ Для склада {warehouse_name} нет новых отправлений."
+        elif not stats["parsed"]:
+            message_text = f"ℹ️ Для склада {warehouse_name} нет товаров в отправлениях."
+        elif not stats["products"]:
+            message_text = (
+                f"ℹ️ Для склада {warehouse_name} нет товаров с "
+                f"валидными Offer ID (номера 1-99)."
+            )
+        else:
+            message_text = (
+                f"✅ Обработка завершена для склада: {warehouse_name}\n\n"
+                f"📦 Отправлений: {len(stats['postings'])}\n"
+                f"🛍️ Товаров: {stats['products']}\n"
+                f"💬 Сообщений отправлено: {stats['messages_sent']}"
+            )
+            if stats["write_errors"]:
+                message_text += (
+                    f"\n❌ Не записано в таблицу строк: {stats['write_errors']}"
                 )
-                
-                if not warehouse:
-                    await query.edit_message_text(
-                        "❌ Склад не найден."
-                    )
-                    return
-                
-                # Notify user that fetching has started
-                await query.edit_message_text(
-                    f"⏳ Загружаю отправления для склада: {warehouse_name}..."
+        
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text=message_text,
+            reply_markup=self._navigation_markup(warehouse_name)
+        )
+        
+        logger.info(
+            f"Streamed {len(stats['postings'])} postings ({stats['pages']} pages) "
+            f"with {stats['products']} products for warehouse {warehouse_name}"
+        )
+    
+    async def _fetch_warehouse_postings(
+        self,
+        warehouse: Dict[str, str],
+        semaphore: asyncio.Semaphore
+    ) -> List[Dict[str, Any]]:
+        """Fetch postings for one warehouse (cached if fresh) within concurrency limit."""
+        postings = self._cached_postings(warehouse["warehouse_name"])
+        if postings is not None:
+            return postings
+        async with semaphore:
+            return await asyncio.to_thread(self._fetch_postings, warehouse)
+    
+    async def _process_all_warehouses(
+        self,
+        context: ContextTypes.DEFAULT_TYPE,
+        chat_id: str,
+        warehouses: List[Dict[str, str]],
+        job: Optional[Job] = None
+    ) -> None:
+        """
+        Process all given warehouses at once.
+        
+        Warehouses are fetched concurrently (at most Config.FETCH_CONCURRENCY
+        at a time), a failing warehouse does not affect the others. Results
+        are written to Tasks in one batch and sent grouped by warehouse.
+        """
+        def progress(text: str) -> None:
+            if job:
+                job.set_progress(f"⏳ {ALL_WAREHOUSES_JOB}: {text}")
+        
+        if await self._resume_delivery(context.bot, chat_id, ALL_WAREHOUSES_JOB, job):
+            return
+        
+        semaphore = asyncio.Semaphore(max(1, Config.FETCH_CONCURRENCY))
+        done = 0
+        
+        async def fetch(warehouse: Dict[str, str]):
+            nonlocal done
+            try:
+                return await self._fetch_warehouse_postings(warehouse, semaphore)
+            finally:
+                done += 1
+                progress(f"загружено складов {done}/{len(warehouses)}")
+        
+        progress(f"загрузка {len(warehouses)} складов...")
+        results = await asyncio.gather(
+            *(fetch(warehouse) for warehouse in warehouses),
+            return_exceptions=True
+        )
+        if job:
+            job.check_cancelled()
+        
+        products_by_warehouse: Dict[str, List[Dict[str, Any]]] = {}
+        postings_by_warehouse: Dict[str, List[str]] = {}
+        fetched_by_warehouse: Dict[str, List[str]] = {}
+        errors: Dict[str, str] = {}
+        
+        for warehouse, result in zip(warehouses, results):
+            warehouse_name = warehouse["warehouse_name"]
+            if isinstance(result, BaseException):
+                if isinstance(result, (asyncio.CancelledError, JobCancelled)):
+                    raise result
+                logger.error(f"Error fetching warehouse {warehouse_name}: {result}")
+                errors[warehouse_name] = str(result)
+                continue
+            
+            buckets = ShelfBuckets()
+            posting_numbers = set()
+            with PARSE_SECONDS.time(mode="all_warehouses"):
+                for posting in result:
+                    buckets.extend(OzonClient.parse_posting_products(posting, self.catalog))
+                    if posting.get("posting_number"):
+                        posting_numbers.add(posting["posting_number"])
+            fetched_by_warehouse[warehouse_name] = sorted(posting_numbers)
+            
+            products = buckets.pop_all()
+            if products:
+                products_by_warehouse[warehouse_name] = products
+                postings_by_warehouse[warehouse_name] = sorted(posting_numbers)
+        
+        total_products = sum(len(p) for p in products_by_warehouse.values())
+        
+        if products_by_warehouse:
+            # One batch write for all warehouses
+            progress(f"{total_products} товаров, запись в таблицу...")
+            success = await asyncio.to_thread(
+                self.sheets_manager.add_tasks_batch, products_by_warehouse
+            )
+            if not success:
+                await context.bot.send_message(
+                    chat_id=chat_id,
+                    text="❌ Ошибка при сохранении данных в таблицу.",
+                    reply_markup=self._all_warehouses_markup()
                 )
-                
-                # Fetch orders from Ozon API
-                await self._process_warehouse_orders(update, context, warehouse)
-                
-        except Exception as e:
-            logger.error(f"Error in navigation_callback: {e}", exc_info=True)
-            await query.edit_message_text(
-                "❌ Произошла ошибка. Попробуйте еще раз."
+                return
+            await asyncio.to_thread(
+                self.sheets_manager.log_processed_orders, postings_by_warehouse
             )
+        await asyncio.to_thread(self.sheets_manager.mark_stale_tasks, fetched_by_warehouse)
+        
+        # Send products grouped by warehouse, each group sorted by offer_id,
+        # checkpointed so a restart continues from the next message;
+        # Tasks keeps one row per posting even in aggregated mode
+        pick_lists = {
+            warehouse_name: prepare_pick_list(products)
+            for warehouse_name, products in products_by_warehouse.items()
+        }
+        items: List[Dict[str, Any]] = []
+        for warehouse_name, products in pick_lists.items():
+            items.append({"text": f"🏢 {warehouse_name}: {len(products)} товаров"})
+            items.extend({"warehouse": warehouse_name, "product": product} for product in products)
+        run = {
+            "items": items,
+            "postings": postings_by_warehouse,
+            "messages": job.messages if job else [],
+            "warehouses": [warehouse["warehouse_name"] for warehouse in warehouses],
+        }
+        await asyncio.to_thread(
+            self.state_store.save_run, chat_id, ALL_WAREHOUSES_JOB, "all_warehouses", run
+        )
+        messages_sent = await self._deliver_run(
+            context.bot, chat_id, ALL_WAREHOUSES_JOB, dict(run, cursor=0), job, progress
+        )
+        
+        # Summary per warehouse
+        lines = [f"✅ Обработка завершена: {len(warehouses)} складов\n"]
+        for warehouse in warehouses:
+            warehouse_name = warehouse["warehouse_name"]
+            if warehouse_name in errors:
+                lines.append(f"❌ {warehouse_name}: ошибка ({errors[warehouse_name]})")
+            elif warehouse_name in products_by_warehouse:
+                lines.append(
+                    f"📦 {warehouse_name}: отправлений "
+                    f"{len(postings_by_warehouse[warehouse_name])}, "
+                    f"товаров {len(pick_lists[warehouse_name])}"
+                )
+            else:
+                lines.append(f"ℹ️ {warehouse_name}: нет товаров")
+        lines.append(f"\n💬 Сообщений отправлено: {messages_sent}")
+        
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text="\n".join(lines),
+            reply_markup=self._all_warehouses_markup()
+        )
+        
+        logger.info(
+            f"Processed {len(warehouses)} warehouses for chat {chat_id}: "
+            f"{total_products} products, {len(errors)} failed"
+        )
+    
+    async def _deliver_run(
+        self,
+        bot: Bot,
+        chat_id: str,
+        name: str,
+        run: Dict[str, Any],
+        job: Optional[Job],
+        progress: Callable[[str], None]
+    ) -> int:
+        """
+        Send items of a checkpointed run from its cursor on.
+        
+        The cursor is saved after every item, so after a restart the run
+        continues with the first item not sent yet. Postings are marked
+        delivered and the checkpoint is dropped once all items are sent;
+        a run cancelled by the user is dropped as well (a cancelled poller
+        push marks its postings, so the poller does not push them again).
+        
+        Args:
+            bot: Telegram bot
+            chat_id: Telegram chat ID
+            name: Run name (warehouse name or ALL_WAREHOUSES_JOB)
+            run: Run saved with StateStore.save_run() plus its cursor
+            job: Job running the delivery, if any
+            progress: Progress callback
+        
+        Returns:
+            Number of product messages sent
+        """
+        items = run["items"]
+        total = sum(1 for item in items if "product" in item)
+        done = sum(1 for item in items[:run["cursor"]] if "product" in item)
+        messages_sent = 0
+        if job:
+            job.resumable = True
+        try:
+            for index in range(run["cursor"], len(items)):
+                item = items[index]
+                try:
+                    if "product" in item:
+                        done += 1
+                        progress(f"отправка товаров {done}/{total}")
+                        await self._send_product_message(bot, chat_id, item["product"], item["warehouse"])
+                        messages_sent += 1
+                    else:
+                        await bot.send_message(chat_id=chat_id, text=item["text"])
+                except (asyncio.CancelledError, JobCancelled):
+                    raise
+                except Exception as e:
+                    logger.error(f"Error sending product message: {e}", exc_info=True)
+                    MESSAGES_DROPPED.inc(reason=type(e).__name__)
+                    # Continue with next product even if one fails
+                await asyncio.to_thread(self.state_store.advance_run, chat_id, name, index + 1)
+        except (asyncio.CancelledError, JobCancelled):
+            if not (job and job.interrupted):
+                if run.get("kind") == "poller":
+                    for warehouse_name, posting_numbers in run["postings"].items():
+                        await asyncio.to_thread(self.state_store.mark_delivered, warehouse_name, posting_numbers)
+                await asyncio.to_thread(self.state_store.finish_run, chat_id, name)
+            raise
+        
+        # Background poller must not push these postings again
+        for warehouse_name, posting_numbers in run["postings"].items():
+            await asyncio.to_thread(self.state_store.mark_delivered, warehouse_name, posting_numbers)
+        await asyncio.to_thread(self.state_store.finish_run, chat_id, name)
+        return messages_sent
+    
+    async def _resume_delivery(
+        self,
+        bot: Bot,
+        chat_id: str,
+        name: str,
+        job: Optional[Job] = None
+    ) -> bool:
+        """
+        Continue a delivery interrupted by a restart, if there is one.
+        
+        Args:
+            bot: Telegram bot
+            chat_id: Telegram chat ID
+            name: Warehouse name or ALL_WAREHOUSES_JOB
+            job: Job running the delivery, if any
+        
+        Returns:
+            True if an interrupted delivery was found and continued
+        """
+        runs = await asyncio.to_thread(
+            self.state_store.load_runs, Config.RESUME_MAX_AGE_HOURS, chat_id, name
+        )
+        if not runs:
+            return False
+        run = runs[0]
+        total = sum(1 for item in run["items"] if "product" in item)
+        already_sent = sum(1 for item in run["items"][:run["cursor"]] if "product" in item)
+        logger.info(f"Resuming delivery of {name} for chat {chat_id} at item {run['cursor']}")
+        
+        def progress(text: str) -> None:
+            if job:
+                job.set_progress(f"⏳ {name}: {text}")
+        
+        messages_sent = await self._deliver_run(bot, chat_id, name, run, job, progress)
+        if name == ALL_WAREHOUSES_JOB:
+            reply_markup = self._all_warehouses_markup()
+        else:
+            reply_markup = self._navigation_markup(run.get("warehouse", name))
+        await bot.send_message(
+            chat_id=chat_id,
+            text=(
+                f"✅ Отправка продолжена после перезапуска: {name}\n\n"
+                f"🛍️ Товаров: {total}, уже было отправлено: {already_sent}\n"
+                f"💬 Сообщений отправлено: {messages_sent}"
+            ),
+            reply_markup=reply_markup
+        )
+        return True
     
     async def _send_product_message(
         self,
-        context: ContextTypes.DEFAULT_TYPE,
+        bot: Bot,
         chat_id: int,
         product: Dict[str, Any],
         warehouse_name: str
@@ -527,9 +786,19 @@ class OzonBot:
         sku = product.get("sku", "")
         quantity = product.get("quantity", 0)
         
+        # Aggregated lines list all postings (shortened to fit the caption)
+        posting_numbers = product.get("posting_numbers")
+        if posting_numbers and len(posting_numbers) > 1:
+            shown = ", ".join(posting_numbers[:MAX_POSTINGS_IN_MESSAGE])
+            if len(posting_numbers) > MAX_POSTINGS_IN_MESSAGE:
+                shown += f" и ещё {len(posting_numbers) - MAX_POSTINGS_IN_MESSAGE}"
+            posting_line = f"📦 <b>Отправления ({len(posting_numbers)}):</b> {shown}\n"
+        else:
+            posting_line = f"📦 <b>Номер отправления:</b> {posting_number}\n"
+        
         # Format detailed info
         details = (
-            f"📦 <b>Номер отправления:</b> {posting_number}\n"
+            posting_line +
             f"🏷️ <b>Offer ID:</b> {offer_id}\n"
             f"📋 <b>Наименование:</b> {product_name}\n"
             f"🔢 <b>Артикул:</b> {sku}\n"
@@ -537,33 +806,1331 @@ class OzonBot:
             f"🏢 <b>Склад:</b> {warehouse_name}"
         )
         
-        # Send photo with caption if available
+        # Send photo with caption if available, reusing the photo already
+        # uploaded to Telegram for this SKU instead of the Ozon URL
         if picture_url:
+            entry = self.catalog.get(sku) if sku else None
+            file_id = entry.file_id if entry is not None and entry.picture_url == picture_url else ""
+            if file_id:
+                try:
+                    await _timed_send("send_photo", bot.send_photo(
+                        chat_id=chat_id,
+                        photo=file_id,
+                        caption=details,
+                        parse_mode="HTML"
+                    ))
+                    return
+                except Exception as e:
+                    logger.warning(f"Could not send cached photo of SKU {sku}: {e}")
+                    self.catalog.clear_file_id(sku)
             try:
-                await context.bot.send_photo(
+                message = await _timed_send("send_photo", bot.send_photo(
                     chat_id=chat_id,
                     photo=picture_url,
                     caption=details,
                     parse_mode="HTML"
-                )
+                ))
+                if sku and message.photo:
+                    self.catalog.set_file_id(sku, message.photo[-1].file_id)
             except Exception as e:
                 logger.warning(f"Could not send photo from URL {picture_url}: {e}")
                 # Fallback to text only
-                await context.bot.send_message(
+                await _timed_send("send_message", bot.send_message(
                     chat_id=chat_id,
                     text=f"📷 [Фото недоступно]\n\n{details}",
                     parse_mode="HTML"
-                )
+                ))
         else:
             # Send text message if no photo
-            await context.bot.send_message(
+            await _timed_send("send_message", bot.send_message(
                 chat_id=chat_id,
                 text=details,
                 parse_mode="HTML"
+            ))
+    
+    def _navigation_markup(self, warehouse_name: str) -> InlineKeyboardMarkup:
+        """Build navigation menu shown after processing a warehouse."""
+        keyboard = [
+            [
+                InlineKeyboardButton(
+                    "🔄 Получить отправления",
+                    callback_data=make_callback_data("refresh_", warehouse_name)
+                )
+            ],
+            [
+                InlineKeyboardButton(
+                    "📄 Выгрузить файлом",
+                    callback_data=make_callback_data("exportfile_", warehouse_name)
+                )
+            ],
+        ]
+        if labels_available():
+            keyboard.append([
+                InlineKeyboardButton(
+                    "🏷️ Этикетки",
+                    callback_data=make_callback_data("labels_", warehouse_name)
+                )
+            ])
+        keyboard += [
+            [
+                InlineKeyboardButton(
+                    "⬅️ Назад к складам",
+                    callback_data="back_to_warehouses"
+                )
+            ]
+        ]
+        return InlineKeyboardMarkup(keyboard)
+    
+    def _all_warehouses_markup(self) -> InlineKeyboardMarkup:
+        """Build navigation menu shown after the aggregated run."""
+        keyboard = [
+            [
+                InlineKeyboardButton(
+                    "🔄 Получить отправления",
+                    callback_data="all_warehouses"
+                )
+            ],
+            [
+                InlineKeyboardButton(
+                    "⬅️ Назад к складам",
+                    callback_data="back_to_warehouses"
+                )
+            ]
+        ]
+        return InlineKeyboardMarkup(keyboard)
+
+
+class OzonBot(WarehouseJobs):
+    """Main bot class for handling Telegram interactions."""
+    
+    def __init__(self):
+        """
+        Initialize the bot with dependencies.
+        
+        Google Sheets is connected in the background after start, until then
+        the "Ozon"/"Access" data saved by the previous run is served.
+        """
+        self.started_at = time.monotonic()
+        builder = (
+            Application.builder()
+            .token(Config.TELEGRAM_BOT_TOKEN)
+            .post_init(self._post_init)
+            .post_stop(self._post_stop)
+        )
+        if Config.TELEGRAM_API_BASE_URL:
+            # Local Bot API stand-in instead of api.telegram.org
+            base_url = Config.TELEGRAM_API_BASE_URL.rstrip("/")
+            builder = builder.base_url(f"{base_url}/bot").base_file_url(f"{base_url}/file/bot")
+        self.application = builder.build()
+        super().__init__(self.application.bot)
+        self.label_store = LabelStore()
+        self.poller = PostingPoller(
+            self.sheets_manager,
+            self.state_store,
+            self._deliver_new_postings,
+            catalog=self.catalog
+        )
+        self.profiler = ProfileController()
+        self.loop_watchdog: Optional[LoopWatchdog] = None
+        if Config.LOOP_BLOCK_THRESHOLD > 0:
+            self.loop_watchdog = LoopWatchdog(Config.LOOP_BLOCK_THRESHOLD)
+        # With worker processes warehouse jobs are only queued here
+        self.worker_pool: Optional[WorkerPool] = None
+        if Config.WORKER_PROCESSES > 0:
+            self.work_queue = WorkQueue()
+            self.worker_pool = WorkerPool(self.work_queue)
+        self._env_mtime = Config.env_mtime()
+        self.sheets_manager.config_listeners.append(self._on_sheet_config_changed)
+        self._setup_handlers()
+        self._setup_jobs()
+    
+    def _setup_handlers(self) -> None:
+        """Set up command and callback handlers."""
+        self.application.add_handler(CommandHandler("start", _traced(self.start_command)))
+        self.application.add_handler(CommandHandler("check_orders", _traced(self.check_orders_command)))
+        self.application.add_handler(CommandHandler("profile", _traced(self.profile_command)))
+        self.application.add_handler(CommandHandler("stats", _traced(self.stats_command)))
+        self.application.add_handler(CommandHandler("reload", _traced(self.reload_command)))
+        self.application.add_handler(CallbackQueryHandler(_traced(self.warehouse_callback), pattern="^warehouse_"))
+        self.application.add_handler(CallbackQueryHandler(_traced(self.navigation_callback), pattern="^(refresh_|back_to_warehouses)"))
+        self.application.add_handler(CallbackQueryHandler(_traced(self.export_callback), pattern="^export(file|fmt)_"))
+        self.application.add_handler(CallbackQueryHandler(_traced(self.labels_callback), pattern="^labels_"))
+        self.application.add_handler(CallbackQueryHandler(_traced(self.cancel_callback), pattern="^cancel_"))
+        self.application.add_handler(CallbackQueryHandler(_traced(self.all_warehouses_callback), pattern="^all_warehouses$"))
+    
+    def _setup_jobs(self) -> None:
+        """Schedule periodic background jobs."""
+        self._schedule_polling(first=10)
+        self.application.job_queue.run_repeating(
+            self._flush_catalog,
+            interval=CATALOG_FLUSH_INTERVAL,
+            first=CATALOG_FLUSH_INTERVAL,
+            name="flush_catalog"
+        )
+        self.application.job_queue.run_repeating(
+            self._prune_delivered,
+            interval=DELIVERED_PRUNE_INTERVAL,
+            first=30,
+            name="prune_delivered"
+        )
+        self._schedule_sheets_refresh()
+        self._schedule_config_watch()
+        if self.worker_pool:
+            self.application.job_queue.run_repeating(
+                self._check_workers,
+                interval=WORKER_CHECK_INTERVAL,
+                first=WORKER_CHECK_INTERVAL,
+                name="check_workers"
+            )
+    
+    def _replace_job(self, name: str) -> None:
+        """Remove scheduled jobs of that name before scheduling them anew."""
+        for job in self.application.job_queue.get_jobs_by_name(name):
+            job.schedule_removal()
+    
+    def _schedule_polling(self, first: Optional[float] = None) -> None:
+        """(Re)schedule warehouse polling with the current interval."""
+        self._replace_job("poll_warehouses")
+        if self.poller.enabled:
+            self.application.job_queue.run_repeating(
+                self.poller.poll,
+                interval=self.poller.interval,
+                first=first if first is not None else self.poller.interval,
+                name="poll_warehouses"
+            )
+            logger.info(f"Scheduled warehouse polling every {self.poller.interval}s")
+    
+    def _schedule_sheets_refresh(self) -> None:
+        """(Re)schedule background refresh of the "Ozon"/"Access" sheets."""
+        self._replace_job("refresh_sheets_config")
+        if Config.SHEETS_CONFIG_TTL_SECONDS > 0:
+            # Refresh before the cached sheet data expires, so taps never wait for it
+            interval = max(1, Config.SHEETS_CONFIG_TTL_SECONDS / 2)
+            self.application.job_queue.run_repeating(
+                self._refresh_sheets_config,
+                interval=interval,
+                first=interval,
+                name="refresh_sheets_config"
+            )
+    
+    def _schedule_config_watch(self) -> None:
+        """(Re)schedule checking .env for changes."""
+        self._replace_job("watch_config")
+        if Config.CONFIG_WATCH_INTERVAL > 0:
+            self.application.job_queue.run_repeating(
+                self._watch_config,
+                interval=Config.CONFIG_WATCH_INTERVAL,
+                first=Config.CONFIG_WATCH_INTERVAL,
+                name="watch_config"
+            )
+    
+    async def _flush_catalog(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """JobQueue callback: persist new product catalog entries."""
+        await asyncio.to_thread(self.catalog.flush)
+    
+    async def _prune_delivered(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """JobQueue callback: forget postings delivered more than DELIVERED_RETENTION_DAYS ago."""
+        pruned = await asyncio.to_thread(
+            self.state_store.prune_delivered, Config.DELIVERED_RETENTION_DAYS
+        )
+        if pruned:
+            logger.info(f"Forgot {pruned} postings delivered over {Config.DELIVERED_RETENTION_DAYS:g} days ago")
+    
+    async def _refresh_sheets_config(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """JobQueue callback: re-read "Ozon"/"Access" sheets in background."""
+        if not self.sheets_manager.connected:
+            return
+        try:
+            await asyncio.to_thread(self.sheets_manager.refresh_config)
+        except Exception as e:
+            logger.warning(f"Background Sheets refresh failed: {e}")
+    
+    async def _watch_config(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """JobQueue callback: reload settings once .env was modified."""
+        mtime = Config.env_mtime()
+        if mtime == self._env_mtime:
+            return
+        self._env_mtime = mtime
+        try:
+            changes = await asyncio.to_thread(Config.reload)
+        except Exception as e:
+            # Keep running with the previous settings, e.g. on a half-written .env
+            logger.error(f"Reloading configuration failed: {e}", exc_info=True)
+            return
+        self._apply_config_changes(changes)
+    
+    def _apply_config_changes(self, changes: Dict[str, Any]) -> None:
+        """
+        Push reloaded settings into long-lived objects.
+        
+        Most settings are read on every use and need nothing here; the
+        ones listed in RESTART_REQUIRED_SETTINGS only take effect after
+        a restart.
+        
+        Args:
+            changes: Changed setting name -> (old, new) value, see Config.reload()
+        """
+        names = set(changes)
+        if not names:
+            return
+        if names & LOG_SETTINGS:
+            setup_logging(Config.LOG_LEVEL, Config.LOG_FILE)
+        elif "LOG_LEVEL" in names:
+            logging.getLogger().setLevel(getattr(logging, Config.LOG_LEVEL.upper(), logging.INFO))
+        if names & {"TRACE_FILE", "TRACE_OTLP_ENDPOINT"}:
+            configure_tracing()
+        if names & LIMIT_SETTINGS:
+            reconfigure_limits()
+        if "OZON_API_BASE_URL" in names:
+            invalidate_clients()
+        if any(name.startswith("OFFER_ID_") for name in names):
+            # The catalog rekeys its entries for the new engine by itself
+            reset_default_engine()
+        if "JOB_PROGRESS_INTERVAL" in names:
+            self.job_manager.progress_interval = Config.JOB_PROGRESS_INTERVAL
+        if "LABELS_CONCURRENCY" in names:
+            self.label_store.concurrency = max(1, Config.LABELS_CONCURRENCY)
+        if names & {"POLL_INTERVAL_SECONDS", "POLL_CACHE_TTL_SECONDS"}:
+            self.poller.apply_config()
+            self._schedule_polling()
+        if "SHEETS_CONFIG_TTL_SECONDS" in names:
+            self._schedule_sheets_refresh()
+        if "CONFIG_WATCH_INTERVAL" in names:
+            self._schedule_config_watch()
+        restart = sorted(names & RESTART_REQUIRED_SETTINGS)
+        if restart:
+            logger.warning(f"Changed settings take effect after restart: {', '.join(restart)}")
+    
+    def _on_sheet_config_changed(self, name: str, old: Any, new: Any) -> None:
+        """
+        React to a changed "Ozon" sheet (called from the refreshing thread).
+        
+        Cached postings of changed warehouses are dropped and Ozon clients
+        of credentials no longer listed are closed, so rotated API keys
+        are used from the next request on.
+        """
+        if name != "Ozon":
+            return
+        old_by_name = {w["warehouse_name"]: w for w in old}
+        new_by_name = {w["warehouse_name"]: w for w in new}
+        added = sorted(set(new_by_name) - set(old_by_name))
+        removed = sorted(set(old_by_name) - set(new_by_name))
+        changed = sorted(
+            warehouse_name for warehouse_name in set(old_by_name) & set(new_by_name)
+            if old_by_name[warehouse_name] != new_by_name[warehouse_name]
+        )
+        for warehouse_name in removed + changed:
+            self.poller.forget(warehouse_name)
+        closed = invalidate_clients(keep=[(w["client_id"], w["api_key"]) for w in new])
+        logger.info(
+            f"Warehouse registry changed: added {added or '-'}, removed {removed or '-'}, "
+            f"changed {changed or '-'}; closed {closed} Ozon clients"
+        )
+    
+    async def _check_workers(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """JobQueue callback: replace dead workers, take their metrics and report jobs given up."""
+        await self._collect_worker_metrics()
+        given_up = await asyncio.to_thread(self.worker_pool.check)
+        counts = await asyncio.to_thread(self.work_queue.counts)
+        QUEUE_DEPTH.set(counts.get(QUEUED, 0), queue="work")
+        for queued in given_up:
+            try:
+                await context.bot.send_message(
+                    chat_id=queued.chat_id,
+                    text=(
+                        f"❌ Ошибка: {queued.name}\n\n"
+                        "Обработка прервалась из-за сбоя обработчика. Попробуйте еще раз."
+                    )
+                )
+            except Exception as e:
+                logger.warning(f"Could not report failed job {queued.job_id}: {e}")
+    
+    async def _collect_worker_metrics(self) -> None:
+        """Add metrics recorded by worker processes to this process's registry."""
+        try:
+            deltas = await asyncio.to_thread(self.work_queue.collect_metrics)
+        except Exception as e:
+            logger.warning(f"Could not collect worker metrics: {e}")
+            return
+        for delta in deltas:
+            REGISTRY.apply_delta(delta)
+    
+    async def _post_init(self, application: Application) -> None:
+        """Connect to Google Sheets in background while the bot starts serving."""
+        application.create_task(self._connect_sheets())
+        if self.worker_pool:
+            await asyncio.to_thread(self.worker_pool.start)
+        application.create_task(self._resume_runs())
+        if self.loop_watchdog:
+            self.loop_watchdog.start()
+    
+    async def _connect_sheets(self) -> None:
+        """Connect Sheets client and refresh the warm-start data."""
+        try:
+            await asyncio.to_thread(self.sheets_manager.connect)
+            await asyncio.to_thread(self.sheets_manager.refresh_config)
+            logger.info("Google Sheets connected, warehouse config refreshed")
+        except Exception as e:
+            # Requests will retry the connection on first use
+            logger.error(f"Background Sheets connection failed: {e}", exc_info=True)
+    
+    async def _post_stop(self, application: Application) -> None:
+        """Cancel background jobs when the application stops."""
+        await self.job_manager.shutdown(Config.SHUTDOWN_DRAIN_SECONDS)
+        if self.worker_pool:
+            await asyncio.to_thread(self.worker_pool.stop)
+        if self.loop_watchdog:
+            self.loop_watchdog.stop()
+        self.profiler.stop()
+        await asyncio.to_thread(self.catalog.close)
+        await asyncio.to_thread(shutdown_tracing)
+    
+    async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle /start command - show warehouse selection menu."""
+        chat_id = str(update.effective_chat.id)
+        
+        try:
+            # Get available warehouses
+            warehouses = self.sheets_manager.get_warehouses()
+            
+            if not warehouses:
+                await update.message.reply_text(
+                    "❌ Не найдено доступных складов. Проверьте настройки."
+                )
+                return
+            
+            # Filter warehouses by user access (supports multiple users per warehouse)
+            warehouse_access = self.sheets_manager.get_warehouse_chat_ids()
+            available_warehouses = [
+                w for w in warehouses
+                if str(chat_id).strip() in warehouse_access.get(w["warehouse_name"], [])
+            ]
+            
+            if not available_warehouses:
+                await update.message.reply_text(
+                    "❌ У вас нет доступа ни к одному складу. "
+                    "Обратитесь к администратору."
+                )
+                logger.warning(f"User {chat_id} has no warehouse access")
+                return
+            
+            # Show warehouse selection menu
+            await self._show_warehouse_menu(update, available_warehouses)
+            logger.info(f"User {chat_id} started the bot")
+            
+        except Exception as e:
+            logger.error(f"Error in start_command: {e}", exc_info=True)
+            await update.message.reply_text(
+                "❌ Произошла ошибка при получении списка складов."
+            )
+    
+    def _callback_warehouse(self, value: str) -> str:
+        """Warehouse name from callback_data built by make_callback_data()."""
+        return resolve_callback_name(
+            value, [warehouse["warehouse_name"] for warehouse in self.sheets_manager.get_warehouses()]
+        )
+    
+    @staticmethod
+    def _is_admin(chat_id: str) -> bool:
+        """Check if chat may use admin commands."""
+        return chat_id in Config.ADMIN_CHAT_IDS
+    
+    async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle /stats admin command - show operational counters."""
+        chat_id = str(update.effective_chat.id)
+        if not self._is_admin(chat_id):
+            await update.message.reply_text("❌ Команда доступна только администраторам.")
+            return
+        if self.work_queue is not None:
+            await self._collect_worker_metrics()
+        await update.message.reply_text(self._format_stats())
+    
+    async def reload_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle /reload admin command - re-read .env, the warehouse sheets and Tasks rows now."""
+        chat_id = str(update.effective_chat.id)
+        if not self._is_admin(chat_id):
+            await update.message.reply_text("❌ Команда доступна только администраторам.")
+            return
+        
+        try:
+            self._env_mtime = Config.env_mtime()
+            changes = await asyncio.to_thread(Config.reload)
+            self._apply_config_changes(changes)
+            if self.sheets_manager.connected:
+                await asyncio.to_thread(self.sheets_manager.refresh_config)
+            # Tasks rows may have been edited by hand
+            self.sheets_manager.reload_task_index()
+        except Exception as e:
+            logger.error(f"Error in reload_command: {e}", exc_info=True)
+            await update.message.reply_text("❌ Не удалось перечитать настройки.")
+            return
+        
+        lines = ["🔄 Настройки перечитаны."]
+        if changes:
+            lines.append(f"Изменены: {', '.join(sorted(changes))}")
+            restart = sorted(set(changes) & RESTART_REQUIRED_SETTINGS)
+            if restart:
+                lines.append(f"Требуют перезапуска: {', '.join(restart)}")
+        else:
+            lines.append("Изменений в .env нет.")
+        await update.message.reply_text("\n".join(lines))
+    
+    def _format_stats(self) -> str:
+        """Build /stats text from in-process metrics."""
+        uptime = int(time.monotonic() - self.started_at)
+        lines = [
+            "📊 Статистика",
+            f"Время работы: {uptime // 86400} д {uptime % 86400 // 3600} ч {uptime % 3600 // 60} мин",
+        ]
+        
+        jobs = self.job_manager.active_jobs()
+        lines.append(f"Активные задачи: {len(jobs)}")
+        jobs_by_warehouse: Dict[str, int] = {}
+        for job in jobs:
+            jobs_by_warehouse[job.warehouse_name] = jobs_by_warehouse.get(job.warehouse_name, 0) + 1
+        for warehouse_name, count in sorted(jobs_by_warehouse.items()):
+            lines.append(f"  • {warehouse_name}: {count}")
+        
+        window = Config.STATS_WINDOW_SECONDS
+        lines.append(f"\nЗадержки за {window // 60} мин (p50 / p95, вызовов):")
+        for title, histogram in (
+            ("Ozon", OZON_REQUEST_SECONDS),
+            ("Sheets", SHEETS_CALL_SECONDS),
+            ("Telegram", TELEGRAM_SEND_SECONDS),
+        ):
+            count, values = histogram.percentiles(window)
+            if count:
+                lines.append(f"  {title}: {values[0]:.2f} / {values[1]:.2f} с ({count})")
+            else:
+                lines.append(f"  {title}: нет вызовов")
+        
+        caches: Dict[str, Dict[str, float]] = {}
+        for labels, value in CACHE_REQUESTS.items():
+            caches.setdefault(labels["cache"], {})[labels["result"]] = value
+        if caches:
+            lines.append("\nКэши (попадания):")
+            for cache, results in sorted(caches.items()):
+                hits = int(results.get("hit", 0))
+                total = hits + int(results.get("miss", 0))
+                rate = hits * 100 / total if total else 0
+                lines.append(f"  {cache}: {rate:.0f}% ({hits}/{total})")
+        
+        queues = [f"{labels['queue']} {value:g}" for labels, value in QUEUE_DEPTH.items()]
+        lines.append(f"\nОчереди: {', '.join(queues) if queues else 'пусто'}")
+        if self.worker_pool:
+            counts = self.work_queue.counts()
+            lines.append(
+                f"Воркеры: {self.worker_pool.alive()}/{self.worker_pool.size}, "
+                f"перезапусков {self.worker_pool.restarts}, "
+                f"в очереди {counts.get(QUEUED, 0)}, выполняется {counts.get(RUNNING, 0)}"
+            )
+        
+        states = client_states()
+        if states:
+            lines.append("\nOzon Client-Id:")
+            for client_id, state in states.items():
+                line = f"  {client_id}: circuit {state['circuit']}"
+                if state["failures"]:
+                    line += f", ошибок подряд {state['failures']}"
+                if state["retry_in"]:
+                    line += f", повтор через {state['retry_in']:.0f} с"
+                if state["rate"]:
+                    line += f", лимит {state['tokens']:.1f}/{state['burst']} ({state['rate']:g} rps)"
+                lines.append(line)
+        
+        lines.append(f"\nСообщений не отправлено: {sum(value for _, value in MESSAGES_DROPPED.items()):g}")
+        lines.append(f"Telegram 429: {TELEGRAM_RATE_LIMITED.get():g}")
+        lines.append(f"Профилирование: {self.profiler.describe()}")
+        return "\n".join(lines)
+    
+    async def profile_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """
+        Handle /profile admin command.
+        
+        /profile runs N [sampling|cprofile] - profile the next N warehouse runs
+        /profile seconds T [sampling|cprofile] - profile for T seconds
+        /profile stop - finish the running session now
+        /profile watchdog [S|off] - report handlers blocking the loop > S seconds
+        """
+        chat_id = str(update.effective_chat.id)
+        if not self._is_admin(chat_id):
+            await update.message.reply_text("❌ Команда доступна только администраторам.")
+            return
+        
+        args = [arg.lower() for arg in (context.args or [])]
+        action = args[0] if args else ""
+        
+        if action == "runs" and self.work_queue is not None:
+            # Runs of worker processes never reach this process's profiler
+            await update.message.reply_text(
+                "❌ Запуски складов выполняются в процессах-обработчиках (WORKER_PROCESSES), "
+                "/profile runs их не учитывает. Используйте /profile seconds T для процесса бота."
+            )
+            return
+        
+        if action in ("runs", "seconds", "stop"):
+            # Timer of a previous session must not end the new one
+            for job in context.job_queue.get_jobs_by_name("profile"):
+                job.schedule_removal()
+        
+        if action in ("runs", "seconds"):
+            try:
+                amount = float(args[1])
+                mode = args[2] if len(args) > 2 else "sampling"
+                if action == "runs":
+                    self.profiler.start(mode, chat_id, runs=int(amount))
+                else:
+                    self.profiler.start(mode, chat_id, seconds=amount)
+                    context.job_queue.run_once(self._finish_profile, when=amount, name="profile")
+            except (IndexError, ValueError) as e:
+                await update.message.reply_text(f"❌ Не удалось запустить профилирование: {e}")
+                return
+            await update.message.reply_text(f"⏱ {self.profiler.describe()}")
+        elif action == "stop":
+            report = self.profiler.stop()
+            if report:
+                await self._send_profile_report(report)
+            else:
+                await update.message.reply_text("ℹ️ Профилирование не запущено.")
+        elif action == "watchdog":
+            await update.message.reply_text(self._configure_watchdog(args[1] if len(args) > 1 else ""))
+        else:
+            await update.message.reply_text(
+                f"ℹ️ Сейчас: {self.profiler.describe()}\n\n"
+                f"/profile runs N [{'|'.join(PROFILE_MODES)}] - следующие N запусков\n"
+                f"/profile seconds T [{'|'.join(PROFILE_MODES)}] - T секунд\n"
+                "/profile stop - завершить сейчас\n"
+                "/profile watchdog [S|off] - блокировки цикла событий дольше S секунд"
             )
     
-    def run(self) -> None:
-        """Start the bot."""
-        logger.info("Starting Telegram bot...")
-        self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+    def _configure_watchdog(self, value: str) -> str:
+        """Show, start or stop the event loop watchdog, returns reply text."""
+        if value == "off":
+            if self.loop_watchdog:
+                self.loop_watchdog.stop()
+                self.loop_watchdog = None
+            return "✅ Контроль блокировок выключен."
+        if value:
+            try:
+                threshold = float(value)
+            except ValueError:
+                return f"❌ Неверный порог: {value}"
+            if threshold <= 0:
+                return f"❌ Неверный порог: {value}"
+            if self.loop_watchdog:
+                self.loop_watchdog.stop()
+            self.loop_watchdog = LoopWatchdog(threshold)
+            self.loop_watchdog.start()
+            return f"✅ Контроль блокировок: порог {threshold:g} с."
+        if not self.loop_watchdog:
+            return "ℹ️ Контроль блокировок выключен."
+        text = (
+            f"ℹ️ Порог {self.loop_watchdog.threshold:g} с, "
+            f"блокировок: {self.loop_watchdog.blocked_count}"
+        )
+        if self.loop_watchdog.reports:
+            text += "\n\nПоследняя:\n" + self.loop_watchdog.reports[-1][-MAX_PROFILE_SUMMARY:]
+        return text
+    
+    async def _profiled(self, run: Awaitable[None]) -> None:
+        """Await warehouse run and count it for the running profile session."""
+        try:
+            await run
+        finally:
+            report = self.profiler.run_finished()
+            if report:
+                await self._send_profile_report(report)
+    
+    async def _finish_profile(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """JobQueue callback: end time-limited profile session."""
+        if self.profiler.deadline and not self.profiler.runs_left:
+            report = self.profiler.stop()
+            if report:
+                await self._send_profile_report(report)
+    
+    async def _send_profile_report(self, report: ProfileReport) -> None:
+        """Send profile summary to the admin who started the session."""
+        summary = report.summary
+        if len(summary) > MAX_PROFILE_SUMMARY:
+            summary = summary[:MAX_PROFILE_SUMMARY] + "\n..."
+        files = "\n".join(str(path) for path in report.paths)
+        try:
+            await self.application.bot.send_message(
+                chat_id=report.chat_id,
+                text=f"<pre>{html.escape(summary)}</pre>\n{html.escape(files)}",
+                parse_mode="HTML"
+            )
+        except Exception as e:
+            logger.error(f"Error sending profile report: {e}")
+    
+    async def _show_warehouse_menu(
+        self,
+        update: Update,
+        warehouses: list,
+        message_text: str = "Выберите склад для получения отправлений:"
+    ) -> None:
+        """Show warehouse selection menu with inline keyboard."""
+        keyboard = []
+        for warehouse in warehouses:
+            warehouse_name = warehouse["warehouse_name"]
+            city = warehouse.get("city", "")
+            button_text = f"{warehouse_name}"
+            if city:
+                button_text = f"{city} - {warehouse_name}"
+            
+            keyboard.append([
+                InlineKeyboardButton(
+                    button_text,
+                    callback_data=make_callback_data("warehouse_", warehouse_name)
+                )
+            ])
+        
+        if len(warehouses) > 1:
+            keyboard.append([
+                InlineKeyboardButton(
+                    "📦 Все мои склады",
+                    callback_data="all_warehouses"
+                )
+            ])
+        
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        if update.message:
+            await update.message.reply_text(
+                message_text,
+                reply_markup=reply_markup
+            )
+        elif update.callback_query:
+            await update.callback_query.edit_message_text(
+                message_text,
+                reply_markup=reply_markup
+            )
+    
+    async def check_orders_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle /check_orders command - show warehouse selection."""
+        chat_id = str(update.effective_chat.id)
+        
+        try:
+            # Get available warehouses
+            warehouses = self.sheets_manager.get_warehouses()
+            
+            if not warehouses:
+                await update.message.reply_text(
+                    "❌ Не найдено доступных складов. Проверьте настройки."
+                )
+                return
+            
+            # Filter warehouses by user access (supports multiple users per warehouse)
+            warehouse_access = self.sheets_manager.get_warehouse_chat_ids()
+            available_warehouses = [
+                w for w in warehouses
+                if str(chat_id).strip() in warehouse_access.get(w["warehouse_name"], [])
+            ]
+            
+            if not available_warehouses:
+                await update.message.reply_text(
+                    "❌ У вас нет доступа ни к одному складу. "
+                    "Обратитесь к администратору."
+                )
+                logger.warning(f"User {chat_id} has no warehouse access")
+                return
+            
+            # Show warehouse selection menu using common function
+            await self._show_warehouse_menu(update, available_warehouses)
+            logger.info(f"User {chat_id} requested warehouse selection")
+            
+        except Exception as e:
+            logger.error(f"Error in check_orders_command: {e}", exc_info=True)
+            await update.message.reply_text(
+                "❌ Произошла ошибка при получении списка складов."
+            )
+    
+    async def warehouse_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle warehouse selection callback."""
+        query = update.callback_query
+        await query.answer()
+        
+        chat_id = str(update.effective_chat.id)
+        warehouse_name = self._callback_warehouse(query.data.replace("warehouse_", "", 1))
+        
+        try:
+            # Verify user has access to this warehouse
+            if not self.sheets_manager.check_user_access(chat_id, warehouse_name):
+                await query.edit_message_text(
+                    "❌ У вас нет доступа к этому складу."
+                )
+                return
+            
+            # Get warehouse details
+            warehouses = self.sheets_manager.get_warehouses()
+            warehouse = next(
+                (w for w in warehouses if w["warehouse_name"] == warehouse_name),
+                None
+            )
+            
+            if not warehouse:
+                await query.edit_message_text(
+                    "❌ Склад не найден."
+                )
+                return
+            
+            # Notify user that fetching has started
+            await query.edit_message_text(
+                f"⏳ Загружаю отправления для склада: {warehouse_name}..."
+            )
+            
+            # Fetch orders from Ozon API in background, duplicate taps join
+            await self._start_warehouse_job(query, context, chat_id, warehouse)
+            
+        except Exception as e:
+            logger.error(f"Error in warehouse_callback: {e}", exc_info=True)
+            await query.edit_message_text(
+                f"❌ Произошла ошибка при обработке склада {warehouse_name}."
+            )
+    
+    async def _start_warehouse_job(
+        self,
+        query,
+        context: ContextTypes.DEFAULT_TYPE,
+        chat_id: str,
+        warehouse: Dict[str, str]
+    ) -> bool:
+        """
+        Start background processing for warehouse or join the running job.
+        
+        The callback message is used as progress message and edited in place.
+        With worker processes the job is queued for them instead.
+        
+        Returns:
+            True if a new job was started, False if joined the running one
+        """
+        message = None
+        if query.message:
+            message = (str(query.message.chat_id), query.message.message_id)
+        
+        if self.work_queue is not None:
+            return await self._enqueue_job("warehouse", chat_id, warehouse["warehouse_name"], message)
+        
+        _, created = self.job_manager.start(
+            chat_id,
+            warehouse["warehouse_name"],
+            message,
+            lambda job: self._profiled(
+                self._process_warehouse_orders(context, chat_id, warehouse, job)
+            )
+        )
+        return created
+    
+    async def _enqueue_job(
+        self,
+        kind: str,
+        chat_id: str,
+        name: str,
+        message: Optional[Tuple[str, int]],
+        **payload: Any
+    ) -> bool:
+        """
+        Queue job for the worker processes.
+        
+        Args:
+            kind: "warehouse" or "all_warehouses", see run_queued_job()
+            chat_id: Telegram chat ID
+            name: Warehouse name or ALL_WAREHOUSES_JOB
+            message: Progress message (chat_id, message_id) edited by the worker
+            **payload: Extra job arguments
+        
+        Returns:
+            True if queued, False if the chat already has an active job for it
+        """
+        job_id = await asyncio.to_thread(
+            self.work_queue.enqueue, kind, chat_id, name, dict(payload, message=message)
+        )
+        if job_id is None:
+            logger.info(f"Job for {name} (chat {chat_id}) is already queued")
+            if message:
+                await self.application.bot.edit_message_text(
+                    text=f"ℹ️ Обработка уже выполняется: {name}",
+                    chat_id=message[0],
+                    message_id=message[1]
+                )
+            return False
+        logger.info(f"Queued job {job_id} for {name} (chat {chat_id})")
+        return True
+    
+    async def all_warehouses_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle "all my warehouses" callback - aggregated run over all accessible warehouses."""
+        query = update.callback_query
+        await query.answer()
+        
+        chat_id = str(update.effective_chat.id)
+        
+        try:
+            warehouses = self.sheets_manager.get_warehouses()
+            warehouse_access = self.sheets_manager.get_warehouse_chat_ids()
+            available_warehouses = [
+                w for w in warehouses
+                if chat_id in warehouse_access.get(w["warehouse_name"], [])
+            ]
+            
+            if not available_warehouses:
+                await query.edit_message_text(
+                    "❌ У вас нет доступа ни к одному складу."
+                )
+                return
+            
+            await query.edit_message_text(
+                f"⏳ Загружаю отправления для {len(available_warehouses)} складов..."
+            )
+            
+            message = None
+            if query.message:
+                message = (str(query.message.chat_id), query.message.message_id)
+            if self.work_queue is not None:
+                await self._enqueue_job(
+                    "all_warehouses",
+                    chat_id,
+                    ALL_WAREHOUSES_JOB,
+                    message,
+                    warehouses=[w["warehouse_name"] for w in available_warehouses]
+                )
+                return
+            self.job_manager.start(
+                chat_id,
+                ALL_WAREHOUSES_JOB,
+                message,
+                lambda job: self._profiled(
+                    self._process_all_warehouses(context, chat_id, available_warehouses, job)
+                )
+            )
+            
+        except Exception as e:
+            logger.error(f"Error in all_warehouses_callback: {e}", exc_info=True)
+            await query.edit_message_text(
+                "❌ Произошла ошибка. Попробуйте еще раз."
+            )
+    
+    async def _resume_runs(self) -> None:
+        """Restart deliveries interrupted by the previous shutdown."""
+        try:
+            runs = await asyncio.to_thread(self.state_store.load_runs, Config.RESUME_MAX_AGE_HOURS)
+        except Exception as e:
+            logger.error(f"Could not load interrupted deliveries: {e}", exc_info=True)
+            return
+        for run in runs:
+            chat_id, name = run["chat_id"], run["name"]
+            message = tuple(run["messages"][0]) if run["messages"] else None
+            if self.work_queue is not None and run["kind"] != "poller":
+                # A job requeued after the restart resumes the run itself
+                payload = {"message": message}
+                if run["kind"] == "all_warehouses":
+                    payload["warehouses"] = run["warehouses"]
+                await asyncio.to_thread(self.work_queue.enqueue, run["kind"], chat_id, name, payload)
+            else:
+                self.job_manager.start(
+                    chat_id,
+                    name,
+                    message,
+                    lambda job, chat_id=chat_id, name=name: self._resume_delivery(
+                        self.application.bot, chat_id, name, job
+                    )
+                )
+        if runs:
+            logger.info(f"Resuming {len(runs)} interrupted deliveries")
+    
+    async def _deliver_new_postings(
+        self,
+        warehouse_name: str,
+        chat_ids: List[str],
+        products: List[Dict[str, Any]],
+        posting_numbers: List[str]
+    ) -> None:
+        """
+        Save and push new postings found by the background poller.
+        
+        Every chat gets its own checkpointed run sent by a job, so a
+        shutdown drains it and a restart continues it like the runs
+        started by a tap.
+        """
+        success = await asyncio.to_thread(
+            self.sheets_manager.add_to_tasks, products, warehouse_name
+        )
+        products = prepare_pick_list(products)
+        if success:
+            await asyncio.to_thread(
+                self.sheets_manager.log_processed_orders,
+                {warehouse_name: posting_numbers}
+            )
+        
+        # Own name per push, a previous push may still be running
+        name = f"{NEW_POSTINGS_JOB} {warehouse_name} {datetime.now().strftime('%H:%M:%S')}"
+        header = (
+            f"🆕 Новые отправления для склада: {warehouse_name}\n\n"
+            f"📦 Отправлений: {len(posting_numbers)}\n"
+            f"🛍️ Товаров: {len(products)}"
+        )
+        run = {
+            "items": [{"text": header}] + [
+                {"warehouse": warehouse_name, "product": product} for product in products
+            ],
+            "postings": {warehouse_name: posting_numbers},
+            "messages": [],
+            "warehouse": warehouse_name,
+        }
+        # Until the runs are sent the poller skips their postings
+        for chat_id in chat_ids:
+            await asyncio.to_thread(self.state_store.save_run, chat_id, name, "poller", run)
+        
+        for chat_id in chat_ids:
+            self.job_manager.start(
+                chat_id,
+                name,
+                None,
+                lambda job, chat_id=chat_id: self._push_new_postings(chat_id, name, run, job)
+            )
+    
+    async def _push_new_postings(self, chat_id: str, name: str, run: Dict[str, Any], job: Job) -> None:
+        """Job sending a checkpointed poller run to one chat."""
+        warehouse_name = run["warehouse"]
+        await self._deliver_run(
+            self.bot, chat_id, name, dict(run, cursor=0, kind="poller"), job,
+            lambda text: job.set_progress(f"⏳ {name}: {text}")
+        )
+        await self.bot.send_message(
+            chat_id=chat_id,
+            text=f"✅ Новые отправления отправлены: {warehouse_name}",
+            reply_markup=self._navigation_markup(warehouse_name)
+        )
+    
+    async def cancel_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle cancellation of a running warehouse job."""
+        query = update.callback_query
+        await query.answer()
+        
+        chat_id = str(update.effective_chat.id)
+        # Jobs of this process, or warehouse jobs queued for workers
+        warehouse_name = resolve_callback_name(
+            query.data.replace("cancel_", "", 1),
+            [job.warehouse_name for job in self.job_manager.active_jobs() if job.chat_id == chat_id]
+            + [ALL_WAREHOUSES_JOB]
+            + [warehouse["warehouse_name"] for warehouse in self.sheets_manager.get_warehouses()]
+        )
+        
+        cancelled = self.job_manager.cancel(chat_id, warehouse_name)
+        if not cancelled and self.work_queue is not None:
+            cancelled = await asyncio.to_thread(self.work_queue.request_cancel, chat_id, warehouse_name)
+        if not cancelled:
+            await query.edit_message_text(
+                f"ℹ️ Нет активной обработки для склада {warehouse_name}.",
+                reply_markup=self._navigation_markup(warehouse_name)
+            )
+    
+    async def navigation_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle navigation callbacks (refresh warehouse or back to warehouses)."""
+        query = update.callback_query
+        await query.answer()
+        
+        chat_id = str(update.effective_chat.id)
+        callback_data = query.data
+        
+        try:
+            if callback_data == "back_to_warehouses":
+                # Show warehouse selection menu
+                warehouses = self.sheets_manager.get_warehouses()
+                warehouse_access = self.sheets_manager.get_warehouse_chat_ids()
+                available_warehouses = [
+                    w for w in warehouses
+                    if str(chat_id).strip() in warehouse_access.get(w["warehouse_name"], [])
+                ]
+                
+                if available_warehouses:
+                    await self._show_warehouse_menu(
+                        update,
+                        available_warehouses,
+                        "Выберите склад для получения отправлений:"
+                    )
+                else:
+                    await query.edit_message_text(
+                        "❌ У вас нет доступа ни к одному складу."
+                    )
+                    
+            elif callback_data.startswith("refresh_"):
+                # Refresh orders for selected warehouse
+                warehouse_name = self._callback_warehouse(callback_data.replace("refresh_", "", 1))
+                
+                # Verify user has access
+                if not self.sheets_manager.check_user_access(chat_id, warehouse_name):
+                    await query.edit_message_text(
+                        "❌ У вас нет доступа к этому складу."
+                    )
+                    return
+                
+                # Get warehouse details
+                warehouses = self.sheets_manager.get_warehouses()
+                warehouse = next(
+                    (w for w in warehouses if w["warehouse_name"] == warehouse_name),
+                    None
+                )
+                
+                if not warehouse:
+                    await query.edit_message_text(
+                        "❌ Склад не найден."
+                    )
+                    return
+                
+                # Notify user that fetching has started
+                await query.edit_message_text(
+                    f"⏳ Загружаю отправления для склада: {warehouse_name}..."
+                )
+                
+                # Fetch orders from Ozon API in background, duplicate taps join
+                await self._start_warehouse_job(query, context, chat_id, warehouse)
+                
+        except Exception as e:
+            logger.error(f"Error in navigation_callback: {e}", exc_info=True)
+            await query.edit_message_text(
+                "❌ Произошла ошибка. Попробуйте еще раз."
+            )
+    
+    async def export_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle pick-list export callbacks (format selection and file build)."""
+        query = update.callback_query
+        await query.answer()
+        
+        chat_id = str(update.effective_chat.id)
+        callback_data = query.data
+        
+        if callback_data.startswith("exportfile_"):
+            # Ask for export format
+            warehouse_name = self._callback_warehouse(callback_data.replace("exportfile_", "", 1))
+            keyboard = [
+                [
+                    InlineKeyboardButton(
+                        fmt.upper(),
+                        callback_data=make_callback_data(f"exportfmt_{fmt}_", warehouse_name)
+                    )
+                    for fmt in available_formats()
+                ],
+                [
+                    InlineKeyboardButton(
+                        "⬅️ Назад к складам",
+                        callback_data="back_to_warehouses"
+                    )
+                ]
+            ]
+            await context.bot.send_message(
+                chat_id=chat_id,
+                text=f"Выберите формат файла для склада {warehouse_name}:",
+                reply_markup=InlineKeyboardMarkup(keyboard)
+            )
+            return
+        
+        fmt, warehouse_name = callback_data.replace("exportfmt_", "", 1).split("_", 1)
+        warehouse_name = self._callback_warehouse(warehouse_name)
+        
+        try:
+            # Verify user has access
+            if not self.sheets_manager.check_user_access(chat_id, warehouse_name):
+                await query.edit_message_text(
+                    "❌ У вас нет доступа к этому складу."
+                )
+                return
+            
+            # Get warehouse details
+            warehouses = self.sheets_manager.get_warehouses()
+            warehouse = next(
+                (w for w in warehouses if w["warehouse_name"] == warehouse_name),
+                None
+            )
+            
+            if not warehouse:
+                await query.edit_message_text(
+                    "❌ Склад не найден."
+                )
+                return
+            
+            await query.edit_message_text(
+                f"⏳ Формирую {fmt.upper()} файл для склада: {warehouse_name}..."
+            )
+            
+            # Fetch and write the file in a worker thread so the
+            # event loop keeps serving other users meanwhile
+            ozon_client = get_client(
+                client_id=warehouse["client_id"],
+                api_key=warehouse["api_key"]
+            )
+            title = (
+                f"Лист подбора: {warehouse_name} "
+                f"({datetime.now().strftime('%Y-%m-%d %H:%M')})"
+            )
+            path = await asyncio.to_thread(
+                build_pick_list,
+                iter_pick_list_rows(ozon_client.iter_products(
+                    filter_dict=OzonClient.filter_for_warehouse(warehouse),
+                    catalog=self.catalog
+                )),
+                fmt,
+                title
+            )
+            
+            try:
+                file_name = (
+                    f"pick_list_{warehouse_name}_"
+                    f"{datetime.now().strftime('%Y%m%d_%H%M')}.{fmt}"
+                )
+                with open(path, "rb") as document:
+                    await context.bot.send_document(
+                        chat_id=chat_id,
+                        document=document,
+                        filename=file_name,
+                        caption=f"📄 Лист подбора для склада: {warehouse_name}",
+                        reply_markup=self._navigation_markup(warehouse_name)
+                    )
+            finally:
+                path.unlink(missing_ok=True)
+            
+            logger.info(f"Sent {fmt.upper()} pick list for warehouse {warehouse_name} to {chat_id}")
+            
+        except Exception as e:
+            logger.error(f"Error in export_callback: {e}", exc_info=True)
+            await context.bot.send_message(
+                chat_id=chat_id,
+                text=f"❌ Ошибка при формировании файла для склада {warehouse_name}.",
+                reply_markup=self._navigation_markup(warehouse_name)
+            )
+    
+    async def labels_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle package labels request: send merged labels and link them in Tasks."""
+        query = update.callback_query
+        await query.answer()
+        
+        chat_id = str(update.effective_chat.id)
+        warehouse_name = self._callback_warehouse(query.data.replace("labels_", "", 1))
+        
+        try:
+            # Verify user has access
+            if not self.sheets_manager.check_user_access(chat_id, warehouse_name):
+                await query.edit_message_text(
+                    "❌ У вас нет доступа к этому складу."
+                )
+                return
+            
+            # Get warehouse details
+            warehouses = self.sheets_manager.get_warehouses()
+            warehouse = next(
+                (w for w in warehouses if w["warehouse_name"] == warehouse_name),
+                None
+            )
+            
+            if not warehouse:
+                await query.edit_message_text(
+                    "❌ Склад не найден."
+                )
+                return
+            
+            await query.edit_message_text(
+                f"⏳ Загружаю этикетки для склада: {warehouse_name}..."
+            )
+            
+            postings = self._cached_postings(warehouse_name)
+            if postings is None:
+                postings = await asyncio.to_thread(self.poller.fetch_postings, warehouse)
+            
+            # Print labels in pick-list order, postings without valid
+            # offer_id numbers go last
+            buckets = ShelfBuckets()
+            for posting in postings:
+                buckets.extend(OzonClient.parse_posting_products(posting, self.catalog))
+            posting_numbers = list(dict.fromkeys(
+                [product["posting_number"] for product in buckets.pop_all()]
+                + [posting.get("posting_number", "") for posting in postings]
+            ))
+            
+            ozon_client = get_client(
+                client_id=warehouse["client_id"],
+                api_key=warehouse["api_key"]
+            )
+            labels = await asyncio.to_thread(
+                self.label_store.get_labels,
+                ozon_client,
+                posting_numbers
+            )
+            
+            if not labels:
+                await context.bot.send_message(
+                    chat_id=chat_id,
+                    text=f"ℹ️ Для склада {warehouse_name} нет доступных этикеток.",
+                    reply_markup=self._navigation_markup(warehouse_name)
+                )
+                return
+            
+            path = await asyncio.to_thread(
+                self.label_store.merge,
+                list(labels.values()),
+                f"labels_{warehouse_name}"
+            )
+            try:
+                file_name = (
+                    f"labels_{warehouse_name}_"
+                    f"{datetime.now().strftime('%Y%m%d_%H%M')}.pdf"
+                )
+                caption = f"🏷️ Этикетки для склада: {warehouse_name} ({len(labels)} шт.)"
+                missing = len([number for number in posting_numbers if number]) - len(labels)
+                if missing:
+                    caption += f"\n⚠️ Не удалось получить: {missing}"
+                with open(path, "rb") as document:
+                    await context.bot.send_document(
+                        chat_id=chat_id,
+                        document=document,
+                        filename=file_name,
+                        caption=caption,
+                        reply_markup=self._navigation_markup(warehouse_name)
+                    )
+            finally:
+                path.unlink(missing_ok=True)
+            
+            await asyncio.to_thread(
+                self.sheets_manager.set_task_labels,
+                {number: self.label_store.link(number) for number in labels},
+                warehouse_name
+            )
+            
+            logger.info(f"Sent {len(labels)} labels for warehouse {warehouse_name} to {chat_id}")
+        
+        except Exception as e:
+            logger.error(f"Error in labels_callback: {e}", exc_info=True)
+            await context.bot.send_message(
+                chat_id=chat_id,
+                text=f"❌ Ошибка при получении этикеток для склада {warehouse_name}.",
+                reply_markup=self._navigation_markup(warehouse_name)
+            )
+    
+    def run(self, mode: Optional[str] = None) -> None:
+        """
+        Start the bot.
+        
+        Args:
+            mode: "polling" or "webhook" (defaults to Config.BOT_MODE)
+        """
+        mode = (mode or Config.BOT_MODE).lower()
+        start_metrics_server()
+        configure_tracing()
+        
+        if mode == "webhook":
+            url_path = Config.WEBHOOK_PATH.strip("/")
+            webhook_url = f"{Config.WEBHOOK_URL.rstrip('/')}/{url_path}"
+            logger.info(
+                f"Starting Telegram bot in webhook mode on "
+                f"{Config.WEBHOOK_LISTEN}:{Config.WEBHOOK_PORT}/{url_path}"
+            )
+            self.application.run_webhook(
+                listen=Config.WEBHOOK_LISTEN,
+                port=Config.WEBHOOK_PORT,
+                url_path=url_path,
+                webhook_url=webhook_url,
+                secret_token=Config.WEBHOOK_SECRET_TOKEN or None,
+                allowed_updates=ALLOWED_UPDATES
+            )
+        else:
+            logger.info("Starting Telegram bot in polling mode...")
+            self.application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
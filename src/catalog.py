@@ -0,0 +1,244 @@
+"""Local product catalog cache keyed by SKU."""
+import json
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, Optional
+from .config import Config
+from .metrics import CACHE_REQUESTS
+from .sort_keys import get_default_engine
+
+
+logger = logging.getLogger(__name__)
+
+# Sort key stored for catalog entries whose offer_id has no valid number
+_NO_KEY = "null"
+
+
+class CatalogEntry:
+    """Cached product data shared by all posting lines of one SKU."""
+    
+    __slots__ = ("sku", "offer_id", "product_name", "picture_url", "sort_key", "file_id")
+    
+    def __init__(
+        self,
+        sku: str,
+        offer_id: str,
+        product_name: str,
+        picture_url: str,
+        sort_key: Optional[tuple],
+        file_id: str = ""
+    ):
+        """Create entry (sort_key is None for offer_ids without a valid number)."""
+        self.sku = sku
+        self.offer_id = offer_id
+        self.product_name = product_name
+        self.picture_url = picture_url
+        self.sort_key = sort_key
+        self.file_id = file_id
+
+
+class ProductCatalog:
+    """
+    SKU -> name, offer_id, picture, sort key and Telegram photo file_id.
+    
+    Entries are loaded from SQLite once and then served from memory, so
+    repeated SKUs are not re-stringified or re-parsed on every fetch.
+    New and changed entries are written back in bulk by flush(). Sort keys
+    are stored together with the rules they were computed with and are
+    recomputed when the OFFER_ID_* settings change (keys always come from
+    the default sort-key engine).
+    """
+    
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        Open catalog and load all entries.
+        
+        Args:
+            db_path: Path to SQLite file (defaults to Config.STATE_DB_PATH)
+        """
+        self.db_path = db_path or Config.STATE_DB_PATH
+        self._keys_engine = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._entries: Dict[str, CatalogEntry] = {}
+        self._dirty: Dict[str, CatalogEntry] = {}
+        self.hits = 0
+        self.misses = 0
+        self._create_tables()
+        self._load()
+    
+    @staticmethod
+    def _rules() -> str:
+        """Signature of the sort-key rules the cached keys depend on."""
+        engine = get_default_engine()
+        return f"{engine.prefix_max_len}:{engine.number_min}:{engine.number_max}:{engine.key_parts}"
+    
+    def _create_tables(self) -> None:
+        """Create tables if they don't exist."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS product_catalog (
+                    sku TEXT PRIMARY KEY,
+                    offer_id TEXT NOT NULL,
+                    product_name TEXT NOT NULL,
+                    picture_url TEXT NOT NULL,
+                    sort_key TEXT,
+                    sort_rules TEXT,
+                    file_id TEXT NOT NULL DEFAULT ''
+                )
+                """
+            )
+    
+    def _load(self) -> None:
+        """Load all entries into memory."""
+        engine = get_default_engine()
+        rules = self._rules()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT sku, offer_id, product_name, picture_url, sort_key, sort_rules, file_id "
+                "FROM product_catalog"
+            ).fetchall()
+        stale = 0
+        for sku, offer_id, product_name, picture_url, sort_key, sort_rules, file_id in rows:
+            if sort_rules == rules and sort_key is not None:
+                key = json.loads(sort_key)
+                key = tuple(key) if key is not None else None
+                entry = CatalogEntry(sku, offer_id, product_name, picture_url, key, file_id)
+            else:
+                entry = CatalogEntry(
+                    sku, offer_id, product_name, picture_url, engine.key(offer_id), file_id
+                )
+                self._dirty[sku] = entry
+                stale += 1
+            self._entries[sku] = entry
+        self._keys_engine = engine
+        logger.info(f"Product catalog loaded: {len(self._entries)} SKUs ({stale} sort keys recomputed)")
+    
+    def __len__(self) -> int:
+        """Number of cached SKUs."""
+        return len(self._entries)
+    
+    def get(self, sku: str) -> Optional[CatalogEntry]:
+        """Get cached entry of a SKU."""
+        return self._entries.get(sku)
+    
+    def _rekey(self, engine) -> None:
+        """Recompute all sort keys after the sort-key rules changed."""
+        with self._lock:
+            for sku, entry in self._entries.items():
+                entry.sort_key = engine.key(entry.offer_id)
+                self._dirty[sku] = entry
+            self._keys_engine = engine
+        logger.info(f"Product catalog: recomputed sort keys of {len(self._entries)} SKUs")
+    
+    def resolve(self, product: Dict[str, Any]) -> CatalogEntry:
+        """
+        Get entry for a raw Ozon posting product, caching new or changed SKUs.
+        
+        Args:
+            product: Product object from the posting list response
+        
+        Returns:
+            Catalog entry with the product's current data
+        """
+        engine = get_default_engine()
+        if engine is not self._keys_engine:
+            self._rekey(engine)
+        
+        sku = product.get("sku", "")
+        sku = str(sku) if sku is not None else ""
+        entry = self._entries.get(sku)
+        offer_id = product.get("offer_id", "")
+        product_name = product.get("product_name", "")
+        picture_url = product.get("picture_url", "")
+        
+        if (
+            entry is not None
+            and entry.offer_id == offer_id
+            and entry.product_name == product_name
+            and entry.picture_url == picture_url
+        ):
+            self.hits += 1
+            CACHE_REQUESTS.inc(cache="catalog", result="hit")
+            return entry
+        
+        self.misses += 1
+        CACHE_REQUESTS.inc(cache="catalog", result="miss")
+        offer_id = str(offer_id)
+        new_entry = CatalogEntry(
+            sku,
+            offer_id,
+            str(product_name),
+            str(picture_url),
+            engine.key(offer_id),
+            # Telegram file_id is only valid for the same picture
+            entry.file_id if entry is not None and entry.picture_url == str(picture_url) else ""
+        )
+        if sku:
+            with self._lock:
+                self._entries[sku] = new_entry
+                self._dirty[sku] = new_entry
+        return new_entry
+    
+    def set_file_id(self, sku: str, file_id: str) -> None:
+        """
+        Remember Telegram file_id of the photo uploaded for a SKU.
+        
+        Args:
+            sku: Product SKU
+            file_id: Telegram file_id of the sent photo
+        """
+        entry = self._entries.get(sku)
+        if entry is None or entry.file_id == file_id:
+            return
+        with self._lock:
+            entry.file_id = file_id
+            self._dirty[sku] = entry
+    
+    def clear_file_id(self, sku: str) -> None:
+        """Forget Telegram file_id of a SKU (e.g. rejected by Telegram)."""
+        self.set_file_id(sku, "")
+    
+    def flush(self) -> int:
+        """
+        Write new and changed entries to SQLite in one transaction.
+        
+        Returns:
+            Number of written entries
+        """
+        rules = self._rules()
+        with self._lock:
+            dirty = list(self._dirty.values())
+            self._dirty.clear()
+            if not dirty:
+                return 0
+            rows = [
+                (
+                    entry.sku,
+                    entry.offer_id,
+                    entry.product_name,
+                    entry.picture_url,
+                    json.dumps(list(entry.sort_key)) if entry.sort_key is not None else _NO_KEY,
+                    rules,
+                    entry.file_id
+                )
+                for entry in dirty
+            ]
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO product_catalog "
+                    "(sku, offer_id, product_name, picture_url, sort_key, sort_rules, file_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+        logger.debug("Product catalog: saved %d SKUs", len(rows))
+        return len(rows)
+    
+    def close(self) -> None:
+        """Flush pending entries and close the database connection."""
+        self.flush()
+        with self._lock:
+            self._conn.close()
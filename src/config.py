@@ -1,11 +1,20 @@
 """Configuration module for loading and validating environment variables."""
+import importlib.util
 import os
 import logging
+import threading
 from pathlib import Path
-from dotenv import load_dotenv
+from typing import Any, Dict, Tuple
+from dotenv import dotenv_values, find_dotenv, load_dotenv
+
+# Variables set in the real environment take precedence over .env, also on reload
+_PROCESS_ENV_KEYS = frozenset(os.environ)
 
 # Load environment variables from .env file
-load_dotenv()
+ENV_PATH = find_dotenv()
+load_dotenv(ENV_PATH)
+
+_reload_lock = threading.Lock()
 
 
 class Config:
@@ -13,28 +22,178 @@ class Config:
     
     # Telegram Bot Configuration
     TELEGRAM_BOT_TOKEN: str = os.getenv("TELEGRAM_BOT_TOKEN", "")
+    # Bot API base URL of a local stand-in, e.g. http://127.0.0.1:8083
+    # (empty uses https://api.telegram.org)
+    TELEGRAM_API_BASE_URL: str = os.getenv("TELEGRAM_API_BASE_URL", "")
+    
+    # Update delivery mode: "polling" or "webhook"
+    BOT_MODE: str = os.getenv("BOT_MODE", "polling").lower()
+    
+    # Webhook Configuration (used when BOT_MODE=webhook)
+    # Public HTTPS base URL Telegram sends updates to, e.g. https://bot.example.com
+    WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")
+    WEBHOOK_LISTEN: str = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+    WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", "8443"))
+    WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "telegram")
+    WEBHOOK_SECRET_TOKEN: str = os.getenv("WEBHOOK_SECRET_TOKEN", "")
+    
+    # Ozon API Configuration
+    OZON_API_BASE_URL: str = os.getenv("OZON_API_BASE_URL", "https://api-seller.ozon.ru")
+    # Requests per second per client_id (0 disables limiting) and burst size
+    OZON_RATE_LIMIT_RPS: float = float(os.getenv("OZON_RATE_LIMIT_RPS", "5"))
+    OZON_RATE_LIMIT_BURST: int = int(os.getenv("OZON_RATE_LIMIT_BURST", "5"))
+    # Consecutive failed requests per client_id that stop further requests
+    # for OZON_CIRCUIT_RESET_SECONDS (0, the default, disables the circuit breaker)
+    OZON_CIRCUIT_FAILURES: int = int(os.getenv("OZON_CIRCUIT_FAILURES", "0"))
+    OZON_CIRCUIT_RESET_SECONDS: float = float(os.getenv("OZON_CIRCUIT_RESET_SECONDS", "30"))
+    # Request timeouts (seconds)
+    OZON_CONNECT_TIMEOUT: float = float(os.getenv("OZON_CONNECT_TIMEOUT", "30"))
+    OZON_READ_TIMEOUT: float = float(os.getenv("OZON_READ_TIMEOUT", "120"))
+    
+    # Package labels Configuration
+    # Directory for cached label PDFs (one file per posting_number)
+    LABELS_CACHE_DIR: str = os.getenv("LABELS_CACHE_DIR", "labels_cache")
+    # Concurrent label batch downloads per warehouse
+    LABELS_CONCURRENCY: int = int(os.getenv("LABELS_CONCURRENCY", "3"))
+    # Optional public URL of LABELS_CACHE_DIR, used for links in "Tasks"
+    LABELS_PUBLIC_URL: str = os.getenv("LABELS_PUBLIC_URL", "")
     
     # Google Sheets Configuration
     GOOGLE_SHEETS_ID: str = os.getenv("GOOGLE_SHEETS_ID", "")
     GOOGLE_SERVICE_ACCOUNT_JSON: str = os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON", "")
+    # How long "Ozon"/"Access" sheet data is reused before reading it again
+    # (seconds, 0 reads on every request); refreshed in the background
+    SHEETS_CONFIG_TTL_SECONDS: int = int(os.getenv("SHEETS_CONFIG_TTL_SECONDS", "60"))
+    # Sheets API base URL of a local stand-in (see main.py standins), e.g.
+    # http://127.0.0.1:8082; no service account is needed then. Empty uses Google
+    SHEETS_API_BASE_URL: str = os.getenv("SHEETS_API_BASE_URL", "")
     
     # Logging Configuration
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
     LOG_FILE: str = os.getenv("LOG_FILE", "bot.log")
+    # Rotate log file at LOG_MAX_BYTES, or by time if LOG_ROTATE_WHEN is set
+    # ("midnight", "H", "D"... as in TimedRotatingFileHandler)
+    LOG_MAX_BYTES: int = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+    LOG_ROTATE_WHEN: str = os.getenv("LOG_ROTATE_WHEN", "")
+    LOG_BACKUP_COUNT: int = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+    # Write log records as JSON lines (with trace_id) instead of text
+    LOG_JSON: bool = os.getenv("LOG_JSON", "false").lower() in ("1", "true", "yes")
+    # Log only every n-th per-page message of Ozon pagination (1 logs all)
+    LOG_PAGE_SAMPLE: int = int(os.getenv("LOG_PAGE_SAMPLE", "10"))
+    
+    # Metrics Configuration
+    # Port of the Prometheus text endpoint /metrics (0 disables it)
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT", "0"))
+    METRICS_ADDR: str = os.getenv("METRICS_ADDR", "127.0.0.1")
+    
+    # Tracing Configuration (both empty disables tracing)
+    # JSON lines file the finished spans are appended to
+    TRACE_FILE: str = os.getenv("TRACE_FILE", "")
+    # OTLP/HTTP collector traces URL, e.g. http://127.0.0.1:4318/v1/traces
+    TRACE_OTLP_ENDPOINT: str = os.getenv("TRACE_OTLP_ENDPOINT", "")
+    
+    # Admin Configuration
+    # Chat IDs allowed to use admin commands (/profile, /stats), comma-separated
+    ADMIN_CHAT_IDS: list = [
+        chat_id.strip() for chat_id in os.getenv("ADMIN_CHAT_IDS", "").split(",") if chat_id.strip()
+    ]
+    
+    # /stats latency percentiles window (seconds) and max samples kept per metric
+    STATS_WINDOW_SECONDS: int = int(os.getenv("STATS_WINDOW_SECONDS", "300"))
+    STATS_WINDOW_SIZE: int = int(os.getenv("STATS_WINDOW_SIZE", "2048"))
+    
+    # Profiling Configuration (/profile)
+    # Directory for profile files and summaries
+    PROFILE_DIR: str = os.getenv("PROFILE_DIR", "profiles")
+    # Functions listed in profile summaries
+    PROFILE_TOP_N: int = int(os.getenv("PROFILE_TOP_N", "20"))
+    # Seconds between stack samples of the sampling profiler
+    PROFILE_SAMPLE_INTERVAL: float = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+    # Report handlers blocking the event loop longer than this (seconds, 0 disables)
+    LOOP_BLOCK_THRESHOLD: float = float(os.getenv("LOOP_BLOCK_THRESHOLD", "0"))
+    
+    # Interval of checking .env for changes to apply them without restart
+    # (seconds, 0 disables)
+    CONFIG_WATCH_INTERVAL: float = float(os.getenv("CONFIG_WATCH_INTERVAL", "5"))
+    
+    # Background Jobs Configuration
+    # Minimal interval between progress message edits (seconds)
+    JOB_PROGRESS_INTERVAL: float = float(os.getenv("JOB_PROGRESS_INTERVAL", "2"))
+    
+    # Offer ID sort-key rules (see src/sort_keys.py)
+    # Max number of prefix symbols before the shelf number ("мд33-..." -> 2)
+    OFFER_ID_PREFIX_MAX_LEN: int = int(os.getenv("OFFER_ID_PREFIX_MAX_LEN", "2"))
+    # Valid range of the shelf number, other products are skipped
+    OFFER_ID_NUMBER_MIN: int = int(os.getenv("OFFER_ID_NUMBER_MIN", "1"))
+    OFFER_ID_NUMBER_MAX: int = int(os.getenv("OFFER_ID_NUMBER_MAX", "99"))
+    # Numeric parts used for sorting: 1 -> (20,), 3 -> "р20-п5-33" -> (20, 5, 33)
+    OFFER_ID_KEY_PARTS: int = int(os.getenv("OFFER_ID_KEY_PARTS", "1"))
+    # Max number of memoized offer_id keys
+    OFFER_ID_CACHE_SIZE: int = int(os.getenv("OFFER_ID_CACHE_SIZE", "65536"))
+    
+    # Pick list mode: "postings" - one line per product of every posting,
+    # "aggregated" - identical offer_id/SKU lines merged across postings
+    PICK_LIST_MODE: str = os.getenv("PICK_LIST_MODE", "postings").lower()
+    
+    # Streaming pipeline: write and send page 1 while page 2 is downloading.
+    # Products are then ordered by shelf within each Ozon page only.
+    PIPELINE_STREAMING: bool = os.getenv("PIPELINE_STREAMING", "false").lower() in ("1", "true", "yes")
+    # Max batches (pages) waiting between pipeline stages
+    PIPELINE_QUEUE_SIZE: int = int(os.getenv("PIPELINE_QUEUE_SIZE", "2"))
+    
+    # Maximum number of warehouses fetched from Ozon concurrently
+    FETCH_CONCURRENCY: int = int(os.getenv("FETCH_CONCURRENCY", "4"))
+    
+    # Seconds running jobs may finish on shutdown before they are interrupted;
+    # interrupted deliveries continue from the last sent product after restart
+    SHUTDOWN_DRAIN_SECONDS: float = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "10"))
+    # Interrupted deliveries older than this are not resumed (hours)
+    RESUME_MAX_AGE_HOURS: float = float(os.getenv("RESUME_MAX_AGE_HOURS", "12"))
+    
+    # Worker processes running warehouse jobs from the durable queue
+    # (0 runs them in the bot process)
+    WORKER_PROCESSES: int = int(os.getenv("WORKER_PROCESSES", "0"))
+    # Seconds an idle worker waits before looking for new jobs again
+    WORKER_POLL_INTERVAL: float = float(os.getenv("WORKER_POLL_INTERVAL", "1"))
+    # A job whose worker died this many times is failed instead of requeued
+    WORKER_MAX_ATTEMPTS: int = int(os.getenv("WORKER_MAX_ATTEMPTS", "2"))
+    # Seconds a stopping worker may finish its current job before it is killed
+    WORKER_STOP_TIMEOUT: float = float(os.getenv("WORKER_STOP_TIMEOUT", "30"))
+    
+    # Scheduled Polling Configuration
+    # Interval of background polling of all warehouses (seconds, 0 disables)
+    POLL_INTERVAL_SECONDS: int = int(os.getenv("POLL_INTERVAL_SECONDS", "0"))
+    # How long polled postings are served to interactive requests
+    # (seconds, 0 means twice the polling interval)
+    POLL_CACHE_TTL_SECONDS: int = int(os.getenv("POLL_CACHE_TTL_SECONDS", "0"))
+    
+    # Local state storage (delivered postings etc.)
+    STATE_DB_PATH: str = os.getenv("STATE_DB_PATH", "bot_state.db")
+    # Delivered postings older than this are forgotten (days, 0 keeps them forever);
+    # keep it above the "Дней назад" window, older postings are not fetched anyway
+    DELIVERED_RETENTION_DAYS: float = float(os.getenv("DELIVERED_RETENTION_DAYS", "45"))
+    
+    # Export Configuration
+    # TTF font with Cyrillic glyphs for PDF pick lists (optional)
+    EXPORT_PDF_FONT: str = os.getenv("EXPORT_PDF_FONT", "")
     
     @classmethod
-    def validate(cls) -> bool:
+    def validate(cls, telegram: bool = True) -> bool:
         """
         Validate that all required configuration values are present.
         
+        Args:
+            telegram: Also check the Telegram settings (not needed by the
+                headless sync command)
+        
         Returns:
             bool: True if all required configs are present, False otherwise
         """
-        required_configs = {
-            "TELEGRAM_BOT_TOKEN": cls.TELEGRAM_BOT_TOKEN,
-            "GOOGLE_SHEETS_ID": cls.GOOGLE_SHEETS_ID,
-            "GOOGLE_SERVICE_ACCOUNT_JSON": cls.GOOGLE_SERVICE_ACCOUNT_JSON,
-        }
+        required_configs = {"GOOGLE_SHEETS_ID": cls.GOOGLE_SHEETS_ID}
+        if not cls.SHEETS_API_BASE_URL:
+            required_configs["GOOGLE_SERVICE_ACCOUNT_JSON"] = cls.GOOGLE_SERVICE_ACCOUNT_JSON
+        if telegram:
+            required_configs["TELEGRAM_BOT_TOKEN"] = cls.TELEGRAM_BOT_TOKEN
         
         missing = [key for key, value in required_configs.items() if not value]
         
@@ -42,9 +201,17 @@ class Config:
             logging.error(f"Missing required configuration: {', '.join(missing)}")
             return False
         
+        if telegram and cls.BOT_MODE not in ("polling", "webhook"):
+            logging.error(f"Invalid BOT_MODE: {cls.BOT_MODE} (expected polling or webhook)")
+            return False
+        
+        if telegram and cls.BOT_MODE == "webhook" and not cls.WEBHOOK_URL:
+            logging.error("Missing required configuration: WEBHOOK_URL (BOT_MODE=webhook)")
+            return False
+        
         # Validate service account JSON file exists
         json_path = Path(cls.GOOGLE_SERVICE_ACCOUNT_JSON)
-        if not json_path.exists():
+        if not cls.SHEETS_API_BASE_URL and not json_path.exists():
             logging.error(f"Service account JSON file not found: {json_path}")
             return False
         
@@ -54,5 +221,71 @@ class Config:
     def get_service_account_path(cls) -> Path:
         """Get absolute path to service account JSON file."""
         return Path(cls.GOOGLE_SERVICE_ACCOUNT_JSON).resolve()
+    
+    @classmethod
+    def settings(cls) -> Dict[str, Any]:
+        """Get all settings (upper-case attributes)."""
+        return {
+            name: value for name, value in vars(cls).items()
+            if name.isupper() and not callable(value)
+        }
+    
+    @classmethod
+    def env_mtime(cls) -> float:
+        """Modification time of the .env file (0 if there is none)."""
+        try:
+            return os.path.getmtime(ENV_PATH) if ENV_PATH else 0.0
+        except OSError:
+            return 0.0
+    
+    @classmethod
+    def reload(cls) -> Dict[str, Tuple[Any, Any]]:
+        """
+        Re-read .env and apply changed settings.
+        
+        The class body is evaluated again on a fresh copy of this module, so
+        defaults and parsing stay in one place. Only settings whose value
+        derived from the environment changed are assigned, values set at
+        runtime (e.g. command line options) are kept otherwise.
+        
+        Returns:
+            Dictionary mapping changed setting name to (old, new) value
+        """
+        global _loaded_settings
+        with _reload_lock:
+            env_values = dotenv_values(ENV_PATH) if ENV_PATH else {}
+            for key in _env_file_keys - set(env_values):
+                # Removed from .env: fall back to the default
+                os.environ.pop(key, None)
+            _env_file_keys.clear()
+            for key, value in env_values.items():
+                if key not in _PROCESS_ENV_KEYS and value is not None:
+                    os.environ[key] = value
+                    _env_file_keys.add(key)
+            
+            spec = importlib.util.spec_from_file_location(f"{__name__}._reload", __file__)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            fresh = module.Config.settings()
+            
+            changes = {
+                name: (getattr(cls, name, None), value)
+                for name, value in fresh.items()
+                if _loaded_settings.get(name) != value
+            }
+            for name, (_, value) in changes.items():
+                setattr(cls, name, value)
+            _loaded_settings = fresh
+        
+        if changes:
+            logging.info(f"Configuration reloaded, changed: {', '.join(sorted(changes))}")
+        return changes
 
 
+# Settings as derived from the environment by the last (re)load
+_loaded_settings: Dict[str, Any] = Config.settings()
+# Variables currently taken from .env (not from the real environment)
+_env_file_keys = {
+    key for key, value in (dotenv_values(ENV_PATH) if ENV_PATH else {}).items()
+    if key not in _PROCESS_ENV_KEYS and value is not None
+}
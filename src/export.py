@@ -0,0 +1,225 @@
+"""Pick-list export to CSV/XLSX/PDF documents."""
+import csv
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Iterable, Iterator, List, Dict, Any, Tuple
+from .config import Config
+from .sort_keys import ShelfBuckets
+
+
+logger = logging.getLogger(__name__)
+
+PICK_LIST_HEADERS = [
+    "Номер отправления",
+    "Offer ID",
+    "Наименование",
+    "Артикул",
+    "Кол-во"
+]
+
+# Column widths for PDF output (points), must match PICK_LIST_HEADERS
+PDF_COLUMN_WIDTHS = [95, 80, 250, 65, 40]
+
+# Fallback TTF fonts with Cyrillic glyphs for PDF output
+PDF_FONT_CANDIDATES = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "C:\\Windows\\Fonts\\arial.ttf",
+]
+
+
+def available_formats() -> List[str]:
+    """
+    Get export formats supported in the current environment.
+    
+    CSV is always available, XLSX requires openpyxl and PDF requires reportlab.
+    
+    Returns:
+        List of format names (csv, xlsx, pdf)
+    """
+    formats = ["csv"]
+    try:
+        import openpyxl  # noqa: F401
+        formats.append("xlsx")
+    except ImportError:
+        pass
+    try:
+        import reportlab  # noqa: F401
+        formats.append("pdf")
+    except ImportError:
+        pass
+    return formats
+
+
+def iter_pick_list_rows(products: Iterable[Dict[str, Any]]) -> Iterator[Tuple]:
+    """
+    Convert products into sorted pick-list rows.
+    
+    Only compact row tuples are kept in memory (not the product dicts),
+    products without a valid offer_id number (1-99) are skipped.
+    
+    Args:
+        products: Iterable of parsed product dictionaries
+    
+    Yields:
+        Row tuples matching PICK_LIST_HEADERS, sorted by offer_id number
+    """
+    buckets = ShelfBuckets()
+    for product in products:
+        offer_id = product.get("offer_id", "")
+        buckets.add(
+            (
+                product.get("posting_number", ""),
+                offer_id,
+                product.get("product_name", ""),
+                product.get("sku", ""),
+                product.get("quantity", 0)
+            ),
+            offer_id
+        )
+    
+    # Buckets keep API order for products on the same shelf
+    yield from buckets.pop_all()
+
+
+def build_pick_list(rows: Iterable[Tuple], fmt: str, title: str = "") -> Path:
+    """
+    Write pick-list rows to a temporary file in the requested format.
+    
+    Rows are written one by one, so the output never has to be held
+    in memory as a whole. The caller is responsible for removing the file.
+    
+    Args:
+        rows: Row tuples matching PICK_LIST_HEADERS
+        fmt: Export format (csv, xlsx or pdf)
+        title: Document title (used by PDF export)
+    
+    Returns:
+        Path to the generated file
+    """
+    fmt = fmt.lower()
+    writers = {
+        "csv": _write_csv,
+        "xlsx": _write_xlsx,
+        "pdf": _write_pdf,
+    }
+    if fmt not in writers:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    
+    fd, file_name = tempfile.mkstemp(prefix="pick_list_", suffix=f".{fmt}")
+    os.close(fd)
+    path = Path(file_name)
+    
+    try:
+        count = writers[fmt](rows, path, title)
+    except Exception:
+        path.unlink(missing_ok=True)
+        raise
+    
+    logger.info(f"Built {fmt.upper()} pick list with {count} rows: {path}")
+    return path
+
+
+def _write_csv(rows: Iterable[Tuple], path: Path, title: str) -> int:
+    """Write rows as CSV (UTF-8 with BOM so Excel detects the encoding)."""
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(PICK_LIST_HEADERS)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def _write_xlsx(rows: Iterable[Tuple], path: Path, title: str) -> int:
+    """Write rows as XLSX using openpyxl write-only (streaming) mode."""
+    from openpyxl import Workbook
+    
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(title="Pick list")
+    worksheet.append(PICK_LIST_HEADERS)
+    count = 0
+    for row in rows:
+        worksheet.append(list(row))
+        count += 1
+    workbook.save(str(path))
+    return count
+
+
+def _register_pdf_font() -> str:
+    """Register a TTF font with Cyrillic support and return its name."""
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    
+    candidates = [Config.EXPORT_PDF_FONT] if Config.EXPORT_PDF_FONT else []
+    candidates.extend(PDF_FONT_CANDIDATES)
+    for font_path in candidates:
+        if font_path and Path(font_path).exists():
+            if "PickListFont" not in pdfmetrics.getRegisteredFontNames():
+                pdfmetrics.registerFont(TTFont("PickListFont", font_path))
+            return "PickListFont"
+    
+    logger.warning(
+        "No TTF font with Cyrillic support found for PDF export, "
+        "set EXPORT_PDF_FONT to fix missing glyphs"
+    )
+    return "Helvetica"
+
+
+def _write_pdf(rows: Iterable[Tuple], path: Path, title: str) -> int:
+    """Write rows as PDF page by page using the low-level reportlab canvas."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    from reportlab.pdfgen import canvas
+    
+    font_name = _register_pdf_font()
+    font_size = 8
+    line_height = 11
+    margin = 30
+    page_width, page_height = A4
+    
+    pdf = canvas.Canvas(str(path), pagesize=A4)
+    
+    def fit(text: str, width: float) -> str:
+        """Truncate text to fit into the column width."""
+        text = str(text)
+        limit = width - 4
+        text_width = stringWidth(text, font_name, font_size)
+        if text_width <= limit:
+            return text
+        # Cut proportionally first, then trim the remainder char by char
+        text = text[:max(int(len(text) * limit / text_width) - 1, 0)]
+        while text and stringWidth(text + "…", font_name, font_size) > limit:
+            text = text[:-1]
+        return text + "…"
+    
+    def draw_row(values, y: float) -> None:
+        x = margin
+        for value, width in zip(values, PDF_COLUMN_WIDTHS):
+            pdf.drawString(x, y, fit(value, width))
+            x += width
+    
+    def start_page() -> float:
+        pdf.setFont(font_name, font_size)
+        y = page_height - margin
+        if title:
+            pdf.drawString(margin, y, title)
+            y -= line_height * 2
+        draw_row(PICK_LIST_HEADERS, y)
+        return y - line_height * 1.5
+    
+    y = start_page()
+    count = 0
+    for row in rows:
+        if y < margin:
+            pdf.showPage()
+            y = start_page()
+        draw_row(row, y)
+        y -= line_height
+        count += 1
+    
+    pdf.save()
+    return count
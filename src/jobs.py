@@ -0,0 +1,234 @@
+"""Background job execution with live progress messages."""
+import asyncio
+import logging
+import time
+from typing import Dict, List, Tuple, Optional, Callable, Awaitable
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
+from .config import Config
+from .metrics import ACTIVE_JOBS
+from .tracing import span
+from .utils import make_callback_data
+
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job (also from worker threads) once it was cancelled."""
+
+
+class Job:
+    """Single background run for a (chat_id, warehouse_name) pair."""
+    
+    def __init__(self, chat_id: str, warehouse_name: str):
+        """
+        Initialize job state.
+        
+        Args:
+            chat_id: Telegram chat ID the job belongs to
+            warehouse_name: Name of the warehouse being processed
+        """
+        self.chat_id = str(chat_id)
+        self.warehouse_name = warehouse_name
+        self.task: Optional[asyncio.Task] = None
+        self.started_at = time.monotonic()
+        self.cancel_requested = False
+        # Stopped by a shutdown rather than by the user
+        self.interrupted = False
+        # Delivery is checkpointed and continues after a restart
+        self.resumable = False
+        # Progress messages (chat_id, message_id) edited in place
+        self.messages: List[Tuple[str, int]] = []
+        self.progress = "⏳ Запуск..."
+        self._shown_progress = ""
+    
+    @property
+    def key(self) -> Tuple[str, str]:
+        """Deduplication key of the job."""
+        return self.chat_id, self.warehouse_name
+    
+    def set_progress(self, text: str) -> None:
+        """
+        Update progress text. Safe to call from worker threads.
+        
+        Raises:
+            JobCancelled: If the job was cancelled meanwhile, so that
+                blocking work in a thread stops at the next checkpoint
+        """
+        self.check_cancelled()
+        self.progress = text
+    
+    def check_cancelled(self) -> None:
+        """Raise JobCancelled if cancellation was requested."""
+        if self.cancel_requested:
+            raise JobCancelled(f"Job {self.key} was cancelled")
+    
+    def is_running(self) -> bool:
+        """Check if the job task is still running."""
+        return self.task is not None and not self.task.done()
+
+
+class JobManager:
+    """Runs warehouse processing as background tasks, one per warehouse/chat."""
+    
+    def __init__(self, bot: Bot, progress_interval: Optional[float] = None):
+        """
+        Initialize job manager.
+        
+        Args:
+            bot: Telegram bot used to edit progress messages
+            progress_interval: Minimal seconds between progress edits
+        """
+        self.bot = bot
+        self.progress_interval = (
+            progress_interval if progress_interval is not None
+            else Config.JOB_PROGRESS_INTERVAL
+        )
+        self.jobs: Dict[Tuple[str, str], Job] = {}
+    
+    def get(self, chat_id: str, warehouse_name: str) -> Optional[Job]:
+        """Get running job for chat/warehouse if any."""
+        job = self.jobs.get((str(chat_id), warehouse_name))
+        if job and job.is_running():
+            return job
+        return None
+    
+    def active_jobs(self) -> List[Job]:
+        """Get all currently running jobs."""
+        return [job for job in self.jobs.values() if job.is_running()]
+    
+    def start(
+        self,
+        chat_id: str,
+        warehouse_name: str,
+        message: Optional[Tuple[str, int]],
+        job_func: Callable[[Job], Awaitable[None]]
+    ) -> Tuple[Job, bool]:
+        """
+        Start a job or join the one already running for chat/warehouse.
+        
+        Args:
+            chat_id: Telegram chat ID
+            warehouse_name: Name of the warehouse
+            message: Progress message (chat_id, message_id) to edit in place
+            job_func: Coroutine function doing the actual work
+        
+        Returns:
+            Tuple of (job, created) where created is False if joined
+        """
+        job = self.get(chat_id, warehouse_name)
+        if job:
+            if message and message not in job.messages:
+                job.messages.append(message)
+                # Force the next progress tick to refresh the new message too
+                job._shown_progress = ""
+            logger.info(f"Joined running job for warehouse {warehouse_name} (chat {chat_id})")
+            return job, False
+        
+        job = Job(chat_id, warehouse_name)
+        if message:
+            job.messages.append(message)
+        self.jobs[job.key] = job
+        job.task = asyncio.get_running_loop().create_task(self._run(job, job_func))
+        logger.info(f"Started job for warehouse {warehouse_name} (chat {chat_id})")
+        return job, True
+    
+    def cancel(self, chat_id: str, warehouse_name: str) -> bool:
+        """
+        Cancel running job for chat/warehouse.
+        
+        Returns:
+            True if a running job was found and cancelled
+        """
+        job = self.get(chat_id, warehouse_name)
+        if not job:
+            return False
+        job.cancel_requested = True
+        job.task.cancel()
+        logger.info(f"Cancelled job for warehouse {warehouse_name} (chat {chat_id})")
+        return True
+    
+    async def shutdown(self, timeout: float = 0) -> None:
+        """
+        Stop all running jobs and wait for them to finish.
+        
+        Jobs get up to timeout seconds to complete, the rest are interrupted:
+        unlike a cancel by the user, an interrupted delivery keeps its
+        checkpoint and continues after the restart.
+        
+        Args:
+            timeout: Seconds to let running jobs finish
+        """
+        jobs = self.active_jobs()
+        if jobs and timeout > 0:
+            logger.info(f"Waiting up to {timeout}s for {len(jobs)} running jobs")
+            await asyncio.wait([job.task for job in jobs], timeout=timeout)
+        jobs = self.active_jobs()
+        for job in jobs:
+            job.interrupted = True
+            job.cancel_requested = True
+            job.task.cancel()
+        if jobs:
+            logger.info(f"Interrupted {len(jobs)} running jobs")
+            await asyncio.gather(*(job.task for job in jobs), return_exceptions=True)
+    
+    async def _run(self, job: Job, job_func: Callable[[Job], Awaitable[None]]) -> None:
+        """Run job function alongside the progress updater."""
+        updater = asyncio.get_running_loop().create_task(self._progress_loop(job))
+        final_text = None
+        ACTIVE_JOBS.inc()
+        try:
+            with span("job", warehouse=job.warehouse_name, chat_id=job.chat_id):
+                await job_func(job)
+            final_text = f"✅ Готово: {job.warehouse_name}"
+        except (asyncio.CancelledError, JobCancelled):
+            if job.interrupted and job.resumable:
+                final_text = f"⏸ Прервано перезапуском бота: {job.warehouse_name}, отправка продолжится после запуска"
+            elif job.interrupted:
+                final_text = f"⏸ Прервано перезапуском бота: {job.warehouse_name}, повторите запрос позже"
+            else:
+                final_text = f"⛔ Отменено: {job.warehouse_name}"
+            logger.info(f"Job for warehouse {job.warehouse_name} {'interrupted' if job.interrupted else 'cancelled'}")
+        except Exception as e:
+            final_text = f"❌ Ошибка: {job.warehouse_name}"
+            logger.error(f"Job for warehouse {job.warehouse_name} failed: {e}", exc_info=True)
+        finally:
+            ACTIVE_JOBS.dec()
+            updater.cancel()
+            self.jobs.pop(job.key, None)
+            if final_text:
+                await self._edit_progress(job, final_text, with_cancel=False)
+    
+    async def _progress_loop(self, job: Job) -> None:
+        """Periodically push changed progress text to the progress messages."""
+        while True:
+            if job.progress != job._shown_progress:
+                await self._edit_progress(job, job.progress, with_cancel=True)
+            await asyncio.sleep(self.progress_interval)
+    
+    async def _edit_progress(self, job: Job, text: str, with_cancel: bool) -> None:
+        """Edit all progress messages of the job."""
+        job._shown_progress = text
+        reply_markup = None
+        if with_cancel:
+            reply_markup = InlineKeyboardMarkup([[
+                InlineKeyboardButton(
+                    "⛔ Отменить",
+                    callback_data=make_callback_data("cancel_", job.warehouse_name)
+                )
+            ]])
+        
+        for chat_id, message_id in job.messages:
+            try:
+                await self.bot.edit_message_text(
+                    text=text,
+                    chat_id=chat_id,
+                    message_id=message_id,
+                    reply_markup=reply_markup
+                )
+            except BadRequest as e:
+                # "Message is not modified" and deleted messages are harmless
+                logger.debug(f"Could not edit progress message {message_id}: {e}")
+            except Exception as e:
+                logger.warning(f"Error editing progress message {message_id}: {e}")
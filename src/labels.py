@@ -0,0 +1,178 @@
+"""Ozon package labels: batched download, disk cache and merging."""
+import io
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Dict, Optional, Callable
+from .config import Config
+from .metrics import CACHE_REQUESTS
+from .tracing import bind
+from .ozon_client import OzonClient, PACKAGE_LABEL_BATCH_SIZE
+
+
+logger = logging.getLogger(__name__)
+
+# Characters allowed in cached label file names
+_UNSAFE_NAME = re.compile(r"[^0-9A-Za-z_-]")
+
+
+def labels_available() -> bool:
+    """Check if label splitting/merging is supported (requires pypdf)."""
+    try:
+        import pypdf  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class LabelStore:
+    """
+    Disk cache of package label PDFs, one file per posting_number.
+    
+    Missing labels are downloaded in batches of PACKAGE_LABEL_BATCH_SIZE
+    postings, several batches at once (the OzonClient rate limiter keeps
+    the requests within the per-account limit). Each batch PDF is split
+    into one file per posting, so later requests reuse cached labels.
+    """
+    
+    def __init__(self, cache_dir: Optional[str] = None, concurrency: Optional[int] = None):
+        """
+        Initialize label store.
+        
+        Args:
+            cache_dir: Directory for cached PDFs (defaults to Config.LABELS_CACHE_DIR)
+            concurrency: Max concurrent batch downloads
+        """
+        self.cache_dir = Path(cache_dir or Config.LABELS_CACHE_DIR)
+        self.concurrency = max(1, concurrency or Config.LABELS_CONCURRENCY)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+    
+    def path(self, posting_number: str) -> Path:
+        """Get cache file path of posting label."""
+        return self.cache_dir / f"{_UNSAFE_NAME.sub('_', posting_number)}.pdf"
+    
+    def link(self, posting_number: str) -> str:
+        """
+        Get "Tasks" sheet value referencing the label of a posting.
+        
+        Returns:
+            HYPERLINK formula if Config.LABELS_PUBLIC_URL is set, otherwise file name
+        """
+        file_name = self.path(posting_number).name
+        if Config.LABELS_PUBLIC_URL:
+            url = f"{Config.LABELS_PUBLIC_URL.rstrip('/')}/{file_name}"
+            return f'=HYPERLINK("{url}"; "{file_name}")'
+        return file_name
+    
+    def get_labels(
+        self,
+        ozon_client: OzonClient,
+        posting_numbers: List[str],
+        on_batch: Optional[Callable[[int, int], None]] = None
+    ) -> Dict[str, Path]:
+        """
+        Get label files of postings, downloading the ones not cached yet.
+        
+        Args:
+            ozon_client: Client of the warehouse the postings belong to
+            posting_numbers: Posting numbers
+            on_batch: Optional callback(done_batches, total_batches)
+        
+        Returns:
+            Dictionary mapping posting_number to label file, in input order;
+            postings whose labels could not be downloaded are missing
+        """
+        posting_numbers = list(dict.fromkeys(number for number in posting_numbers if number))
+        missing = [number for number in posting_numbers if not self.path(number).exists()]
+        CACHE_REQUESTS.inc(len(posting_numbers) - len(missing), cache="labels", result="hit")
+        CACHE_REQUESTS.inc(len(missing), cache="labels", result="miss")
+        
+        if missing:
+            batches = [
+                missing[start:start + PACKAGE_LABEL_BATCH_SIZE]
+                for start in range(0, len(missing), PACKAGE_LABEL_BATCH_SIZE)
+            ]
+            logger.info(
+                f"Downloading {len(missing)} labels in {len(batches)} batches "
+                f"({len(posting_numbers) - len(missing)} cached)"
+            )
+            done = 0
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches))) as executor:
+                for _ in executor.map(bind(lambda batch: self._download_batch(ozon_client, batch)), batches):
+                    done += 1
+                    if on_batch:
+                        on_batch(done, len(batches))
+        
+        labels = {}
+        for number in posting_numbers:
+            path = self.path(number)
+            if path.exists():
+                labels[number] = path
+        return labels
+    
+    def _download_batch(self, ozon_client: OzonClient, batch: List[str]) -> None:
+        """Download one batch and store a PDF per posting (errors are logged)."""
+        try:
+            content = ozon_client.get_package_labels(batch)
+        except Exception as e:
+            logger.error(f"Error downloading labels for {', '.join(batch)}: {e}")
+            return
+        
+        if len(batch) == 1:
+            self._write(batch[0], content)
+            return
+        
+        from pypdf import PdfReader, PdfWriter
+        
+        reader = PdfReader(io.BytesIO(content))
+        if len(reader.pages) != len(batch):
+            # Postings with several boxes get several pages, so pages can't
+            # be matched to postings: fall back to one request per posting
+            logger.warning(
+                f"Label batch returned {len(reader.pages)} pages for "
+                f"{len(batch)} postings, downloading them one by one"
+            )
+            for number in batch:
+                self._download_batch(ozon_client, [number])
+            return
+        
+        for number, page in zip(batch, reader.pages):
+            writer = PdfWriter()
+            writer.add_page(page)
+            buffer = io.BytesIO()
+            writer.write(buffer)
+            self._write(number, buffer.getvalue())
+    
+    def _write(self, posting_number: str, content: bytes) -> None:
+        """Atomically store label PDF in cache."""
+        path = self.path(posting_number)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(content)
+        os.replace(tmp_path, path)
+    
+    @staticmethod
+    def merge(paths: List[Path], title: str = "labels") -> Path:
+        """
+        Merge label files into one printable PDF.
+        
+        Args:
+            paths: Label files in print order
+            title: Base name of the output file
+        
+        Returns:
+            Path to the merged temporary file (caller should delete it)
+        """
+        from pypdf import PdfWriter
+        
+        writer = PdfWriter()
+        for path in paths:
+            writer.append(str(path))
+        
+        safe_title = "".join(ch if ch.isalnum() else "_" for ch in title).strip("_") or "labels"
+        fd, file_path = tempfile.mkstemp(prefix=f"{safe_title}_", suffix=".pdf")
+        with os.fdopen(fd, "wb") as output:
+            writer.write(output)
+        return Path(file_path)
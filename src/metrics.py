@@ -0,0 +1,467 @@
+"""In-process metrics exposed in Prometheus text format."""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple, Iterator
+from .config import Config
+
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets (seconds) shared by all histograms
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    """Escape label value for the text exposition format."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    """Base of metrics with a fixed set of label names."""
+    
+    kind = ""
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        """
+        Initialize metric.
+        
+        Args:
+            name: Metric name
+            documentation: HELP text
+            labelnames: Names of labels every sample has
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        # Values as of the last delta() call
+        self._published: Dict[LabelValues, Any] = {}
+    
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        """Get label values in labelnames order."""
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+    
+    def items(self) -> List[Tuple[Dict[str, str], float]]:
+        """Label sets with their current values."""
+        with self._lock:
+            return [
+                (dict(zip(self.labelnames, key)), value)
+                for key, value in sorted(self._values.items())
+            ]
+    
+    def _format_labels(self, values: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+        """Format label set as {a="1",b="2"}."""
+        pairs = list(zip(self.labelnames, values))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+    
+    def render(self) -> List[str]:
+        """Render metric in Prometheus text exposition format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+    
+    def _samples(self) -> List[str]:
+        """Render sample lines."""
+        raise NotImplementedError
+    
+    def delta(self) -> Dict[str, Any]:
+        """Changes since the previous call as JSON-serializable data (see Registry.collect_delta)."""
+        with self._lock:
+            changes = [
+                [list(key), value - self._published.get(key, 0)]
+                for key, value in self._values.items()
+                if value != self._published.get(key, 0)
+            ]
+            self._published = dict(self._values)
+        return {"values": changes} if changes else {}
+    
+    def apply_delta(self, delta: Dict[str, Any]) -> None:
+        """Add changes made by another process."""
+        with self._lock:
+            for key, value in delta.get("values", []):
+                key = tuple(key)
+                self._values[key] = self._values.get(key, 0) + value
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter."""
+    
+    kind = "counter"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+    
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """Increase counter of the label set."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def get(self, **labels: str) -> float:
+        """Get current value of the label set."""
+        return self._values.get(self._key(labels), 0)
+    
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._format_labels(key)} {value}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down."""
+    
+    kind = "gauge"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+    
+    def set(self, value: float, **labels: str) -> None:
+        """Set value of the label set."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+    
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """Increase value of the label set."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        """Decrease value of the label set."""
+        self.inc(-amount, **labels)
+    
+    def get(self, **labels: str) -> float:
+        """Get current value of the label set."""
+        return self._values.get(self._key(labels), 0)
+    
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._format_labels(key)} {value}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (latencies) in cumulative buckets."""
+    
+    kind = "histogram"
+    
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        window: int = 0
+    ):
+        """
+        Initialize histogram.
+        
+        Args:
+            name: Metric name
+            documentation: HELP text
+            labelnames: Names of labels every sample has
+            buckets: Upper bounds of the buckets
+            window: Number of recent observations kept for percentiles (0 keeps none)
+        """
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [bucket counts..., +Inf count, sum]
+        self._values: Dict[LabelValues, List[float]] = {}
+        # Ring buffer of (monotonic time, value) for sliding-window percentiles
+        self._recent: Optional[Deque[Tuple[float, float]]] = deque(maxlen=window) if window else None
+        # Observations added to the ring buffer in total and as of the last delta() call
+        self._observed = 0
+        self._published_observed = 0
+    
+    def observe(self, value: float, **labels: str) -> None:
+        """Record one observation."""
+        key = self._key(labels)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = [0] * (len(self.buckets) + 2)
+                self._values[key] = data
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[index] += 1
+                    break
+            else:
+                data[len(self.buckets)] += 1
+            data[-1] += value
+            if self._recent is not None:
+                self._recent.append((time.monotonic(), value))
+                self._observed += 1
+    
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe duration of the with-block (also when it raises)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+    
+    def percentiles(self, seconds: float, quantiles: Sequence[float] = (0.5, 0.95)) -> Tuple[int, List[float]]:
+        """
+        Percentiles of values observed in the last seconds (over all labels).
+        
+        Args:
+            seconds: Window length
+            quantiles: Requested quantiles (0..1)
+        
+        Returns:
+            Number of observations in the window and one value per quantile
+            (empty list if there were none)
+        """
+        if self._recent is None:
+            return 0, []
+        since = time.monotonic() - seconds
+        with self._lock:
+            values = sorted(value for stamp, value in self._recent if stamp >= since)
+        if not values:
+            return 0, []
+        return len(values), [
+            values[min(len(values) - 1, int(quantile * len(values)))] for quantile in quantiles
+        ]
+    
+    def delta(self) -> Dict[str, Any]:
+        """Changes since the previous call, with the new observations for percentiles."""
+        with self._lock:
+            changes = []
+            for key, data in self._values.items():
+                published = self._published.get(key) or [0] * len(data)
+                diff = [value - old for value, old in zip(data, published)]
+                if any(diff):
+                    changes.append([list(key), diff])
+            self._published = {key: list(data) for key, data in self._values.items()}
+            recent = []
+            if self._recent is not None:
+                new = min(self._observed - self._published_observed, len(self._recent))
+                recent = list(self._recent)[len(self._recent) - new:]
+                self._published_observed = self._observed
+        result: Dict[str, Any] = {}
+        if changes:
+            result["values"] = changes
+        if recent:
+            result["recent"] = recent
+        return result
+    
+    def apply_delta(self, delta: Dict[str, Any]) -> None:
+        """Add changes made by another process (its monotonic clock is the same on Linux)."""
+        with self._lock:
+            for key, diff in delta.get("values", []):
+                key = tuple(key)
+                data = self._values.get(key)
+                if data is None:
+                    data = [0] * (len(self.buckets) + 2)
+                    self._values[key] = data
+                for index, value in enumerate(diff[:len(data)]):
+                    data[index] += value
+            if self._recent is not None:
+                self._recent.extend(tuple(entry) for entry in delta.get("recent", []))
+    
+    def count(self, **labels: str) -> int:
+        """Get number of observations of the label set."""
+        data = self._values.get(self._key(labels))
+        return int(sum(data[:-1])) if data else 0
+    
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(data)) for key, data in self._values.items())
+        lines = []
+        for key, data in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, data):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{self._format_labels(key, ('le', repr(float(bound))))} {cumulative}"
+                )
+            cumulative += data[len(self.buckets)]
+            lines.append(f"{self.name}_bucket{self._format_labels(key, ('le', '+Inf'))} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {data[-1]}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together."""
+    
+    def __init__(self):
+        """Initialize empty registry."""
+        self._metrics: List[_Metric] = []
+    
+    def register(self, metric: _Metric) -> _Metric:
+        """Add metric to the registry."""
+        self._metrics.append(metric)
+        return metric
+    
+    def collect_delta(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Changes of all metrics since the previous call.
+        
+        Worker processes publish them through the work queue, the
+        front-end adds them with apply_delta(), so /metrics and /stats
+        cover jobs run by workers too.
+        
+        Returns:
+            Dictionary mapping metric name to its changes (unchanged metrics are left out)
+        """
+        deltas = {}
+        for metric in self._metrics:
+            delta = metric.delta()
+            if delta:
+                deltas[metric.name] = delta
+        return deltas
+    
+    def apply_delta(self, deltas: Dict[str, Dict[str, Any]]) -> None:
+        """Add changes collected by collect_delta() in another process."""
+        metrics = {metric.name: metric for metric in self._metrics}
+        for name, delta in deltas.items():
+            metric = metrics.get(name)
+            if metric is not None:
+                metric.apply_delta(delta)
+    
+    def render(self) -> str:
+        """Render all metrics in Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def timed(histogram: Histogram, **labels: str):
+    """Decorator observing call duration of a function in histogram."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Ozon API
+OZON_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "ozonbot_ozon_request_seconds",
+    "Duration of Ozon API requests (one posting list page or label batch)",
+    ["endpoint", "status"],
+    window=Config.STATS_WINDOW_SIZE
+))
+OZON_RETRIES = REGISTRY.register(Counter(
+    "ozonbot_ozon_retries_total",
+    "Retried Ozon API requests",
+    ["reason"]
+))
+OZON_RATE_LIMITED = REGISTRY.register(Counter(
+    "ozonbot_ozon_rate_limited_total",
+    "Ozon API responses with HTTP 429",
+))
+OZON_LIMITER_WAIT_SECONDS = REGISTRY.register(Counter(
+    "ozonbot_ozon_limiter_wait_seconds_total",
+    "Time spent waiting for the per-client_id rate limiter",
+))
+
+# Processing
+PARSE_SECONDS = REGISTRY.register(Histogram(
+    "ozonbot_parse_seconds",
+    "Duration of parsing and shelf-ordering a batch of postings",
+    ["mode"]
+))
+
+# Google Sheets
+SHEETS_CALL_SECONDS = REGISTRY.register(Histogram(
+    "ozonbot_sheets_call_seconds",
+    "Duration of SheetsManager calls",
+    ["operation"],
+    window=Config.STATS_WINDOW_SIZE
+))
+
+# Telegram
+TELEGRAM_SEND_SECONDS = REGISTRY.register(Histogram(
+    "ozonbot_telegram_send_seconds",
+    "Duration of Telegram send calls",
+    ["method"],
+    window=Config.STATS_WINDOW_SIZE
+))
+TELEGRAM_RATE_LIMITED = REGISTRY.register(Counter(
+    "ozonbot_telegram_rate_limited_total",
+    "Telegram send calls rejected with RetryAfter (429)",
+))
+MESSAGES_DROPPED = REGISTRY.register(Counter(
+    "ozonbot_messages_dropped_total",
+    "Product messages that could not be sent",
+    ["reason"]
+))
+
+# Caches and queues
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "ozonbot_cache_requests_total",
+    "Cache lookups by cache and result (hit/miss)",
+    ["cache", "result"]
+))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "ozonbot_queue_depth",
+    "Items waiting in pipeline queues (sum over running pipelines)",
+    ["queue"]
+))
+ACTIVE_JOBS = REGISTRY.register(Gauge(
+    "ozonbot_active_jobs",
+    "Running background warehouse jobs",
+))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Serves REGISTRY on /metrics."""
+    
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        logger.debug("Metrics request: " + format % args)
+
+
+def start_metrics_server(port: Optional[int] = None, addr: Optional[str] = None) -> Optional[ThreadingHTTPServer]:
+    """
+    Serve metrics on http://addr:port/metrics from a daemon thread.
+    
+    Args:
+        port: Listen port (defaults to Config.METRICS_PORT, 0 disables the endpoint)
+        addr: Listen address (defaults to Config.METRICS_ADDR)
+    
+    Returns:
+        Running server or None if disabled
+    """
+    port = Config.METRICS_PORT if port is None else port
+    addr = addr or Config.METRICS_ADDR
+    if not port:
+        return None
+    server = ThreadingHTTPServer((addr, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Metrics endpoint: http://{addr}:{server.server_port}/metrics")
+    return server
@@ -1,28 +1,53 @@
 """Ozon API client for fetching shipping postings."""
 import logging
+import threading
 import time
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, Callable, Iterable, Tuple, TYPE_CHECKING
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
+from .config import Config
+from .rate_limit import CircuitOpenError, get_breaker, get_limiter
+from .metrics import OZON_REQUEST_SECONDS, OZON_RETRIES, OZON_RATE_LIMITED, OZON_LIMITER_WAIT_SECONDS
+from .tracing import span
+from .utils import LogSampler
+
+if TYPE_CHECKING:
+    from .catalog import ProductCatalog
 
 
 logger = logging.getLogger(__name__)
 
-OZON_API_BASE_URL = "https://api-seller.ozon.ru"
+# Max postings per package-label request allowed by Ozon
+PACKAGE_LABEL_BATCH_SIZE = 20
+
+# Decides which posting list pages are logged at INFO level
+_page_log_sampler = LogSampler(Config.LOG_PAGE_SAMPLE)
+
+
+class _CountingRetry(Retry):
+    """Retry strategy that reports transport-level retries to metrics."""
+    
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        status = getattr(response, "status", None)
+        if status == 429:
+            OZON_RATE_LIMITED.inc()
+        OZON_RETRIES.inc(reason=str(status) if status else type(error).__name__)
+        return super().increment(method, url, response, error, _pool, _stacktrace)
 
 
 class OzonClient:
     """Client for interacting with Ozon Seller API."""
     
-    def __init__(self, client_id: str, api_key: str):
+    def __init__(self, client_id: str, api_key: str, base_url: Optional[str] = None):
         """
         Initialize Ozon API client.
         
         Args:
             client_id: Ozon client identifier
             api_key: Ozon API key
+            base_url: API base URL (defaults to Config.OZON_API_BASE_URL)
         """
         # Ensure client_id and api_key are strings
         self.client_id = str(client_id)
@@ -32,10 +57,14 @@ class OzonClient:
             "Api-Key": str(api_key),
             "Content-Type": "application/json"
         }
+        self.base_url = (base_url or Config.OZON_API_BASE_URL).rstrip("/")
+        # Shared by all clients of the same seller account
+        self.limiter = get_limiter(self.client_id)
+        self.breaker = get_breaker(self.client_id)
         
         # Create session with retry strategy
         self.session = requests.Session()
-        retry_strategy = Retry(
+        retry_strategy = _CountingRetry(
             total=3,
             backoff_factor=2,
             status_forcelist=[429, 500, 502, 503, 504],
@@ -43,6 +72,60 @@ class OzonClient:
         )
         adapter = HTTPAdapter(max_retries=retry_strategy)
         self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+    
+    def _post(self, endpoint: str, url: str, payload: Dict[str, Any]) -> requests.Response:
+        """
+        Send rate-limited POST request and record its latency.
+        
+        Args:
+            endpoint: Endpoint name for metrics
+            url: Request URL
+            payload: JSON body
+        
+        Returns:
+            Response (status is not checked)
+        
+        Raises:
+            CircuitOpenError: If requests of this client_id are suspended
+        """
+        with span("ozon.request", endpoint=endpoint, client_id=self.client_id) as request_span:
+            if not self.breaker.allow():
+                request_span.set_attribute("status", "circuit_open")
+                raise CircuitOpenError(
+                    f"Ozon API недоступен для Client-Id {self.client_id}: после "
+                    f"{self.breaker.failures} ошибок подряд запросы приостановлены "
+                    f"на {self.breaker.retry_in():.0f} с."
+                )
+            waited = self.limiter.acquire()
+            OZON_LIMITER_WAIT_SECONDS.inc(waited)
+            request_span.set_attribute("limiter_wait_ms", round(waited * 1000, 1))
+            started = time.perf_counter()
+            status = "error"
+            try:
+                # Use tuple for timeout: (connect_timeout, read_timeout)
+                response = self.session.post(
+                    url,
+                    json=payload,
+                    headers=self.headers,
+                    timeout=(Config.OZON_CONNECT_TIMEOUT, Config.OZON_READ_TIMEOUT)
+                )
+                status = str(response.status_code)
+                if response.status_code == 429:
+                    OZON_RATE_LIMITED.inc()
+                if response.status_code == 429 or response.status_code >= 500:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                return response
+            except requests.exceptions.RequestException:
+                self.breaker.record_failure()
+                raise
+            finally:
+                request_span.set_attribute("status", status)
+                OZON_REQUEST_SECONDS.observe(
+                    time.perf_counter() - started, endpoint=endpoint, status=status
+                )
     
     def get_postings(
         self,
@@ -63,7 +146,7 @@ class OzonClient:
         Returns:
             API response with postings data
         """
-        url = f"{OZON_API_BASE_URL}/v1/assembly/fbs/posting/list"
+        url = f"{self.base_url}/v1/assembly/fbs/posting/list"
         
         # Default filter if none provided
         # API requires BOTH cutoff_from and cutoff_to
@@ -117,48 +200,48 @@ class OzonClient:
         
         # Retry logic with exponential backoff
         max_retries = 3
+        # Per-page messages are sampled, retries are always logged
+        log_page = _page_log_sampler()
         for attempt in range(max_retries):
             try:
-                logger.info(
-                    f"Fetching postings from Ozon API "
-                    f"(limit={limit}, attempt={attempt + 1}/{max_retries})"
-                )
-                logger.info(
-                    f"Filter: cutoff_from={filter_dict.get('cutoff_from')}, "
-                    f"cutoff_to={filter_dict.get('cutoff_to', 'not set')}"
-                )
-                logger.debug(f"Request payload: {payload}")
-                logger.debug(f"Request headers: {dict(self.headers)}")
+                if log_page or attempt:
+                    logger.info(
+                        "Fetching postings from Ozon API (limit=%s, attempt=%s/%s, "
+                        "cutoff_from=%s, cutoff_to=%s, delivery_method_ids=%s, warehouse_ids=%s)",
+                        limit,
+                        attempt + 1,
+                        max_retries,
+                        filter_dict.get("cutoff_from"),
+                        filter_dict.get("cutoff_to", "not set"),
+                        filter_dict.get("delivery_method_ids", "any"),
+                        filter_dict.get("warehouse_ids", "any")
+                    )
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Request payload: %s", payload)
+                    logger.debug("Request headers: %s", {**self.headers, "Api-Key": "***"})
                 
-                # Use tuple for timeout: (connect_timeout, read_timeout)
-                # Increased timeouts: 30s connect, 120s read
-                response = self.session.post(
-                    url,
-                    json=payload,
-                    headers=self.headers,
-                    timeout=(30, 120)
-                )
+                response = self._post("posting_list", url, payload)
                 response.raise_for_status()
                 
                 data = response.json()
-                logger.info(
-                    f"Successfully fetched postings. "
-                    f"Got {len(data.get('postings', []))} postings"
-                )
+                if log_page or attempt:
+                    logger.info(
+                        "Successfully fetched postings. Got %d postings",
+                        len(data.get("postings", []))
+                    )
                 return data
                 
             except requests.exceptions.Timeout as e:
                 if attempt < max_retries - 1:
                     wait_time = 2 ** attempt  # Exponential backoff: 1s, 2s, 4s
+                    OZON_RETRIES.inc(reason="timeout")
                     logger.warning(
-                        f"Timeout on attempt {attempt + 1}/{max_retries}. "
-                        f"Retrying in {wait_time}s..."
+                        "Timeout on attempt %s/%s. Retrying in %ss...",
+                        attempt + 1, max_retries, wait_time
                     )
                     time.sleep(wait_time)
                 else:
-                    logger.error(
-                        f"Timeout error after {max_retries} attempts: {e}"
-                    )
+                    logger.error("Timeout error after %s attempts: %s", max_retries, e)
                     raise requests.exceptions.RequestException(
                         f"Request timeout after {max_retries} attempts. "
                         "Проверьте интернет-соединение или попробуйте позже."
@@ -168,20 +251,18 @@ class OzonClient:
                 # Don't retry on 4xx errors (client errors)
                 if hasattr(e, 'response') and e.response is not None:
                     status = e.response.status_code
-                    logger.error(
-                        f"HTTP {status} error from Ozon API: {e}"
-                    )
+                    logger.error("HTTP %s error from Ozon API: %s", status, e)
                     try:
                         error_body = e.response.text
-                        logger.error(f"Response body: {error_body}")
+                        logger.error("Response body: %s", error_body)
                         # Try to parse JSON error response
                         try:
                             error_json = e.response.json()
-                            logger.error(f"Error details: {error_json}")
+                            logger.error("Error details: %s", error_json)
                         except:
                             pass
                     except Exception as parse_error:
-                        logger.error(f"Could not read error response: {parse_error}")
+                        logger.error("Could not read error response: %s", parse_error)
                     
                     # Raise with more context
                     if status == 400:
@@ -209,82 +290,260 @@ class OzonClient:
                     # Retry on server errors
                     if status and status >= 500:
                         wait_time = 2 ** attempt
+                        OZON_RETRIES.inc(reason=str(status))
                         logger.warning(
-                            f"Server error {status} on attempt "
-                            f"{attempt + 1}/{max_retries}. "
-                            f"Retrying in {wait_time}s..."
+                            "Server error %s on attempt %s/%s. Retrying in %ss...",
+                            status, attempt + 1, max_retries, wait_time
                         )
                         time.sleep(wait_time)
                         continue
                 
-                logger.error(f"Error fetching postings from Ozon API: {e}")
+                logger.error("Error fetching postings from Ozon API: %s", e)
                 if hasattr(e, 'response') and e.response is not None:
-                    logger.error(f"Response status: {e.response.status_code}")
+                    logger.error("Response status: %s", e.response.status_code)
                     try:
-                        logger.error(f"Response body: {e.response.text}")
+                        logger.error("Response body: %s", e.response.text)
                     except:
                         pass
                 raise
     
-    def get_all_postings(
+    @staticmethod
+    def build_filter(
+        days_back: int = 30,
+        days_ahead: int = 0,
+        delivery_method_ids: Optional[List[int]] = None,
+        warehouse_ids: Optional[List[int]] = None,
+        provider_ids: Optional[List[int]] = None
+    ) -> Dict[str, Any]:
+        """
+        Build posting list filter so that Ozon returns only relevant postings.
+        
+        Args:
+            days_back: cutoff_from is this many days before now
+            days_ahead: cutoff_to is the end of the day this many days after today
+            delivery_method_ids: Only postings with these delivery methods
+            warehouse_ids: Only postings of these Ozon warehouses
+            provider_ids: Only postings of these delivery providers
+            
+        Returns:
+            Filter dictionary for get_postings
+        """
+        now = datetime.utcnow()
+        filter_dict: Dict[str, Any] = {
+            "cutoff_from": (now - timedelta(days=days_back)).strftime(
+                "%Y-%m-%dT%H:%M:%S.000Z"
+            ),
+            "cutoff_to": (now + timedelta(days=days_ahead)).replace(
+                hour=23, minute=59, second=59, microsecond=999000
+            ).strftime("%Y-%m-%dT%H:%M:%S.999Z")
+        }
+        # Empty lists are not sent, Ozon treats a missing field as "any"
+        if delivery_method_ids:
+            filter_dict["delivery_method_ids"] = list(delivery_method_ids)
+        if warehouse_ids:
+            filter_dict["warehouse_ids"] = list(warehouse_ids)
+        if provider_ids:
+            filter_dict["provider_ids"] = list(provider_ids)
+        return filter_dict
+    
+    @classmethod
+    def filter_for_warehouse(cls, warehouse: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Build posting list filter from optional "Ozon" sheet columns of a warehouse.
+        
+        Args:
+            warehouse: Warehouse config from SheetsManager.get_warehouses
+            
+        Returns:
+            Filter dictionary for get_postings
+        """
+        days_back = warehouse.get("days_back")
+        days_ahead = warehouse.get("days_ahead")
+        return cls.build_filter(
+            days_back=30 if days_back is None else days_back,
+            days_ahead=0 if days_ahead is None else days_ahead,
+            delivery_method_ids=warehouse.get("delivery_method_ids"),
+            warehouse_ids=warehouse.get("ozon_warehouse_ids"),
+            provider_ids=warehouse.get("provider_ids")
+        )
+    
+    def iter_pages(
         self,
         filter_dict: Optional[Dict[str, Any]] = None,
-        sort_dir: str = "ASC"
-    ) -> List[Dict[str, Any]]:
+        sort_dir: str = "ASC",
+        on_page: Optional[Callable[[int, int], None]] = None
+    ) -> Iterator[List[Dict[str, Any]]]:
         """
-        Fetch all postings using pagination.
+        Iterate over pages of postings following the pagination cursor.
         
         Args:
             filter_dict: Filter parameters
             sort_dir: Sort direction (ASC or DESC)
+            on_page: Optional callback called after each page with
+                (page number, total postings fetched so far)
             
-        Returns:
-            List of all postings
+        Yields:
+            Lists of posting objects, one list per API page
         """
-        all_postings = []
         cursor = None
+        total = 0
+        page = 0
         
         while True:
-            response = self.get_postings(
-                filter_dict=filter_dict,
-                limit=1000,
-                cursor=cursor,
-                sort_dir=sort_dir
-            )
+            with span("ozon.page", client_id=self.client_id, page=page + 1) as page_span:
+                response = self.get_postings(
+                    filter_dict=filter_dict,
+                    limit=1000,
+                    cursor=cursor,
+                    sort_dir=sort_dir
+                )
+                page_span.set_attribute("postings", len(response.get("postings", [])))
             
             postings = response.get("postings", [])
-            all_postings.extend(postings)
+            page += 1
+            total += len(postings)
+            if on_page:
+                on_page(page, total)
+            if postings:
+                yield postings
             
             cursor = response.get("cursor", "")
             # Stop if cursor is empty or no more postings
             if not cursor or cursor == "" or not postings:
                 break
         
-        logger.info(f"Fetched {len(all_postings)} total postings across all pages")
-        return all_postings
+        logger.info("Fetched %d total postings across all pages", total)
+    
+    def iter_postings(
+        self,
+        filter_dict: Optional[Dict[str, Any]] = None,
+        sort_dir: str = "ASC",
+        on_page: Optional[Callable[[int, int], None]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over all postings page by page without keeping them in memory.
+        
+        Args:
+            filter_dict: Filter parameters
+            sort_dir: Sort direction (ASC or DESC)
+            on_page: Optional per-page progress callback (see iter_pages)
+            
+        Yields:
+            Single posting objects in API order
+        """
+        for postings in self.iter_pages(filter_dict, sort_dir, on_page):
+            yield from postings
+    
+    def get_all_postings(
+        self,
+        filter_dict: Optional[Dict[str, Any]] = None,
+        sort_dir: str = "ASC",
+        on_page: Optional[Callable[[int, int], None]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Fetch all postings using pagination.
+        
+        Args:
+            filter_dict: Filter parameters
+            sort_dir: Sort direction (ASC or DESC)
+            on_page: Optional per-page progress callback (see iter_postings)
+            
+        Returns:
+            List of all postings
+        """
+        return list(self.iter_postings(
+            filter_dict=filter_dict,
+            sort_dir=sort_dir,
+            on_page=on_page
+        ))
+    
+    def get_package_labels(self, posting_numbers: List[str]) -> bytes:
+        """
+        Download package labels of postings as one PDF.
+        
+        Args:
+            posting_numbers: Up to PACKAGE_LABEL_BATCH_SIZE posting numbers
+        
+        Returns:
+            PDF file content
+        """
+        if len(posting_numbers) > PACKAGE_LABEL_BATCH_SIZE:
+            raise ValueError(
+                f"At most {PACKAGE_LABEL_BATCH_SIZE} postings per label request, "
+                f"got {len(posting_numbers)}"
+            )
+        
+        url = f"{self.base_url}/v2/posting/fbs/package-label"
+        logger.info("Fetching package labels for %d postings", len(posting_numbers))
+        response = self._post("package_label", url, {"posting_number": list(posting_numbers)})
+        if response.status_code >= 400:
+            logger.error(
+                "HTTP %s error fetching package labels: %s",
+                response.status_code, response.text[:500]
+            )
+        response.raise_for_status()
+        return response.content
+    
+    def iter_products(
+        self,
+        filter_dict: Optional[Dict[str, Any]] = None,
+        catalog: Optional["ProductCatalog"] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over parsed products of all postings page by page.
+        
+        Args:
+            filter_dict: Filter parameters
+            catalog: Optional product catalog resolving repeated SKUs
+            
+        Yields:
+            Product dictionaries with posting context
+        """
+        for posting in self.iter_postings(filter_dict=filter_dict):
+            yield from self.parse_posting_products(posting, catalog)
     
-    def parse_posting_products(self, posting: Dict[str, Any]) -> List[Dict[str, Any]]:
+    @staticmethod
+    def parse_posting_products(
+        posting: Dict[str, Any],
+        catalog: Optional["ProductCatalog"] = None
+    ) -> List[Dict[str, Any]]:
         """
         Parse posting and extract product data for each product.
         
         Args:
             posting: Single posting object from API response
+            catalog: Optional product catalog resolving repeated SKUs
             
         Returns:
-            List of product dictionaries with posting context
+            List of product dictionaries with posting context (with catalog,
+            also "sort_key" precomputed by the default sort-key engine)
         """
         posting_number = posting.get("posting_number", "")
         products = posting.get("products", [])
+        posting_number = str(posting_number) if posting_number else ""
         
         parsed_products = []
         for product in products:
+            if catalog is not None:
+                entry = catalog.resolve(product)
+                parsed_products.append({
+                    "posting_number": posting_number,
+                    "picture_url": entry.picture_url,
+                    "product_name": entry.product_name,
+                    "sku": entry.sku,
+                    "quantity": int(product.get("quantity", 0)),
+                    "offer_id": entry.offer_id,
+                    "sort_key": entry.sort_key
+                })
+                continue
+            
             # Convert SKU to string for consistency
             sku = product.get("sku", "")
             if sku is not None:
                 sku = str(sku)
             
             parsed_product = {
-                "posting_number": str(posting_number) if posting_number else "",
+                "posting_number": posting_number,
                 "picture_url": str(product.get("picture_url", "")),
                 "product_name": str(product.get("product_name", "")),
                 "sku": sku,
@@ -295,3 +554,46 @@ class OzonClient:
         
         return parsed_products
 
+
+# (client_id, api_key) -> client, reused so connections to Ozon are kept alive
+_clients: Dict[Tuple[str, str], OzonClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(client_id: str, api_key: str) -> OzonClient:
+    """
+    Get shared client (and its connection pool) for Ozon credentials.
+    
+    Args:
+        client_id: Ozon client identifier
+        api_key: Ozon API key
+    
+    Returns:
+        OzonClient for the credentials and the current OZON_API_BASE_URL
+    """
+    key = (str(client_id), str(api_key))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None or client.base_url != Config.OZON_API_BASE_URL.rstrip("/"):
+            client = OzonClient(client_id, api_key)
+            _clients[key] = client
+        return client
+
+
+def invalidate_clients(keep: Optional[Iterable[Tuple[str, str]]] = None) -> int:
+    """
+    Drop shared clients, closing their connection pools.
+    
+    Args:
+        keep: (client_id, api_key) pairs to keep (None drops all)
+    
+    Returns:
+        Number of dropped clients
+    """
+    keep = {(str(client_id), str(api_key)) for client_id, api_key in keep} if keep is not None else set()
+    with _clients_lock:
+        dropped = [key for key in _clients if key not in keep]
+        clients = [_clients.pop(key) for key in dropped]
+    for client in clients:
+        client.session.close()
+    return len(clients)
@@ -0,0 +1,231 @@
+"""Overlapped fetch -> parse -> write -> send pipeline for warehouse runs."""
+import asyncio
+import logging
+import queue
+import threading
+from typing import Dict, Any, Optional, Callable, Awaitable
+from .config import Config
+from .ozon_client import OzonClient
+from .sheets_manager import SheetsManager
+from .sort_keys import ShelfBuckets
+from .catalog import ProductCatalog
+from .metrics import MESSAGES_DROPPED, PARSE_SECONDS, QUEUE_DEPTH
+from .tracing import bind
+
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a stream in pipeline queues
+_DONE = object()
+
+
+class StreamingPipeline:
+    """
+    Processes a warehouse as concurrent stages connected by bounded queues.
+    
+    The Ozon pages are downloaded in a worker thread while earlier pages are
+    already parsed, written to "Tasks" and sent to the chat. Full queues
+    block the previous stage (backpressure), so at most a few pages are held
+    in memory. Products are ordered by shelf within each page only.
+    """
+    
+    def __init__(
+        self,
+        ozon_client: OzonClient,
+        sheets_manager: SheetsManager,
+        warehouse_name: str,
+        send_product: Callable[[Dict[str, Any]], Awaitable[None]],
+        progress: Optional[Callable[[str], None]] = None,
+        queue_size: Optional[int] = None,
+        filter_dict: Optional[Dict[str, Any]] = None,
+        catalog: Optional[ProductCatalog] = None
+    ):
+        """
+        Initialize pipeline.
+        
+        Args:
+            ozon_client: Client of the warehouse
+            sheets_manager: Sheets manager for "Tasks"/"ProcessedOrders" writes
+            warehouse_name: Name of the warehouse
+            send_product: Coroutine sending one product to the chat
+            progress: Optional progress callback (may raise to cancel)
+            queue_size: Max batches waiting between stages
+            filter_dict: Ozon posting list filter
+            catalog: Optional product catalog resolving repeated SKUs
+        """
+        self.ozon_client = ozon_client
+        self.sheets_manager = sheets_manager
+        self.warehouse_name = warehouse_name
+        self.send_product = send_product
+        self.progress = progress or (lambda text: None)
+        self.filter_dict = filter_dict
+        self.catalog = catalog
+        queue_size = max(1, queue_size or Config.PIPELINE_QUEUE_SIZE)
+        
+        # Thread -> loop handoff of raw pages, then asyncio queues of batches
+        self.page_queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self.write_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.send_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        
+        self.stats = {
+            "pages": 0,
+            "postings": set(),
+            "parsed": 0,
+            "products": 0,
+            "rows_written": 0,
+            "write_errors": 0,
+            "messages_sent": 0,
+        }
+    
+    async def run(self) -> Dict[str, Any]:
+        """
+        Run all stages until every product is written and sent.
+        
+        Returns:
+            Statistics: pages, postings (set), parsed, products,
+            rows_written, write_errors, messages_sent
+        """
+        fetch_thread = threading.Thread(
+            target=bind(self._fetch_pages),
+            name=f"fetch-{self.warehouse_name}",
+            daemon=True
+        )
+        fetch_thread.start()
+        
+        tasks = [
+            asyncio.ensure_future(self._parse_stage()),
+            asyncio.ensure_future(self._write_stage()),
+            asyncio.ensure_future(self._send_stage()),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # Stop the producer thread and remaining stages on error/cancel
+            self._stop.set()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # Items left behind after an error/cancel are no longer waiting
+            QUEUE_DEPTH.dec(self.page_queue.qsize(), queue="pages")
+            QUEUE_DEPTH.dec(self.write_queue.qsize(), queue="write")
+            QUEUE_DEPTH.dec(self.send_queue.qsize(), queue="send")
+        
+        return self.stats
+    
+    def _put_page(self, item: Any) -> bool:
+        """Put item into page queue waiting for free space (thread side)."""
+        while not self._stop.is_set():
+            try:
+                self.page_queue.put(item, timeout=0.5)
+                QUEUE_DEPTH.inc(queue="pages")
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def _get_page(self) -> Any:
+        """Take next item from page queue (runs in a worker thread)."""
+        while not self._stop.is_set():
+            try:
+                item = self.page_queue.get(timeout=0.5)
+                QUEUE_DEPTH.dec(queue="pages")
+                return item
+            except queue.Empty:
+                continue
+        return _DONE
+    
+    def _fetch_pages(self) -> None:
+        """Download pages in a worker thread and hand them to the loop."""
+        try:
+            for postings in self.ozon_client.iter_pages(filter_dict=self.filter_dict):
+                if not self._put_page(postings):
+                    return
+        except Exception as e:
+            # Re-raised by the parse stage in the event loop
+            self._put_page(e)
+        finally:
+            self._put_page(_DONE)
+    
+    async def _parse_stage(self) -> None:
+        """Parse pages into shelf-ordered product batches."""
+        try:
+            while True:
+                item = await asyncio.to_thread(self._get_page)
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                
+                self.stats["pages"] += 1
+                with PARSE_SECONDS.time(mode="streaming"):
+                    buckets = ShelfBuckets()
+                    posting_numbers = []
+                    for posting in item:
+                        products = OzonClient.parse_posting_products(posting, self.catalog)
+                        self.stats["parsed"] += len(products)
+                        buckets.extend(products)
+                        if posting.get("posting_number"):
+                            posting_numbers.append(posting["posting_number"])
+                
+                    products = buckets.pop_all()
+                self.stats["postings"].update(posting_numbers)
+                self.stats["products"] += len(products)
+                self.progress(
+                    f"страница {self.stats['pages']}, "
+                    f"товаров: {self.stats['products']}, "
+                    f"отправлено: {self.stats['messages_sent']}"
+                )
+                
+                batch = {"products": products, "posting_numbers": posting_numbers}
+                await self.write_queue.put(batch)
+                QUEUE_DEPTH.inc(queue="write")
+                await self.send_queue.put(batch)
+                QUEUE_DEPTH.inc(queue="send")
+        finally:
+            # Let downstream stages finish what they already have
+            for name, stage_queue in (("write", self.write_queue), ("send", self.send_queue)):
+                try:
+                    stage_queue.put_nowait(_DONE)
+                except asyncio.QueueFull:
+                    await stage_queue.put(_DONE)
+                QUEUE_DEPTH.inc(queue=name)
+    
+    async def _write_stage(self) -> None:
+        """Write product batches to "Tasks" and log their postings."""
+        while True:
+            batch = await self.write_queue.get()
+            QUEUE_DEPTH.dec(queue="write")
+            if batch is _DONE:
+                break
+            if batch["products"]:
+                success = await asyncio.to_thread(
+                    self.sheets_manager.add_to_tasks,
+                    batch["products"],
+                    self.warehouse_name
+                )
+                if success:
+                    self.stats["rows_written"] += len(batch["products"])
+                else:
+                    self.stats["write_errors"] += len(batch["products"])
+            if batch["posting_numbers"]:
+                await asyncio.to_thread(
+                    self.sheets_manager.log_processed_orders,
+                    {self.warehouse_name: batch["posting_numbers"]}
+                )
+    
+    async def _send_stage(self) -> None:
+        """Send products of each batch as soon as the batch is parsed."""
+        while True:
+            batch = await self.send_queue.get()
+            QUEUE_DEPTH.dec(queue="send")
+            if batch is _DONE:
+                break
+            for product in batch["products"]:
+                try:
+                    await self.send_product(product)
+                    self.stats["messages_sent"] += 1
+                except Exception as e:
+                    logger.error("Error sending product message: %s", e, exc_info=True)
+                    MESSAGES_DROPPED.inc(reason=type(e).__name__)
+                    # Continue with next product even if one fails
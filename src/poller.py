@@ -0,0 +1,187 @@
+"""Scheduled background polling of all warehouses."""
+import asyncio
+import logging
+import time
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+from telegram.ext import ContextTypes
+from .config import Config
+from .ozon_client import OzonClient, get_client
+from .sheets_manager import SheetsManager
+from .state_store import StateStore
+from .catalog import ProductCatalog
+from .metrics import CACHE_REQUESTS, PARSE_SECONDS
+from .tracing import start_trace
+from .sort_keys import ShelfBuckets
+
+
+logger = logging.getLogger(__name__)
+
+# deliver(warehouse_name, chat_ids, products, posting_numbers)
+DeliverCallback = Callable[[str, List[str], List[Dict[str, Any]], List[str]], Awaitable[None]]
+
+
+class PostingPoller:
+    """Polls every warehouse on an interval and pushes only new postings."""
+    
+    def __init__(
+        self,
+        sheets_manager: SheetsManager,
+        state_store: StateStore,
+        deliver: DeliverCallback,
+        interval: Optional[int] = None,
+        catalog: Optional[ProductCatalog] = None
+    ):
+        """
+        Initialize poller.
+        
+        Args:
+            sheets_manager: Sheets manager for warehouse/access configs
+            state_store: Store of already delivered postings
+            deliver: Coroutine delivering new products to chats and marking their postings delivered
+            interval: Polling interval in seconds (0 disables polling)
+            catalog: Optional product catalog resolving repeated SKUs
+        """
+        self.sheets_manager = sheets_manager
+        self.state_store = state_store
+        self.deliver = deliver
+        self.interval = Config.POLL_INTERVAL_SECONDS if interval is None else interval
+        self.catalog = catalog
+        self.cache_ttl = Config.POLL_CACHE_TTL_SECONDS or self.interval * 2
+        # warehouse_name -> {"postings": [...], "fetched_at": monotonic time}
+        self.cache: Dict[str, Dict[str, Any]] = {}
+    
+    def apply_config(self) -> None:
+        """Re-read POLL_* settings (after a configuration reload)."""
+        self.interval = Config.POLL_INTERVAL_SECONDS
+        self.cache_ttl = Config.POLL_CACHE_TTL_SECONDS or self.interval * 2
+    
+    def forget(self, warehouse_name: str) -> None:
+        """Drop cached postings of a warehouse (e.g. its credentials changed)."""
+        self.cache.pop(warehouse_name, None)
+    
+    @property
+    def enabled(self) -> bool:
+        """Check if scheduled polling is enabled."""
+        return self.interval > 0
+    
+    def fetch_postings(
+        self,
+        warehouse: Dict[str, str],
+        on_page: Optional[Callable[[int, int], None]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Fetch all postings for warehouse and store them in cache (blocking).
+        
+        Args:
+            warehouse: Warehouse config from "Ozon" sheet
+            on_page: Optional per-page progress callback
+        
+        Returns:
+            List of postings
+        """
+        ozon_client = get_client(
+            client_id=warehouse["client_id"],
+            api_key=warehouse["api_key"]
+        )
+        postings = ozon_client.get_all_postings(
+            filter_dict=OzonClient.filter_for_warehouse(warehouse),
+            on_page=on_page
+        )
+        self.cache[warehouse["warehouse_name"]] = {
+            "postings": postings,
+            "fetched_at": time.monotonic()
+        }
+        return postings
+    
+    def get_cached_postings(self, warehouse_name: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get postings from the last poll if they are still fresh.
+        
+        Args:
+            warehouse_name: Name of the warehouse
+        
+        Returns:
+            Cached postings or None if polling is disabled or cache is stale
+        """
+        if not self.enabled:
+            return None
+        entry = self.cache.get(warehouse_name)
+        if not entry or time.monotonic() - entry["fetched_at"] > self.cache_ttl:
+            CACHE_REQUESTS.inc(cache="postings", result="miss")
+            return None
+        CACHE_REQUESTS.inc(cache="postings", result="hit")
+        logger.info(f"Serving cached postings for warehouse {warehouse_name}")
+        return entry["postings"]
+    
+    async def poll(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """JobQueue callback: poll every warehouse and push new postings."""
+        warehouses = await asyncio.to_thread(self.sheets_manager.get_warehouses)
+        warehouse_access = await asyncio.to_thread(self.sheets_manager.get_warehouse_chat_ids)
+        
+        semaphore = asyncio.Semaphore(max(1, Config.FETCH_CONCURRENCY))
+        
+        async def poll_one(warehouse: Dict[str, str]) -> None:
+            try:
+                async with semaphore:
+                    with start_trace("poll", warehouse=warehouse["warehouse_name"]):
+                        await self._poll_warehouse(
+                            warehouse,
+                            warehouse_access.get(warehouse["warehouse_name"], [])
+                        )
+            except Exception as e:
+                # One failing warehouse must not stop polling of the others
+                logger.error(
+                    f"Error polling warehouse {warehouse['warehouse_name']}: {e}",
+                    exc_info=True
+                )
+        
+        await asyncio.gather(*(poll_one(warehouse) for warehouse in warehouses))
+    
+    async def _poll_warehouse(self, warehouse: Dict[str, str], chat_ids: List[str]) -> None:
+        """Poll single warehouse and deliver postings not delivered before."""
+        warehouse_name = warehouse["warehouse_name"]
+        postings = await asyncio.to_thread(self.fetch_postings, warehouse)
+        delivered = await asyncio.to_thread(self.state_store.get_delivered, warehouse_name)
+        # Postings of pushes still being sent count as known
+        delivered |= await asyncio.to_thread(self.state_store.get_run_postings, "poller", warehouse_name)
+        
+        new_postings = [
+            posting for posting in postings
+            if posting.get("posting_number") and posting["posting_number"] not in delivered
+        ]
+        new_numbers = [posting["posting_number"] for posting in new_postings]
+        
+        if not await asyncio.to_thread(self.state_store.has_baseline, warehouse_name):
+            # First poll of this warehouse (even an empty one): remember the
+            # current backlog instead of flooding chats with every open posting
+            await asyncio.to_thread(self.state_store.mark_delivered, warehouse_name, new_numbers)
+            await asyncio.to_thread(self.state_store.mark_baseline, warehouse_name)
+            logger.info(
+                f"Initial poll of warehouse {warehouse_name}: "
+                f"{len(new_numbers)} postings marked as known"
+            )
+            return
+        
+        if not new_postings:
+            logger.debug("No new postings for warehouse %s", warehouse_name)
+            return
+        
+        if not chat_ids:
+            logger.debug("No chats to notify for warehouse %s", warehouse_name)
+            return
+        
+        with PARSE_SECONDS.time(mode="poll"):
+            buckets = ShelfBuckets()
+            for posting in new_postings:
+                buckets.extend(OzonClient.parse_posting_products(posting, self.catalog))
+            products = buckets.pop_all()
+        
+        if products:
+            # Marked delivered by the push once its last message is sent
+            await self.deliver(warehouse_name, chat_ids, products, new_numbers)
+        else:
+            await asyncio.to_thread(self.state_store.mark_delivered, warehouse_name, new_numbers)
+        logger.info(
+            f"Pushed {len(new_numbers)} new postings ({len(products)} products) "
+            f"for warehouse {warehouse_name} to {len(chat_ids)} chats"
+        )
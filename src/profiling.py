@@ -0,0 +1,352 @@
+"""On-demand profiling of warehouse runs and event loop block detection."""
+import asyncio
+import collections
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+from pathlib import Path
+from typing import Counter, Deque, List, Optional, Tuple
+from .config import Config
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("sampling", "cprofile")
+
+# (file name, function) of frames where a thread waits instead of working
+_IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("socketserver.py", "serve_forever"),
+}
+
+Frame = Tuple[str, int, str]
+
+
+class ProfileReport:
+    """Result of a finished profiling session."""
+    
+    def __init__(self, summary: str, paths: List[Path], chat_id: str):
+        """
+        Create report.
+        
+        Args:
+            summary: Text summary with top-N hot functions
+            paths: Written profile files
+            chat_id: Chat that requested the profile
+        """
+        self.summary = summary
+        self.paths = paths
+        self.chat_id = chat_id
+
+
+class SamplingProfiler:
+    """Samples stacks of all threads from a background thread."""
+    
+    def __init__(self, interval: float):
+        """
+        Initialize profiler.
+        
+        Args:
+            interval: Seconds between samples
+        """
+        self.interval = interval
+        self.stacks: Counter[Tuple[Frame, ...]] = collections.Counter()
+        self.samples = 0
+        self.idle = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+    
+    def start(self) -> None:
+        """Start sampling."""
+        self._thread.start()
+    
+    def stop(self) -> None:
+        """Stop sampling and wait for the sampler thread."""
+        self._stop.set()
+        self._thread.join()
+    
+    def _run(self) -> None:
+        """Take one sample of every other thread per interval."""
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+                    self.idle += 1
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                stack.reverse()
+                self.stacks[tuple(stack)] += 1
+            self.samples += 1
+    
+    def write(self, path: Path) -> None:
+        """Write stacks in collapsed format (input of flamegraph tools)."""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(";".join(f"{_short(file)}:{name}" for file, _, name in stack) + f" {count}\n")
+    
+    def summary(self, top_n: int) -> str:
+        """Top-N functions by own (self) and total samples."""
+        own: Counter[Frame] = collections.Counter()
+        total: Counter[Frame] = collections.Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for frame in set(stack):
+                total[frame] += count
+        busy = sum(own.values()) or 1
+        lines = [
+            f"samples: {self.samples} x {self.interval * 1000:g} ms, "
+            f"busy thread samples: {sum(own.values())}, idle: {self.idle}",
+            "self%  total%  function"
+        ]
+        for frame, count in own.most_common(top_n):
+            lines.append(
+                f"{count * 100 / busy:5.1f}  {total[frame] * 100 / busy:6.1f}  "
+                f"{frame[2]} ({_short(frame[0])}:{frame[1]})"
+            )
+        return "\n".join(lines)
+
+
+def _short(path: str) -> str:
+    """Shorten file path to the last two components."""
+    return "/".join(Path(path).parts[-2:])
+
+
+class ProfileController:
+    """
+    One profiling session at a time, for the next N runs or T seconds.
+    
+    "cprofile" traces every call of the event loop thread (worker threads
+    started by asyncio.to_thread are not covered), "sampling" periodically
+    records the stacks of all threads at a much lower overhead.
+    """
+    
+    def __init__(self, output_dir: Optional[str] = None, top_n: Optional[int] = None):
+        """
+        Initialize controller.
+        
+        Args:
+            output_dir: Directory for profile files (defaults to Config.PROFILE_DIR)
+            top_n: Functions listed in summaries (defaults to Config.PROFILE_TOP_N)
+        """
+        self.output_dir = Path(output_dir or Config.PROFILE_DIR)
+        self.top_n = top_n or Config.PROFILE_TOP_N
+        self.mode = ""
+        self.runs_left = 0
+        self.deadline = 0.0
+        self.chat_id = ""
+        self._started = 0.0
+        self._runs_done = 0
+        self._cprofile: Optional[cProfile.Profile] = None
+        self._sampler: Optional[SamplingProfiler] = None
+    
+    @property
+    def active(self) -> bool:
+        """Whether a session is running."""
+        return bool(self.mode)
+    
+    def describe(self) -> str:
+        """Human readable state of the running session."""
+        if not self.active:
+            return "профилирование выключено"
+        if self.runs_left:
+            limit = f"осталось запусков: {self.runs_left}"
+        else:
+            limit = f"осталось {max(0, self.deadline - time.monotonic()):.0f} с"
+        return f"профилирование {self.mode}, {limit}"
+    
+    def start(self, mode: str, chat_id: str, runs: int = 0, seconds: float = 0) -> None:
+        """
+        Start session (call from the event loop thread).
+        
+        Args:
+            mode: "sampling" or "cprofile"
+            chat_id: Chat the report is sent to
+            runs: Stop after this many finished warehouse runs
+            seconds: Stop after this many seconds (if runs is 0)
+        
+        Raises:
+            ValueError: If a session is running or arguments are invalid
+        """
+        if self.active:
+            raise ValueError("профилирование уже запущено")
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"неизвестный режим {mode}")
+        if runs <= 0 and seconds <= 0:
+            raise ValueError("укажите число запусков или секунд")
+        
+        self.mode = mode
+        self.chat_id = chat_id
+        self.runs_left = max(0, runs)
+        self.deadline = time.monotonic() + seconds if not runs else 0.0
+        self._runs_done = 0
+        self._started = time.monotonic()
+        if mode == "cprofile":
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        else:
+            self._sampler = SamplingProfiler(Config.PROFILE_SAMPLE_INTERVAL)
+            self._sampler.start()
+        logger.info(f"Profiling started: {self.describe()}")
+    
+    def run_finished(self) -> Optional[ProfileReport]:
+        """
+        Count finished warehouse run.
+        
+        Returns:
+            Report if this was the last run of the session
+        """
+        if not self.active:
+            return None
+        self._runs_done += 1
+        if self.runs_left:
+            self.runs_left -= 1
+            if not self.runs_left:
+                return self.stop()
+        return None
+    
+    def stop(self) -> Optional[ProfileReport]:
+        """
+        Stop session, write profile files and build the summary.
+        
+        Returns:
+            Report or None if no session was running
+        """
+        if not self.active:
+            return None
+        mode = self.mode
+        duration = time.monotonic() - self._started
+        self.mode = ""
+        self.runs_left = 0
+        
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        base = self.output_dir / f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{mode}"
+        if mode == "cprofile":
+            profile, self._cprofile = self._cprofile, None
+            profile.disable()
+            data_path = base.with_suffix(".prof")
+            profile.dump_stats(str(data_path))
+            buffer = io.StringIO()
+            pstats.Stats(profile, stream=buffer).sort_stats("tottime").print_stats(self.top_n)
+            body = _trim_pstats(buffer.getvalue())
+        else:
+            sampler, self._sampler = self._sampler, None
+            sampler.stop()
+            data_path = base.with_suffix(".collapsed")
+            sampler.write(data_path)
+            body = sampler.summary(self.top_n)
+        
+        summary = (
+            f"Профиль {mode}: {duration:.1f} с, запусков: {self._runs_done}\n"
+            f"{body}"
+        )
+        summary_path = base.with_suffix(".txt")
+        summary_path.write_text(summary, encoding="utf-8")
+        logger.info(f"Profiling finished, written {data_path} and {summary_path}")
+        return ProfileReport(summary, [data_path, summary_path], self.chat_id)
+
+
+def _trim_pstats(text: str) -> str:
+    """Drop the pstats header lines before the function table."""
+    lines = [line for line in text.splitlines() if line.strip()]
+    for index, line in enumerate(lines):
+        if line.lstrip().startswith("ncalls"):
+            return "\n".join(lines[index - 1 if index else 0:])
+    return "\n".join(lines)
+
+
+class LoopWatchdog:
+    """
+    Reports the event loop being blocked longer than a threshold.
+    
+    A heartbeat task stamps the time on every loop iteration it gets, a
+    monitor thread notices missing heartbeats and records the stack of
+    the loop thread, i.e. the handler that blocks it.
+    """
+    
+    def __init__(self, threshold: float, max_reports: int = 10):
+        """
+        Initialize watchdog.
+        
+        Args:
+            threshold: Seconds the loop may be blocked before reporting
+            max_reports: Number of recent reports kept
+        """
+        self.threshold = threshold
+        self.reports: Deque[str] = collections.deque(maxlen=max_reports)
+        self.blocked_count = 0
+        self._interval = min(0.1, threshold / 2)
+        self._beat = time.monotonic()
+        self._loop_thread_id = 0
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def running(self) -> bool:
+        """Whether the watchdog is started."""
+        return self._thread is not None
+    
+    def start(self) -> None:
+        """Start heartbeat and monitor (call from the event loop thread)."""
+        if self.running:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._monitor, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(f"Event loop watchdog started (threshold {self.threshold}s)")
+    
+    def stop(self) -> None:
+        """Stop heartbeat and monitor."""
+        if not self.running:
+            return
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._thread.join()
+        self._thread = None
+    
+    async def _heartbeat(self) -> None:
+        """Stamp the time whenever the loop runs this task."""
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self._interval)
+    
+    def _monitor(self) -> None:
+        """Report a stack once per blocking episode."""
+        reported_beat = None
+        while not self._stop.wait(self._interval):
+            beat = self._beat
+            blocked = time.monotonic() - beat
+            if blocked < self.threshold or beat == reported_beat:
+                continue
+            reported_beat = beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+            self.blocked_count += 1
+            report = (
+                f"{datetime.now().strftime('%H:%M:%S')} event loop blocked "
+                f"for {blocked:.2f}s+ at:\n{stack}"
+            )
+            self.reports.append(report)
+            logger.warning(report)
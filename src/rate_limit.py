@@ -0,0 +1,236 @@
+"""Per-client rate limiting and circuit breaking for Ozon API calls."""
+import threading
+import time
+from typing import Any, Dict
+import requests
+from .config import Config
+
+
+class RateLimiter:
+    """Thread-safe token bucket limiting requests per second."""
+    
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Initialize limiter.
+        
+        Args:
+            rate: Allowed requests per second (0 disables limiting)
+            burst: Max requests allowed at once after idle time
+        """
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self) -> float:
+        """
+        Block until a request is allowed.
+        
+        Returns:
+            Seconds spent waiting
+        """
+        if self.rate <= 0:
+            return 0.0
+        
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst,
+                    self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def configure(self, rate: float, burst: int) -> None:
+        """Change rate and burst, keeping the tokens collected so far."""
+        with self._lock:
+            self.rate = rate
+            self.burst = max(1, burst)
+            self._tokens = min(self._tokens, float(self.burst))
+
+    def available(self) -> float:
+        """Tokens available right now (requests allowed without waiting)."""
+        with self._lock:
+            return min(self.burst, self._tokens + (time.monotonic() - self._updated) * self.rate)
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Request rejected because the client_id's circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling Ozon for a client_id after consecutive failures.
+    
+    After failure_threshold failed requests in a row (5xx, 429, network
+    errors) the circuit opens and requests fail immediately for
+    reset_timeout seconds. Then one trial request is let through: success
+    closes the circuit, failure opens it again.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    DISABLED = "disabled"
+    
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        """
+        Initialize breaker.
+        
+        Args:
+            failure_threshold: Consecutive failures that open the circuit (0 disables it)
+            reset_timeout: Seconds the circuit stays open before a trial request
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self) -> str:
+        """Current state: closed, open, half_open or disabled."""
+        if self.failure_threshold <= 0:
+            return self.DISABLED
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+    
+    def retry_in(self) -> float:
+        """Seconds until the open circuit lets a trial request through."""
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+    
+    def allow(self) -> bool:
+        """Whether a request may be sent now."""
+        if self.failure_threshold <= 0:
+            return True
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+                self._trial = False
+            # Half open: only one trial request at a time
+            if self._trial:
+                return False
+            self._trial = True
+            return True
+    
+    def record_success(self) -> None:
+        """Close circuit after a successful request."""
+        with self._lock:
+            self.failures = 0
+            self._state = self.CLOSED
+            self._trial = False
+    
+    def record_failure(self) -> None:
+        """Count failed request, opening the circuit at the threshold."""
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_breakers: Dict[str, CircuitBreaker] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(client_id: str) -> RateLimiter:
+    """
+    Get shared limiter for an Ozon client_id.
+    
+    All OzonClient instances of the same seller account share one limiter,
+    as Ozon applies its limits per account.
+    
+    Args:
+        client_id: Ozon client identifier
+    
+    Returns:
+        RateLimiter for the client_id
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(client_id)
+        if limiter is None:
+            limiter = RateLimiter(Config.OZON_RATE_LIMIT_RPS, Config.OZON_RATE_LIMIT_BURST)
+            _limiters[client_id] = limiter
+        return limiter
+
+
+def get_breaker(client_id: str) -> CircuitBreaker:
+    """
+    Get shared circuit breaker for an Ozon client_id.
+    
+    Args:
+        client_id: Ozon client identifier
+    
+    Returns:
+        CircuitBreaker for the client_id
+    """
+    with _limiters_lock:
+        breaker = _breakers.get(client_id)
+        if breaker is None:
+            breaker = CircuitBreaker(Config.OZON_CIRCUIT_FAILURES, Config.OZON_CIRCUIT_RESET_SECONDS)
+            _breakers[client_id] = breaker
+        return breaker
+
+
+def reconfigure_limits() -> None:
+    """Apply current OZON_RATE_LIMIT_* and OZON_CIRCUIT_* settings to all client_ids."""
+    with _limiters_lock:
+        for limiter in _limiters.values():
+            limiter.configure(Config.OZON_RATE_LIMIT_RPS, Config.OZON_RATE_LIMIT_BURST)
+        for breaker in _breakers.values():
+            breaker.failure_threshold = Config.OZON_CIRCUIT_FAILURES
+            breaker.reset_timeout = Config.OZON_CIRCUIT_RESET_SECONDS
+
+
+def client_states() -> Dict[str, Dict[str, Any]]:
+    """
+    Limiter and circuit state of every client_id used so far.
+    
+    Returns:
+        Dictionary mapping client_id to tokens, rate, burst, circuit,
+        failures and retry_in (seconds until a trial request)
+    """
+    with _limiters_lock:
+        client_ids = sorted(set(_limiters) | set(_breakers))
+        limiters = dict(_limiters)
+        breakers = dict(_breakers)
+    states = {}
+    for client_id in client_ids:
+        limiter = limiters.get(client_id)
+        breaker = breakers.get(client_id)
+        if breaker:
+            circuit = breaker.state
+        else:
+            circuit = CircuitBreaker.CLOSED if Config.OZON_CIRCUIT_FAILURES > 0 else CircuitBreaker.DISABLED
+        states[client_id] = {
+            "tokens": limiter.available() if limiter else None,
+            "rate": limiter.rate if limiter else None,
+            "burst": limiter.burst if limiter else None,
+            "circuit": circuit,
+            "failures": breaker.failures if breaker else 0,
+            "retry_in": breaker.retry_in() if breaker else 0.0,
+        }
+    return states
@@ -1,49 +1,220 @@
 """Google Sheets integration for reading warehouse configs."""
 import logging
-from typing import List, Dict, Any
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Set, Tuple, Callable, TYPE_CHECKING
 import gspread
+import requests
 from google.oauth2.service_account import Credentials
 from .config import Config
+from .metrics import CACHE_REQUESTS, SHEETS_CALL_SECONDS, timed
+from .tracing import bind, set_attributes, traced
+
+if TYPE_CHECKING:
+    from .state_store import StateStore
 
 
 logger = logging.getLogger(__name__)
 
+# Headers of a Tasks worksheet (columns A-G)
+TASKS_HEADERS = [
+    "Номер отправления",
+    "Фото",
+    "Offer ID",
+    "Наименование",
+    "Артикул",
+    "Кол-во",
+    "Этикетка"
+]
+
+# Column H of a Tasks worksheet: set for postings Ozon no longer returns
+TASKS_STATUS_HEADER = "Статус"
+TASKS_STALE_STATUS = "Неактуально"
+
+# Spreadsheet ID inside a Google Sheets URL
+_SPREADSHEET_URL_ID = re.compile(r"/spreadsheets/d/([A-Za-z0-9_-]+)")
+
+
+class _StandInHTTPClient(gspread.HTTPClient):
+    """gspread HTTP client sending Sheets API calls to Config.SHEETS_API_BASE_URL."""
+    
+    GOOGLE_SHEETS_URL = "https://sheets.googleapis.com"
+    
+    def request(self, method: str, endpoint: str, *args: Any, **kwargs: Any) -> Any:
+        if endpoint.startswith(self.GOOGLE_SHEETS_URL):
+            endpoint = Config.SHEETS_API_BASE_URL.rstrip("/") + endpoint[len(self.GOOGLE_SHEETS_URL):]
+        return super().request(method, endpoint, *args, **kwargs)
+
 
 class SheetsManager:
     """Manages Google Sheets operations."""
     
-    def __init__(self):
-        """Initialize Google Sheets client."""
+    def __init__(self, state_store: Optional["StateStore"] = None, connect: bool = True):
+        """
+        Initialize Google Sheets manager.
+        
+        Args:
+            state_store: Optional store for the warm-start snapshot of
+                "Ozon"/"Access" data, served until Sheets is connected
+            connect: Connect now; otherwise on first use or via connect()
+        """
         self.sheet_id = Config.GOOGLE_SHEETS_ID
-        self.client = None
-        self.spreadsheet = None
-        self._initialize_client()
+        self.state_store = state_store
+        self._client = None
+        self._spreadsheet = None
+        self._connect_lock = threading.Lock()
+        # Pool of opened spreadsheets and Tasks shards, see get_tasks_target()
+        self._spreadsheets: Dict[str, Any] = {}
+        self._tasks_shards: Dict[Tuple[str, str], TasksShard] = {}
+        self._tasks_targets: Dict[str, Tuple[str, str]] = {}
+        self._pool_lock = threading.Lock()
+        # Sheet name -> (monotonic read time, data); snapshot data has time 0
+        self._config_cache: Dict[str, Tuple[float, Any]] = {}
+        # Called as listener(name, old, new) when re-read sheet data changed
+        self.config_listeners: List[Callable[[str, Any, Any], None]] = []
+        self._load_snapshot()
+        if connect:
+            self.connect()
+    
+    @property
+    def connected(self) -> bool:
+        """Check if the Google Sheets client is initialized."""
+        return self._spreadsheet is not None
+    
+    @property
+    def client(self):
+        """Authorized gspread client (connects on first use)."""
+        self.connect()
+        return self._client
     
+    @property
+    def spreadsheet(self):
+        """Main spreadsheet (connects on first use)."""
+        self.connect()
+        return self._spreadsheet
+    
+    def connect(self) -> None:
+        """Initialize Google Sheets client unless already done (blocking)."""
+        with self._connect_lock:
+            if self._spreadsheet is None:
+                self._initialize_client()
+    
+    @timed(SHEETS_CALL_SECONDS, operation="connect")
+    @traced("sheets.connect")
     def _initialize_client(self) -> None:
         """Initialize Google Sheets client with service account credentials."""
         try:
-            scopes = [
-                "https://www.googleapis.com/auth/spreadsheets",
-                "https://www.googleapis.com/auth/drive"
-            ]
-            creds_path = Config.get_service_account_path()
-            credentials = Credentials.from_service_account_file(
-                str(creds_path),
-                scopes=scopes
-            )
-            self.client = gspread.authorize(credentials)
-            self.spreadsheet = self.client.open_by_key(self.sheet_id)
+            if Config.SHEETS_API_BASE_URL:
+                # Local stand-in, no credentials
+                self._client = gspread.Client(
+                    auth=None, session=requests.Session(), http_client=_StandInHTTPClient
+                )
+            else:
+                scopes = [
+                    "https://www.googleapis.com/auth/spreadsheets",
+                    "https://www.googleapis.com/auth/drive"
+                ]
+                creds_path = Config.get_service_account_path()
+                credentials = Credentials.from_service_account_file(
+                    str(creds_path),
+                    scopes=scopes
+                )
+                self._client = gspread.authorize(credentials)
+            self._spreadsheet = self._client.open_by_key(self.sheet_id)
+            self._spreadsheets[self.sheet_id] = self._spreadsheet
             logger.info("Google Sheets client initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize Google Sheets client: {e}")
             raise
     
+    def _load_snapshot(self) -> None:
+        """Load "Ozon"/"Access" data saved by the previous run."""
+        if self.state_store is None:
+            return
+        for name in ("Ozon", "Access"):
+            data = self.state_store.load_snapshot(f"sheets:{name}")
+            if data is not None:
+                self._config_cache[name] = (0.0, data)
+        if "Ozon" in self._config_cache:
+            self._set_tasks_targets(self._config_cache["Ozon"][1])
+        logger.info(f"Loaded Sheets snapshot: {', '.join(self._config_cache) or 'empty'}")
+    
+    def _get_config(self, name: str, read: Callable[[], Any], force: bool = False) -> Any:
+        """
+        Get "Ozon"/"Access" data from memory or read it from Sheets.
+        
+        Data is reused for SHEETS_CONFIG_TTL_SECONDS, the warm-start
+        snapshot is served while Sheets is not connected yet and when
+        reading fails. Listeners in config_listeners are told when a
+        re-read returns different data.
+        """
+        entry = self._config_cache.get(name)
+        if entry is not None and not force:
+            if not self.connected or time.monotonic() - entry[0] < Config.SHEETS_CONFIG_TTL_SECONDS:
+                CACHE_REQUESTS.inc(cache="sheets_config", result="hit")
+                return entry[1]
+        CACHE_REQUESTS.inc(cache="sheets_config", result="miss")
+        try:
+            data = read()
+        except Exception:
+            if entry is None:
+                raise
+            logger.warning(f"Serving last known '{name}' sheet data")
+            return entry[1]
+        self._config_cache[name] = (time.monotonic(), data)
+        if self.state_store is not None:
+            try:
+                self.state_store.save_snapshot(f"sheets:{name}", data)
+            except Exception as e:
+                logger.warning(f"Could not save '{name}' sheet snapshot: {e}")
+        if entry is not None and entry[1] != data:
+            for listener in self.config_listeners:
+                try:
+                    listener(name, entry[1], data)
+                except Exception as e:
+                    logger.error(f"'{name}' sheet change listener failed: {e}", exc_info=True)
+        return data
+    
+    def refresh_config(self) -> None:
+        """Re-read "Ozon" and "Access" sheets now (blocking), e.g. in background."""
+        self._get_config("Ozon", self._read_warehouses, force=True)
+        self._get_config("Access", self._read_warehouse_chat_ids, force=True)
+    
+    def _set_tasks_targets(self, warehouses: List[Dict[str, Any]]) -> None:
+        """Remember Tasks target of every warehouse."""
+        self._tasks_targets = {
+            warehouse["warehouse_name"]: (
+                warehouse.get("tasks_spreadsheet_id") or self.sheet_id,
+                warehouse.get("tasks_worksheet") or "Tasks"
+            )
+            for warehouse in warehouses
+        }
+    
     def get_warehouses(self) -> List[Dict[str, str]]:
+        """
+        Get warehouse configurations from "Ozon" sheet (see _read_warehouses).
+        
+        Returns:
+            List of warehouse dictionaries, empty list on error
+        """
+        try:
+            return self._get_config("Ozon", self._read_warehouses)
+        except Exception:
+            return []
+    
+    @timed(SHEETS_CALL_SECONDS, operation="read_warehouses")
+    @traced("sheets.read_warehouses")
+    def _read_warehouses(self) -> List[Dict[str, str]]:
         """
         Read warehouse configurations from "Ozon" sheet.
         
         Returns:
             List of dictionaries with keys: Город, Название склада, Client_id, API_KEY
+            and optional Ozon filters (Delivery_method_ids, Warehouse_ids,
+            Provider_ids, Дней назад, Дней вперёд) and Tasks target
+            (Таблица задач - spreadsheet ID or URL, Лист задач - worksheet name)
         """
         try:
             worksheet = self.spreadsheet.worksheet("Ozon")
@@ -62,7 +233,16 @@ class SheetsManager:
                     "city": str(record.get("Город", "")).strip(),
                     "warehouse_name": str(record.get("Название склада", "")).strip(),
                     "client_id": client_id,
-                    "api_key": api_key
+                    "api_key": api_key,
+                    # Optional filters pushed down to the Ozon posting list request
+                    "delivery_method_ids": self._parse_id_list(record.get("Delivery_method_ids", "")),
+                    "ozon_warehouse_ids": self._parse_id_list(record.get("Warehouse_ids", "")),
+                    "provider_ids": self._parse_id_list(record.get("Provider_ids", "")),
+                    "days_back": self._parse_int(record.get("Дней назад", "")),
+                    "days_ahead": self._parse_int(record.get("Дней вперёд", "")),
+                    # Optional own Tasks spreadsheet/worksheet of the warehouse
+                    "tasks_spreadsheet_id": self._parse_spreadsheet_id(record.get("Таблица задач", "")),
+                    "tasks_worksheet": str(record.get("Лист задач", "")).strip()
                 }
                 # Only include warehouses with required fields
                 if warehouse["warehouse_name"] and warehouse["client_id"] and warehouse["api_key"]:
@@ -75,13 +255,56 @@ class SheetsManager:
                         f"api_key={bool(warehouse['api_key'])}"
                     )
             
+            self._set_tasks_targets(warehouses)
+            
             logger.info(f"Retrieved {len(warehouses)} warehouses from Ozon sheet")
             return warehouses
         except Exception as e:
             logger.error(f"Error reading warehouses: {e}", exc_info=True)
-            return []
+            raise
+    
+    @staticmethod
+    def _parse_id_list(value: Any) -> List[int]:
+        """Parse comma/space separated numeric IDs from a sheet cell."""
+        ids = []
+        for part in str(value).replace(";", ",").replace(" ", ",").split(","):
+            part = part.strip()
+            if not part:
+                continue
+            if part.isdigit():
+                ids.append(int(part))
+            else:
+                logger.warning(f"Ignoring invalid ID '{part}' in Ozon sheet")
+        return ids
+    
+    @staticmethod
+    def _parse_spreadsheet_id(value: Any) -> str:
+        """Parse spreadsheet ID from a sheet cell holding an ID or URL."""
+        value = str(value).strip()
+        match = _SPREADSHEET_URL_ID.search(value)
+        return match.group(1) if match else value
+    
+    @staticmethod
+    def _parse_int(value: Any) -> Optional[int]:
+        """Parse optional non-negative integer from a sheet cell."""
+        value = str(value).strip()
+        return int(value) if value.isdigit() else None
     
     def get_warehouse_chat_ids(self) -> Dict[str, List[str]]:
+        """
+        Get warehouse access mappings from "Access" sheet (see _read_warehouse_chat_ids).
+        
+        Returns:
+            Dictionary mapping warehouse_name to list of chat_ids, empty on error
+        """
+        try:
+            return self._get_config("Access", self._read_warehouse_chat_ids)
+        except Exception:
+            return {}
+    
+    @timed(SHEETS_CALL_SECONDS, operation="read_access")
+    @traced("sheets.read_access")
+    def _read_warehouse_chat_ids(self) -> Dict[str, List[str]]:
         """
         Read warehouse access mappings from "Access" sheet.
         Supports multiple Chat_id per warehouse.
@@ -114,7 +337,7 @@ class SheetsManager:
             return warehouse_access
         except Exception as e:
             logger.error(f"Error reading access mappings: {e}")
-            return {}
+            raise
     
     def check_user_access(self, chat_id: str, warehouse_name: str) -> bool:
         """
@@ -132,6 +355,19 @@ class SheetsManager:
         allowed_chat_ids = warehouse_access.get(warehouse_name, [])
         return str(chat_id).strip() in allowed_chat_ids
     
+    @staticmethod
+    def task_row(item: Dict[str, Any]) -> List[Any]:
+        """Build "Tasks" sheet row (columns A-G) for a product."""
+        return [
+            item.get("posting_number", ""),  # Номер отправления
+            item.get("picture_url", ""),     # Фото
+            item.get("offer_id", ""),        # Offer ID
+            item.get("product_name", ""),    # Наименование
+            item.get("sku", ""),             # Артикул
+            item.get("quantity", ""),        # Кол-во
+            ""                               # Этикетка (empty initially)
+        ]
+    
     def add_to_tasks(self, posting_data: List[Dict[str, Any]], warehouse_name: str) -> bool:
         """
         Add posting products to "Tasks" sheet using batch update.
@@ -143,46 +379,113 @@ class SheetsManager:
         Returns:
             True if successful, False otherwise
         """
-        try:
-            worksheet = self.spreadsheet.worksheet("Tasks")
+        return self.add_tasks_batch({warehouse_name: posting_data})
+    
+    def add_tasks_batch(self, products_by_warehouse: Dict[str, List[Dict[str, Any]]]) -> bool:
+        """
+        Add or update products of several warehouses in "Tasks" sheets.
+        
+        Warehouses are grouped by their target Tasks worksheet (shard),
+        each shard gets at most one batch update and one write of new rows.
+        Different shards are written in parallel.
+        
+        Args:
+            products_by_warehouse: Dictionary mapping warehouse_name to products
             
-            # Prepare rows to add with offer_id column
-            rows_to_add = []
-            for item in posting_data:
-                row = [
-                    item.get("posting_number", ""),  # Номер отправления
-                    item.get("picture_url", ""),     # Фото
-                    item.get("offer_id", ""),        # Offer ID
-                    item.get("product_name", ""),    # Наименование
-                    item.get("sku", ""),             # Артикул
-                    item.get("quantity", ""),        # Кол-во
-                    ""                               # Этикетка (empty initially)
-                ]
-                rows_to_add.append(row)
+        Returns:
+            True if all shards were written successfully, False otherwise
+        """
+        products_by_shard: Dict[Tuple[str, str], Dict[str, List[Dict[str, Any]]]] = {}
+        for warehouse_name, posting_data in products_by_warehouse.items():
+            target = self.get_tasks_target(warehouse_name)
+            products_by_shard.setdefault(target, {})[warehouse_name] = posting_data
             
-            # Use batch update for better performance
-            if rows_to_add:
-                # Get current number of rows to find where to insert
-                existing_rows = len(worksheet.get_all_values())
-                start_row = existing_rows + 1
+        if len(products_by_shard) == 1:
+            target, products = next(iter(products_by_shard.items()))
+            return self._get_tasks_shard(target).write(products)
+            
+        with ThreadPoolExecutor(max_workers=len(products_by_shard)) as executor:
+            results = list(executor.map(
+                bind(lambda item: self._get_tasks_shard(item[0]).write(item[1])),
+                products_by_shard.items()
+            ))
+        return all(results)
+                
+    def mark_stale_tasks(self, postings_by_warehouse: Dict[str, List[str]]) -> bool:
+        """
+        Mark Tasks rows of postings the warehouses no longer return.
+        
+        Call it only with complete fetches: every posting written earlier
+        for a warehouse but missing here gets TASKS_STALE_STATUS in column H.
+        Needs the state store (it remembers which warehouse wrote a row).
+        
+        Args:
+            postings_by_warehouse: Dictionary mapping warehouse_name to all its current posting numbers
+        
+        Returns:
+            True if all shards were updated successfully, False otherwise
+        """
+        results = [
+            self._get_tasks_shard(self.get_tasks_target(warehouse_name)).mark_stale(
+                warehouse_name, posting_numbers
+            )
+            for warehouse_name, posting_numbers in postings_by_warehouse.items()
+        ]
+        return all(results)
                 
-                # Prepare range for batch update (columns A-G)
-                end_row = start_row + len(rows_to_add) - 1
-                range_name = f"A{start_row}:G{end_row}"
+    def get_tasks_target(self, warehouse_name: str) -> Tuple[str, str]:
+        """
+        Get (spreadsheet ID, worksheet name) receiving Tasks rows of a warehouse.
                 
-                # Batch update values using gspread's update method
-                worksheet.update(range_name, rows_to_add, value_input_option='USER_ENTERED')
+        Targets come from the last get_warehouses() call, warehouses without
+        own target use "Tasks" of the main spreadsheet.
+        """
+        return self._tasks_targets.get(warehouse_name, (self.sheet_id, "Tasks"))
                 
-                logger.info(
-                    f"Added {len(rows_to_add)} rows to Tasks sheet "
-                    f"for warehouse {warehouse_name} using batch update"
-                )
-            
+    def _open_spreadsheet(self, spreadsheet_id: str):
+        """Get opened spreadsheet from the pool (opened on first use)."""
+        with self._pool_lock:
+            spreadsheet = self._spreadsheets.get(spreadsheet_id)
+            if spreadsheet is None:
+                spreadsheet = self.client.open_by_key(spreadsheet_id)
+                self._spreadsheets[spreadsheet_id] = spreadsheet
+                logger.info(f"Opened spreadsheet {spreadsheet_id}")
+            return spreadsheet
+    
+    def _get_tasks_shard(self, target: Tuple[str, str]) -> "TasksShard":
+        """Get Tasks shard of a (spreadsheet ID, worksheet name) target."""
+        with self._pool_lock:
+            shard = self._tasks_shards.get(target)
+            if shard is None:
+                shard = TasksShard(self, *target)
+                self._tasks_shards[target] = shard
+            return shard
+    
+    def reload_task_index(self) -> None:
+        """Drop the Tasks row indexes, e.g. after the sheets were edited manually."""
+        with self._pool_lock:
+            shards = list(self._tasks_shards.values())
+        for shard in shards:
+            shard.reset()
+    
+    def set_task_labels(self, labels: Dict[str, str], warehouse_name: Optional[str] = None) -> bool:
+        """
+        Fill "Этикетка" column (G) of Tasks rows for the given postings.
+        
+        Args:
+            labels: Dictionary mapping posting_number to cell value (link or file name)
+            warehouse_name: Warehouse whose Tasks shard holds the postings
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        if not labels:
             return True
-        except Exception as e:
-            logger.error(f"Error adding to Tasks sheet: {e}", exc_info=True)
-            return False
+        target = self.get_tasks_target(warehouse_name) if warehouse_name else (self.sheet_id, "Tasks")
+        return self._get_tasks_shard(target).set_labels(labels)
     
+    @timed(SHEETS_CALL_SECONDS, operation="log_processed_orders")
+    @traced("sheets.log_processed_orders")
     def log_processed_order(self, posting_number: str, warehouse_name: str) -> bool:
         """
         Log processed order to "ProcessedOrders" sheet.
@@ -212,6 +515,40 @@ class SheetsManager:
             logger.error(f"Error logging processed order: {e}")
             return False
     
+    @timed(SHEETS_CALL_SECONDS, operation="log_processed_orders")
+    @traced("sheets.log_processed_orders")
+    def log_processed_orders(self, postings_by_warehouse: Dict[str, List[str]]) -> bool:
+        """
+        Log many processed orders to "ProcessedOrders" sheet in one request.
+        
+        Args:
+            postings_by_warehouse: Dictionary mapping warehouse_name to posting numbers
+            
+        Returns:
+            True if successful, False otherwise
+        """
+        try:
+            from datetime import datetime
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            rows = [
+                [posting_number, warehouse_name, timestamp]
+                for warehouse_name, posting_numbers in postings_by_warehouse.items()
+                for posting_number in posting_numbers
+            ]
+            if not rows:
+                return True
+            
+            worksheet = self.spreadsheet.worksheet("ProcessedOrders")
+            worksheet.append_rows(rows)
+            
+            set_attributes(warehouse=", ".join(postings_by_warehouse), rows=len(rows), status="ok")
+            logger.info("Logged %d processed orders in one batch", len(rows))
+            return True
+        except Exception as e:
+            set_attributes(status="error", error=type(e).__name__)
+            logger.error(f"Error logging processed orders: {e}")
+            return False
+    
     def ensure_sheet_exists(self, sheet_name: str) -> None:
         """
         Ensure a sheet exists in the spreadsheet. Create if it doesn't.
@@ -231,19 +568,263 @@ class SheetsManager:
                 # Set headers based on sheet name
                 worksheet = self.spreadsheet.worksheet(sheet_name)
                 if sheet_name == "Tasks":
-                    headers = [
-                        "Номер отправления",
-                        "Фото",
-                        "Offer ID",
-                        "Наименование",
-                        "Артикул",
-                        "Кол-во",
-                        "Этикетка"
-                    ]
-                    worksheet.append_row(headers)
+                    worksheet.append_row(TASKS_HEADERS)
                 elif sheet_name == "ProcessedOrders":
                     headers = ["Номер отправления", "Название склада", "Дата обработки"]
                     worksheet.append_row(headers)
         except Exception as e:
             logger.warning(f"Could not ensure sheet '{sheet_name}' exists: {e}")
 
+
+class TasksShard:
+    """
+    One Tasks worksheet with its (posting_number, sku) -> row index.
+    
+    Each shard has its own lock, so warehouses writing to different
+    spreadsheets do not wait for each other. Rows are never inserted or
+    deleted by the bot, so indexed row numbers stay valid while other
+    processes append their rows below.
+    """
+    
+    def __init__(self, manager: SheetsManager, spreadsheet_id: str, worksheet_name: str):
+        """
+        Initialize shard (the worksheet is opened on first write).
+        
+        Args:
+            manager: Sheets manager owning the spreadsheet pool
+            spreadsheet_id: Target spreadsheet ID
+            worksheet_name: Target worksheet name
+        """
+        self.manager = manager
+        self.spreadsheet_id = spreadsheet_id
+        self.worksheet_name = worksheet_name
+        self._worksheet = None
+        # (posting_number, sku) -> (row number, values of columns A-F)
+        self._index: Optional[Dict[Tuple[str, str], Tuple[int, List[str]]]] = None
+        # Keys of rows marked with TASKS_STALE_STATUS
+        self._stale: Set[Tuple[str, str]] = set()
+        self._lock = threading.Lock()
+    
+    def __repr__(self) -> str:
+        return f"TasksShard({self.target})"
+    
+    @property
+    def target(self) -> str:
+        """Worksheet as "spreadsheet_id/worksheet name" (key in the state store)."""
+        return f"{self.spreadsheet_id}/{self.worksheet_name}"
+    
+    def reset(self) -> None:
+        """Drop the row index so it is re-read on next write."""
+        with self._lock:
+            self._index = None
+    
+    @staticmethod
+    def _key(row: List[Any]) -> Tuple[str, str]:
+        """Get (posting_number, sku) key of a Tasks row."""
+        return (str(row[0]), str(row[4]) if len(row) > 4 else "")
+    
+    def _ensure_loaded(self) -> bool:
+        """
+        Open worksheet (creating it if missing) and read the row index once.
+        
+        Returns:
+            True if the index was (re-)read by this call
+        """
+        if self._worksheet is None:
+            spreadsheet = self.manager._open_spreadsheet(self.spreadsheet_id)
+            try:
+                self._worksheet = spreadsheet.worksheet(self.worksheet_name)
+            except gspread.exceptions.WorksheetNotFound:
+                self._worksheet = spreadsheet.add_worksheet(title=self.worksheet_name, rows=1000, cols=20)
+                self._worksheet.append_row(TASKS_HEADERS)
+                logger.info(f"Created sheet '{self.worksheet_name}' in {self.spreadsheet_id}")
+        
+        if self._index is not None:
+            return False
+        rows = self._worksheet.get_all_values()
+        self._index = {}
+        self._stale = set()
+        for row_number, row in enumerate(rows, start=1):
+            key = self._key(row)
+            # Keep the first of duplicate rows written before the index existed
+            if key[0] and key not in self._index:
+                self._index[key] = (row_number, [str(value) for value in row[:6]])
+                if row_number > 1 and len(row) > 7 and row[7]:
+                    self._stale.add(key)
+        logger.info(f"Loaded {self} index: {len(self._index)} rows")
+        return True
+    
+    def _diff(
+        self,
+        products_by_warehouse: Dict[str, List[Dict[str, Any]]]
+    ) -> Tuple[Dict[Tuple[str, str], Tuple[int, List[Any]]], Dict[Tuple[str, str], List[Any]]]:
+        """Split products into changed indexed rows and rows to add."""
+        updates = {}
+        new_rows = {}
+        for posting_data in products_by_warehouse.values():
+            for item in posting_data:
+                row = SheetsManager.task_row(item)
+                key = self._key(row)
+                values = [str(value) for value in row[:6]]
+                existing = self._index.get(key)
+                if existing is None:
+                    new_rows[key] = row
+                elif existing[1] != values or key in self._stale:
+                    updates[key] = (existing[0], row)
+        return updates, new_rows
+    
+    @timed(SHEETS_CALL_SECONDS, operation="write_tasks")
+    @traced("sheets.write_tasks")
+    def write(self, products_by_warehouse: Dict[str, List[Dict[str, Any]]]) -> bool:
+        """
+        Add or update products in this worksheet.
+        
+        Rows already present for the same (posting_number, sku) are updated
+        in place with one batch update (only if their values changed), the
+        other products are appended after the last row by Sheets itself, so
+        rows written meanwhile by another process are not overwritten.
+        
+        Args:
+            products_by_warehouse: Dictionary mapping warehouse_name to products
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        set_attributes(worksheet=str(self), warehouse=", ".join(products_by_warehouse))
+        with self._lock:
+            try:
+                loaded = self._ensure_loaded()
+                updates, new_rows = self._diff(products_by_warehouse)
+                if new_rows and not loaded:
+                    # Another process (sync, worker) may have added these rows
+                    self._index = None
+                    self._ensure_loaded()
+                    updates, new_rows = self._diff(products_by_warehouse)
+                
+                if updates:
+                    # Columns A-F only, "Этикетка" (G) keeps its link;
+                    # rows written again are relevant again (H)
+                    data = []
+                    for key, (row_number, row) in updates.items():
+                        data.append({"range": f"A{row_number}:F{row_number}", "values": [row[:6]]})
+                        if key in self._stale:
+                            data.append({"range": f"H{row_number}", "values": [[""]]})
+                    self._worksheet.batch_update(data, value_input_option='USER_ENTERED')
+                    for key, (row_number, row) in updates.items():
+                        self._index[key] = (row_number, [str(value) for value in row[:6]])
+                        self._stale.discard(key)
+                
+                if new_rows:
+                    response = self._worksheet.append_rows(
+                        list(new_rows.values()),
+                        value_input_option='USER_ENTERED',
+                        table_range="A1"
+                    )
+                    updated_range = response["updates"]["updatedRange"].rsplit("!", 1)[-1]
+                    start_row = gspread.utils.a1_range_to_grid_range(updated_range)["startRowIndex"] + 1
+                    for row_number, (key, row) in enumerate(new_rows.items(), start=start_row):
+                        self._index[key] = (row_number, [str(value) for value in row[:6]])
+                
+                if self.manager.state_store is not None:
+                    for warehouse_name, posting_data in products_by_warehouse.items():
+                        self.manager.state_store.add_task_postings(
+                            self.target, warehouse_name, {item.get("posting_number", "") for item in posting_data}
+                        )
+                
+                set_attributes(rows_added=len(new_rows), rows_updated=len(updates), status="ok")
+                logger.info(
+                    "%s for warehouses %s: %d rows added, %d rows updated",
+                    self, ", ".join(products_by_warehouse), len(new_rows), len(updates)
+                )
+                return True
+            except Exception as e:
+                # Sheet may differ from the index now, re-read it next time
+                self._index = None
+                set_attributes(status="error", error=type(e).__name__)
+                logger.error(f"Error writing to {self}: {e}", exc_info=True)
+                return False
+    
+    @timed(SHEETS_CALL_SECONDS, operation="mark_stale")
+    @traced("sheets.mark_stale")
+    def mark_stale(self, warehouse_name: str, posting_numbers: List[str]) -> bool:
+        """
+        Mark rows of postings the warehouse no longer returns (column H).
+        
+        Postings leave the Ozon list once they are packed or cancelled;
+        their rows are marked with TASKS_STALE_STATUS instead of being
+        deleted, so row numbers indexed by other processes stay valid.
+        
+        Args:
+            warehouse_name: Name of the warehouse
+            posting_numbers: All postings of the warehouse in the latest complete fetch
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        store = self.manager.state_store
+        if store is None:
+            return True
+        with self._lock:
+            try:
+                stale = store.get_task_postings(self.target, warehouse_name) - set(posting_numbers)
+                if not stale:
+                    return True
+                
+                loaded = self._ensure_loaded()
+                if not loaded and not stale <= {key[0] for key in self._index}:
+                    # Rows appended by another process since the index was read
+                    self._index = None
+                    self._ensure_loaded()
+                
+                keys = [key for key in self._index if key[0] in stale and key not in self._stale]
+                if keys:
+                    data = [{"range": "H1", "values": [[TASKS_STATUS_HEADER]]}]
+                    data.extend(
+                        {"range": f"H{self._index[key][0]}", "values": [[TASKS_STALE_STATUS]]}
+                        for key in keys
+                    )
+                    self._worksheet.batch_update(data, value_input_option='USER_ENTERED')
+                    self._stale.update(keys)
+                store.forget_task_postings(self.target, warehouse_name, stale)
+                
+                set_attributes(worksheet=str(self), warehouse=warehouse_name, rows=len(keys), status="ok")
+                logger.info(f"{self}: marked {len(keys)} rows of {len(stale)} stale postings of {warehouse_name}")
+                return True
+            except Exception as e:
+                self._index = None
+                set_attributes(worksheet=str(self), status="error", error=type(e).__name__)
+                logger.error(f"Error marking stale rows in {self}: {e}", exc_info=True)
+                return False
+    
+    @timed(SHEETS_CALL_SECONDS, operation="set_labels")
+    @traced("sheets.set_labels")
+    def set_labels(self, labels: Dict[str, str]) -> bool:
+        """
+        Fill "Этикетка" column (G) of rows for the given postings.
+        
+        Args:
+            labels: Dictionary mapping posting_number to cell value
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        with self._lock:
+            try:
+                self._ensure_loaded()
+                
+                updates = [
+                    {"range": f"G{row_number}", "values": [[labels[posting_number]]]}
+                    for (posting_number, _), (row_number, _) in self._index.items()
+                    if posting_number in labels
+                ]
+                if updates:
+                    self._worksheet.batch_update(updates, value_input_option='USER_ENTERED')
+                
+                set_attributes(worksheet=str(self), rows=len(updates), status="ok")
+                logger.info(f"Linked labels in {len(updates)} rows of {self}")
+                return True
+            except Exception as e:
+                self._index = None
+                set_attributes(worksheet=str(self), status="error", error=type(e).__name__)
+                logger.error(f"Error linking labels in {self}: {e}", exc_info=True)
+                return False
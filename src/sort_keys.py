@@ -0,0 +1,243 @@
+"""Offer ID sort-key engine with precompiled rules and memoization."""
+import logging
+import re
+from functools import lru_cache
+from typing import Iterable, List, Dict, Any, Optional, Tuple
+from .config import Config
+
+
+logger = logging.getLogger(__name__)
+
+SortKey = Tuple[int, ...]
+
+
+class SortKeyEngine:
+    """
+    Extracts sort keys from offer_id strings.
+    
+    The primary number follows a prefix of 1..prefix_max_len arbitrary
+    symbols (tried in this order, then no prefix at all), must not be part
+    of a longer number and must be within [number_min, number_max]:
+    "р20-п5-33" -> 20, "мд33-п2-30" -> 33, "р100-п5-33" -> None.
+    
+    With key_parts > 1 the following numbers of the offer_id are appended
+    to the key: "р20-п5-33" -> (20, 5, 33), missing parts are filled with 0.
+    """
+    
+    def __init__(
+        self,
+        prefix_max_len: Optional[int] = None,
+        number_min: Optional[int] = None,
+        number_max: Optional[int] = None,
+        key_parts: Optional[int] = None,
+        cache_size: Optional[int] = None
+    ):
+        """
+        Compile sort-key rules.
+        
+        Args:
+            prefix_max_len: Max number of prefix symbols before the number
+            number_min: Minimal valid primary number
+            number_max: Maximal valid primary number
+            key_parts: Number of numeric parts in the sort key
+            cache_size: Max number of memoized offer_ids
+        """
+        self.prefix_max_len = Config.OFFER_ID_PREFIX_MAX_LEN if prefix_max_len is None else prefix_max_len
+        self.number_min = Config.OFFER_ID_NUMBER_MIN if number_min is None else number_min
+        self.number_max = Config.OFFER_ID_NUMBER_MAX if number_max is None else number_max
+        self.key_parts = max(1, Config.OFFER_ID_KEY_PARTS if key_parts is None else key_parts)
+        cache_size = Config.OFFER_ID_CACHE_SIZE if cache_size is None else cache_size
+        
+        # All candidate positions (prefix 1..N, then no prefix) are captured
+        # by lookaheads in a single pass, the first one in range wins.
+        # Candidates are 1..max_digits digits not followed by another digit.
+        max_digits = len(str(self.number_max))
+        number = rf"(\d{{1,{max_digits}}})(?!\d)"
+        candidates = [
+            rf"(?:(?=.{{{prefix_len}}}{number}))?"
+            for prefix_len in range(1, self.prefix_max_len + 1)
+        ]
+        candidates.append(rf"(?:(?={number}))?")
+        self._pattern = re.compile("^" + "".join(candidates), re.DOTALL)
+        self._digits_pattern = re.compile(r"\d+")
+        
+        self._cached_key = lru_cache(maxsize=cache_size)(self._compute_key)
+    
+    def _compute_key(self, offer_id: str) -> Optional[SortKey]:
+        """Compute sort key without cache."""
+        match = self._pattern.match(offer_id)
+        for group in range(1, self._pattern.groups + 1):
+            value = match.group(group)
+            if value is None:
+                continue
+            number = int(value)
+            if self.number_min <= number <= self.number_max:
+                if self.key_parts == 1:
+                    return (number,)
+                rest = [
+                    int(part) for part in
+                    self._digits_pattern.findall(offer_id, match.end(group))
+                ][:self.key_parts - 1]
+                rest.extend([0] * (self.key_parts - 1 - len(rest)))
+                return (number, *rest)
+        return None
+    
+    def key(self, offer_id: str) -> Optional[SortKey]:
+        """
+        Get sort key for offer_id.
+        
+        Args:
+            offer_id: Offer ID string
+        
+        Returns:
+            Tuple of key_parts numbers or None if offer_id has no valid number
+        """
+        if not offer_id or not isinstance(offer_id, str):
+            return None
+        return self._cached_key(offer_id)
+    
+    def number(self, offer_id: str) -> Optional[int]:
+        """
+        Get primary number of offer_id.
+        
+        Args:
+            offer_id: Offer ID string
+        
+        Returns:
+            Primary number or None if not found/invalid
+        """
+        key = self.key(offer_id)
+        return key[0] if key else None
+    
+    def keys(self, offer_ids: Iterable[str]) -> List[Optional[SortKey]]:
+        """
+        Get sort keys for many offer_ids at once.
+        
+        Args:
+            offer_ids: Offer ID strings
+        
+        Returns:
+            List of sort keys (None for invalid offer_ids) in input order
+        """
+        key = self.key
+        return [key(offer_id) for offer_id in offer_ids]
+    
+    def sort_products(self, products: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Keep only products with a valid offer_id key, sorted by it.
+        
+        Products are not modified, the order is stable.
+        
+        Args:
+            products: Parsed product dictionaries
+        
+        Returns:
+            Filtered and sorted list of products
+        """
+        buckets = ShelfBuckets(self)
+        buckets.extend(products)
+        return buckets.pop_all()
+    
+    def cache_info(self):
+        """Get memoization cache statistics."""
+        return self._cached_key.cache_info()
+
+
+class ShelfBuckets:
+    """
+    Linear-time ordering of items by shelf (primary offer_id number).
+    
+    Items are placed into one bucket per valid shelf number as they arrive,
+    so there is no sort pass over the whole list and items are not modified.
+    Within a shelf the arrival order is kept (or the remaining key parts
+    are used when the engine has key_parts > 1).
+    """
+    
+    def __init__(self, engine: Optional[SortKeyEngine] = None):
+        """
+        Initialize empty buckets.
+        
+        Args:
+            engine: Sort-key engine (defaults to the Config-based engine)
+        """
+        self.engine = engine or get_default_engine()
+        self._min = self.engine.number_min
+        self._buckets: List[List[Tuple[SortKey, Any]]] = [
+            [] for _ in range(self.engine.number_max - self.engine.number_min + 1)
+        ]
+        self._count = 0
+    
+    def __len__(self) -> int:
+        """Number of items waiting in buckets."""
+        return self._count
+    
+    def add(self, item: Any, offer_id: Optional[str] = None) -> bool:
+        """
+        Place item into its shelf bucket.
+        
+        Args:
+            item: Product dictionary or any other item
+            offer_id: Offer ID of the item (defaults to item["offer_id"])
+        
+        Returns:
+            False if the item was skipped (no valid shelf number)
+        """
+        if offer_id is None:
+            offer_id = item.get("offer_id", "")
+            # Products resolved through the catalog carry a precomputed key
+            if "sort_key" in item and self.engine is get_default_engine():
+                key = item["sort_key"]
+            else:
+                key = self.engine.key(offer_id)
+        else:
+            key = self.engine.key(offer_id)
+        if key is None:
+            logger.debug(
+                f"Skipping product with offer_id '{offer_id}' "
+                f"(no valid number {self.engine.number_min}-{self.engine.number_max} found)"
+            )
+            return False
+        self._buckets[key[0] - self._min].append((key, item))
+        self._count += 1
+        return True
+    
+    def extend(self, products: Iterable[Dict[str, Any]]) -> int:
+        """
+        Place many products into buckets.
+        
+        Returns:
+            Number of products accepted
+        """
+        add = self.add
+        return sum(1 for product in products if add(product))
+    
+    def pop_all(self) -> List[Any]:
+        """Emit and clear all items ordered by shelf."""
+        result = []
+        multi_part = self.engine.key_parts > 1
+        for index, bucket in enumerate(self._buckets):
+            if not bucket:
+                continue
+            if multi_part:
+                bucket.sort(key=lambda entry: entry[0])
+            result.extend(item for _, item in bucket)
+            self._buckets[index] = []
+        self._count = 0
+        return result
+
+
+_default_engine: Optional[SortKeyEngine] = None
+
+
+def get_default_engine() -> SortKeyEngine:
+    """Get engine built from Config (created on first use)."""
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = SortKeyEngine()
+    return _default_engine
+
+
+def reset_default_engine() -> None:
+    """Drop the default engine so it is rebuilt from current Config."""
+    global _default_engine
+    _default_engine = None
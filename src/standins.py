@@ -0,0 +1,877 @@
+"""Local stand-ins for the Ozon, Google Sheets and Telegram APIs and fixture recording."""
+import itertools
+import json
+import logging
+import random
+import re
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+from .config import Config
+from .ozon_client import OzonClient, get_client
+from .sheets_manager import SheetsManager
+
+
+logger = logging.getLogger(__name__)
+
+# Posting and product fields kept by the recorder, everything else
+# (customer, addressee, financial and analytics data...) is dropped
+RECORDED_POSTING_FIELDS = (
+    "posting_number", "order_id", "order_number", "status", "substatus",
+    "shipment_date", "in_process_at", "delivery_method", "products"
+)
+RECORDED_PRODUCT_FIELDS = ("sku", "offer_id", "product_name", "name", "quantity", "picture_url")
+
+# Spreadsheet id of the main spreadsheet in recorded fixtures
+FIXTURE_SHEETS_ID = "offline-sheet"
+PROCESSED_ORDERS_HEADERS = ["Номер отправления", "Название склада", "Дата обработки"]
+
+# "Ozon"/"Access" columns replaced by the recorder
+_REDACTED_COLUMNS = {"Client_id": "client", "API_KEY": "key", "Таблица задач": "tasks", "Chat_id": "chat"}
+
+_A1_CELL = re.compile(r"^([A-Za-z]*)(\d*)$")
+
+
+def load_fixture(path: str) -> Dict[str, Any]:
+    """
+    Read fixture file written by record_fixture() (or by hand).
+    
+    Args:
+        path: JSON file with "ozon" (client_id -> postings) and
+            "sheets" (spreadsheet_id -> {"title", "sheets": title -> rows})
+    
+    Returns:
+        Fixture dictionary
+    """
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class StandInServer:
+    """
+    HTTP server running in a daemon thread, base of the API stand-ins.
+    
+    Subclasses implement handle(method, path, query, headers, body) and
+    return (status, JSON-serializable body or raw bytes, extra headers).
+    """
+    
+    name = "stand-in"
+    
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        """
+        Initialize server (not started yet).
+        
+        Args:
+            host: Listen address
+            port: Listen port (0 picks a free one)
+        """
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._lock = threading.Lock()
+    
+    @property
+    def url(self) -> str:
+        """Base URL of the running server."""
+        return f"http://{self.host}:{self.port}"
+    
+    def start(self) -> "StandInServer":
+        """Start serving from a daemon thread."""
+        standin = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def _serve(self):
+                parts = urlsplit(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                with standin._lock:
+                    standin.requests += 1
+                try:
+                    status, payload, headers = standin.handle(
+                        self.command, unquote(parts.path), parse_qs(parts.query), self.headers, body
+                    )
+                except Exception as e:
+                    logger.error(f"{standin.name}: {self.command} {self.path} failed: {e}", exc_info=True)
+                    status, payload, headers = 500, {"error": str(e)}, {}
+                if isinstance(payload, bytes):
+                    data = payload
+                    content_type = headers.pop("Content-Type", "application/octet-stream")
+                else:
+                    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                    content_type = "application/json; charset=utf-8"
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+            
+            do_GET = do_POST = do_PUT = _serve
+            
+            def log_message(self, format, *args):
+                logger.debug(f"{standin.name}: " + format % args)
+        
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_port
+        threading.Thread(target=self._server.serve_forever, name=self.name, daemon=True).start()
+        logger.info(f"{self.name} stand-in: {self.url}")
+        return self
+    
+    def stop(self) -> None:
+        """Stop the server."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+    
+    def handle(
+        self,
+        method: str,
+        path: str,
+        query: Dict[str, List[str]],
+        headers: Any,
+        body: bytes
+    ) -> Tuple[int, Any, Dict[str, str]]:
+        """Answer a request (implemented by subclasses)."""
+        raise NotImplementedError
+
+
+class OzonStandIn(StandInServer):
+    """
+    Ozon Seller API stand-in: FBS posting list with cursor pagination and package labels.
+    
+    Postings are served per Client-Id header, unknown Client-Ids get 403.
+    The filter is applied by warehouse_ids and delivery_method_ids only;
+    cutoff dates are ignored, a fixture is a snapshot of open postings.
+    """
+    
+    name = "ozon"
+    
+    def __init__(
+        self,
+        postings: Dict[str, List[Dict[str, Any]]],
+        host: str = "127.0.0.1",
+        port: int = 0,
+        page_size: Optional[int] = None,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        seed: Optional[int] = None
+    ):
+        """
+        Initialize stand-in.
+        
+        Args:
+            postings: Dictionary mapping Client-Id to its postings
+            host: Listen address
+            port: Listen port (0 picks a free one)
+            page_size: Postings per page, at most the requested limit
+            latency: Seconds added to every response
+            error_rate: Share of requests answered with 503
+            throttle_rate: Share of requests answered with 429
+            seed: Random seed of the error injection
+        """
+        super().__init__(host, port)
+        self.postings = postings
+        self.page_size = page_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self._random = random.Random(seed)
+        # "200"/"429"/"503"/... -> number of responses
+        self.statuses: Dict[str, int] = {}
+    
+    def _count(self, status: int) -> int:
+        with self._lock:
+            self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+        return status
+    
+    def handle(self, method, path, query, headers, body):
+        if self.latency:
+            time.sleep(self.latency)
+        client_id = headers.get("Client-Id", "")
+        if client_id not in self.postings or not headers.get("Api-Key"):
+            return self._count(403), {"code": 7, "message": "Invalid Api-Key, please contact support"}, {}
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.throttle_rate:
+            return self._count(429), {"code": 8, "message": "You have reached request rate limit per second"}, {}
+        if roll < self.throttle_rate + self.error_rate:
+            return self._count(503), {"code": 14, "message": "Service unavailable"}, {}
+        
+        request = json.loads(body or b"{}")
+        if method == "POST" and path == "/v1/assembly/fbs/posting/list":
+            return self._count(200), self._posting_list(client_id, request), {}
+        if method == "POST" and path == "/v2/posting/fbs/package-label":
+            return self._count(200), _labels_pdf(len(request.get("posting_number", []))), {
+                "Content-Type": "application/pdf"
+            }
+        return self._count(404), {"code": 5, "message": "Not found"}, {}
+    
+    def _posting_list(self, client_id: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Page of postings matching the filter, cursor is the offset of the next page."""
+        filter_dict = request.get("filter") or {}
+        warehouse_ids = {str(i) for i in filter_dict.get("warehouse_ids") or []}
+        method_ids = {str(i) for i in filter_dict.get("delivery_method_ids") or []}
+        postings = [
+            posting for posting in self.postings[client_id]
+            if _matches(posting.get("delivery_method") or {}, warehouse_ids, method_ids)
+        ]
+        if str(request.get("sort_dir", "ASC")).upper() == "DESC":
+            postings.reverse()
+        
+        limit = int(request.get("limit") or 1000)
+        if self.page_size:
+            limit = min(limit, self.page_size)
+        offset = int(request.get("cursor") or 0)
+        page = postings[offset:offset + limit]
+        next_offset = offset + len(page)
+        return {
+            "postings": page,
+            "cursor": str(next_offset) if next_offset < len(postings) else ""
+        }
+
+
+def _matches(delivery_method: Dict[str, Any], warehouse_ids: set, method_ids: set) -> bool:
+    """Check posting's delivery method against the warehouse/delivery method filter."""
+    if warehouse_ids and str(delivery_method.get("warehouse_id", "")) not in warehouse_ids:
+        return False
+    if method_ids and str(delivery_method.get("id", "")) not in method_ids:
+        return False
+    return True
+
+
+def _labels_pdf(pages: int) -> bytes:
+    """Minimal PDF with one blank A6 page per posting (labels are split by page)."""
+    pages = max(1, pages)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % (3 + i) for i in range(pages))
+        + b"] /Count %d >>" % pages,
+    ] + [b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 298 420] >>"] * pages
+    
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+class SheetsStandIn(StandInServer):
+    """
+    Google Sheets API v4 stand-in keeping worksheets in memory.
+    
+    Covers the calls made through gspread by SheetsManager: spreadsheet
+    metadata, values get/update/append/batchUpdate and addSheet. Cell
+    values are stored as sent (formulas are not evaluated).
+    """
+    
+    name = "sheets"
+    
+    def __init__(
+        self,
+        spreadsheets: Dict[str, Dict[str, Any]],
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0
+    ):
+        """
+        Initialize stand-in.
+        
+        Args:
+            spreadsheets: Dictionary mapping spreadsheet id to
+                {"title": ..., "sheets": {worksheet title: rows}}
+            host: Listen address
+            port: Listen port (0 picks a free one)
+            latency: Seconds added to every response
+        """
+        super().__init__(host, port)
+        self.latency = latency
+        self._sheet_ids = itertools.count(1)
+        # spreadsheet id -> {"title": str, "sheets": {title: {"id": int, "rows": [[str]]}}}
+        self.spreadsheets: Dict[str, Dict[str, Any]] = {}
+        for spreadsheet_id, spreadsheet in spreadsheets.items():
+            self.add_spreadsheet(
+                spreadsheet_id, spreadsheet.get("title", spreadsheet_id), spreadsheet.get("sheets", {})
+            )
+    
+    def add_spreadsheet(self, spreadsheet_id: str, title: str, sheets: Dict[str, List[List[Any]]]) -> None:
+        """
+        Add (or replace) a spreadsheet.
+        
+        Args:
+            spreadsheet_id: Spreadsheet id used in GOOGLE_SHEETS_ID or the "Таблица задач" column
+            title: Spreadsheet title
+            sheets: Dictionary mapping worksheet title to rows
+        """
+        with self._lock:
+            self.spreadsheets[spreadsheet_id] = {
+                "id": spreadsheet_id,
+                "title": title,
+                "sheets": {
+                    name: {"id": next(self._sheet_ids), "rows": [[_cell(v) for v in row] for row in rows]}
+                    for name, rows in sheets.items()
+                }
+            }
+    
+    def values(self, spreadsheet_id: str, title: str) -> List[List[str]]:
+        """Current rows of a worksheet (for assertions in tests)."""
+        with self._lock:
+            return [list(row) for row in self.spreadsheets[spreadsheet_id]["sheets"][title]["rows"]]
+    
+    def handle(self, method, path, query, headers, body):
+        if self.latency:
+            time.sleep(self.latency)
+        match = re.match(r"^/v4/spreadsheets/([^/:]+)(.*)$", path)
+        if not match or match.group(1) not in self.spreadsheets:
+            return _sheets_error(404, "Requested entity was not found.", "NOT_FOUND")
+        spreadsheet_id, call = match.groups()
+        request = json.loads(body or b"{}")
+        values = request.get("values", [])
+        
+        with self._lock:
+            spreadsheet = self.spreadsheets[spreadsheet_id]
+            try:
+                if method == "GET" and call == "":
+                    return 200, self._metadata(spreadsheet), {}
+                if method == "POST" and call == ":batchUpdate":
+                    return 200, self._batch_update(spreadsheet, request), {}
+                if method == "POST" and call == "/values:batchUpdate":
+                    responses = [
+                        self._write(spreadsheet, data["range"], data.get("values", []))
+                        for data in request.get("data", [])
+                    ]
+                    return 200, {
+                        "spreadsheetId": spreadsheet_id,
+                        "totalUpdatedCells": sum(response["updatedCells"] for response in responses),
+                        "responses": responses
+                    }, {}
+                if call.startswith("/values/"):
+                    range_name = call[len("/values/"):]
+                    if method == "GET":
+                        return 200, self._read(spreadsheet, range_name), {}
+                    if method == "PUT":
+                        return 200, self._write(spreadsheet, range_name, values), {}
+                    if method == "POST" and range_name.endswith(":append"):
+                        return 200, self._append(spreadsheet, range_name[:-len(":append")], values), {}
+            except KeyError as e:
+                return _sheets_error(400, f"Unable to parse range: {e}", "INVALID_ARGUMENT")
+        return _sheets_error(404, f"Unsupported call {method} {call}", "NOT_FOUND")
+    
+    def _metadata(self, spreadsheet: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "spreadsheetId": spreadsheet["id"],
+            "properties": {"title": spreadsheet["title"], "locale": "ru_RU", "timeZone": "Europe/Moscow"},
+            "sheets": [
+                {"properties": _sheet_properties(title, sheet, index)}
+                for index, (title, sheet) in enumerate(spreadsheet["sheets"].items())
+            ]
+        }
+    
+    def _batch_update(self, spreadsheet: Dict[str, Any], request: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply addSheet requests, others are acknowledged without effect."""
+        sheets = spreadsheet["sheets"]
+        replies = []
+        for item in request.get("requests", []):
+            if "addSheet" in item:
+                title = item["addSheet"].get("properties", {}).get("title") or f"Sheet{len(sheets) + 1}"
+                sheet = sheets.setdefault(title, {"id": next(self._sheet_ids), "rows": []})
+                properties = _sheet_properties(title, sheet, list(sheets).index(title))
+                replies.append({"addSheet": {"properties": properties}})
+            else:
+                replies.append({})
+        return {"spreadsheetId": spreadsheet["id"], "replies": replies}
+    
+    def _read(self, spreadsheet: Dict[str, Any], range_name: str) -> Dict[str, Any]:
+        title, (row0, col0, row1, col1) = _parse_range(range_name)
+        rows = spreadsheet["sheets"][title]["rows"]
+        # Like Sheets, trailing empty cells and rows are not returned
+        values = [_trim(row[col0:col1]) for row in rows[row0:row1]]
+        while values and not values[-1]:
+            values.pop()
+        result = {"range": range_name, "majorDimension": "ROWS"}
+        if values:
+            result["values"] = values
+        return result
+    
+    def _write(self, spreadsheet: Dict[str, Any], range_name: str, values: List[List[Any]]) -> Dict[str, Any]:
+        title, (row0, col0, _, _) = _parse_range(range_name)
+        rows = spreadsheet["sheets"][title]["rows"]
+        for offset, row_values in enumerate(values):
+            while len(rows) <= row0 + offset:
+                rows.append([])
+            row = rows[row0 + offset]
+            if len(row) < col0 + len(row_values):
+                row.extend([""] * (col0 + len(row_values) - len(row)))
+            row[col0:col0 + len(row_values)] = [_cell(v) for v in row_values]
+        return {
+            "spreadsheetId": spreadsheet["id"],
+            "updatedRange": range_name,
+            "updatedRows": len(values),
+            "updatedColumns": max((len(row) for row in values), default=0),
+            "updatedCells": sum(len(row) for row in values)
+        }
+    
+    def _append(self, spreadsheet: Dict[str, Any], range_name: str, values: List[List[Any]]) -> Dict[str, Any]:
+        """Write values below the last non-empty row."""
+        title, (_, col0, _, _) = _parse_range(range_name)
+        rows = spreadsheet["sheets"][title]["rows"]
+        last = len(rows)
+        while last and not _trim(rows[last - 1]):
+            last -= 1
+        column = _column_name(col0)
+        return {
+            "spreadsheetId": spreadsheet["id"],
+            "tableRange": f"'{title}'!A1:{column}{last}" if last else "",
+            "updates": self._write(spreadsheet, f"'{title}'!{column}{last + 1}", values)
+        }
+
+
+def _sheets_error(code: int, message: str, status: str) -> Tuple[int, Dict[str, Any], Dict[str, str]]:
+    """Error response in the Google API format (parsed by gspread's APIError)."""
+    return code, {"error": {"code": code, "message": message, "status": status}}, {}
+
+
+def _sheet_properties(title: str, sheet: Dict[str, Any], index: int) -> Dict[str, Any]:
+    rows = sheet["rows"]
+    return {
+        "sheetId": sheet["id"],
+        "title": title,
+        "index": index,
+        "sheetType": "GRID",
+        "gridProperties": {
+            "rowCount": max(1000, len(rows)),
+            "columnCount": max([26] + [len(row) for row in rows])
+        }
+    }
+
+
+def _cell(value: Any) -> str:
+    """Cell value as returned with the default FORMATTED_VALUE rendering."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    return str(value)
+
+
+def _trim(row: List[str]) -> List[str]:
+    end = len(row)
+    while end and row[end - 1] == "":
+        end -= 1
+    return row[:end]
+
+
+def _column_index(letters: str) -> int:
+    index = 0
+    for letter in letters.upper():
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index - 1
+
+
+def _column_name(index: int) -> str:
+    name = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        name = chr(ord("A") + remainder) + name
+    return name
+
+
+def _parse_range(range_name: str) -> Tuple[str, Tuple[int, int, Optional[int], Optional[int]]]:
+    """
+    Split A1 range like 'Tasks'!A2:G10 into the worksheet title and 0-based bounds.
+    
+    Returns:
+        (title, (first row, first column, end row or None, end column or None))
+    
+    Raises:
+        KeyError: If the range cannot be parsed
+    """
+    if range_name.startswith("'"):
+        end = 1
+        while True:
+            end = range_name.index("'", end)
+            if range_name[end + 1:end + 2] == "'":
+                end += 2
+                continue
+            break
+        title = range_name[1:end].replace("''", "'")
+        cells = range_name[end + 2:] if range_name[end + 1:end + 2] == "!" else ""
+    else:
+        title, _, cells = range_name.partition("!")
+    if not cells:
+        return title, (0, 0, None, None)
+    
+    start, _, stop = cells.partition(":")
+    start_match, stop_match = _A1_CELL.match(start), _A1_CELL.match(stop or start)
+    if not start_match or not stop_match:
+        raise KeyError(range_name)
+    row0 = int(start_match.group(2)) - 1 if start_match.group(2) else 0
+    col0 = _column_index(start_match.group(1)) if start_match.group(1) else 0
+    row1 = int(stop_match.group(2)) if stop_match.group(2) else None
+    col1 = _column_index(stop_match.group(1)) + 1 if stop_match.group(1) else None
+    return title, (row0, col0, row1, col1)
+
+
+class TelegramStandIn(StandInServer):
+    """
+    Telegram Bot API stand-in recording what the bot sends.
+    
+    Updates for the bot are queued with push_update() (or the
+    message_update()/callback_update() helpers) and returned by
+    getUpdates; every other call is answered with a plausible result
+    and appended to sent.
+    """
+    
+    name = "telegram"
+    
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        """
+        Initialize stand-in.
+        
+        Args:
+            host: Listen address
+            port: Listen port (0 picks a free one)
+            latency: Seconds added to every response except getUpdates
+        """
+        super().__init__(host, port)
+        self.latency = latency
+        # (method, parameters) of every call except getUpdates
+        self.sent: List[Tuple[str, Dict[str, Any]]] = []
+        self._updates: List[Dict[str, Any]] = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._new_update = threading.Condition(self._lock)
+    
+    @property
+    def api_url(self) -> str:
+        """Value for TELEGRAM_API_BASE_URL."""
+        return self.url
+    
+    def push_update(self, update: Dict[str, Any]) -> None:
+        """Queue an update (update_id is assigned) for the next getUpdates."""
+        with self._new_update:
+            self._updates.append(dict(update, update_id=next(self._update_ids)))
+            self._new_update.notify_all()
+    
+    def message_update(self, chat_id: int, text: str) -> None:
+        """Queue a private text message (e.g. "/start") from chat_id."""
+        entities = []
+        if text.startswith("/"):
+            entities.append({"type": "bot_command", "offset": 0, "length": len(text.split()[0])})
+        self.push_update({"message": {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Test"},
+            "text": text,
+            "entities": entities
+        }})
+    
+    def callback_update(self, chat_id: int, data: str, message_id: Optional[int] = None) -> None:
+        """Queue an inline button tap with callback data from chat_id."""
+        self.push_update({"callback_query": {
+            "id": str(next(self._update_ids)),
+            "chat_instance": str(chat_id),
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Test"},
+            "data": data,
+            "message": {
+                "message_id": message_id or next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": "menu"
+            }
+        }})
+    
+    def calls(self, method: str) -> List[Dict[str, Any]]:
+        """Parameters of the recorded calls of one method."""
+        with self._lock:
+            return [params for name, params in self.sent if name == method]
+    
+    def handle(self, method, path, query, headers, body):
+        match = re.match(r"^/bot[^/]+/(\w+)$", path)
+        if not match:
+            return 404, {"ok": False, "error_code": 404, "description": "Not Found"}, {}
+        api_method = match.group(1)
+        params = _form_params(headers.get("Content-Type", ""), body)
+        
+        if api_method == "getUpdates":
+            return 200, {"ok": True, "result": self._get_updates(params)}, {}
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.sent.append((api_method, params))
+        return 200, {"ok": True, "result": self._result(api_method, params)}, {}
+    
+    def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params.get("offset") or 0)
+        # Long polling, capped so the bot stops quickly
+        deadline = time.monotonic() + min(float(params.get("timeout") or 0), 1.0)
+        with self._new_update:
+            self._updates = [update for update in self._updates if update["update_id"] >= offset]
+            while not self._updates and time.monotonic() < deadline:
+                self._new_update.wait(deadline - time.monotonic())
+            return list(self._updates)
+    
+    def _result(self, api_method: str, params: Dict[str, Any]) -> Any:
+        if api_method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Offline bot", "username": "offline_bot"}
+        if not api_method.startswith(("send", "edit", "copy", "forward")):
+            return True
+        
+        chat_id = params.get("chat_id", 0)
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        message = {
+            "message_id": int(params.get("message_id") or 0) or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": 1, "is_bot": True, "first_name": "Offline bot"}
+        }
+        if "text" in params:
+            message["text"] = params["text"]
+        if "caption" in params:
+            message["caption"] = params["caption"]
+        file = {"file_id": f"file-{message['message_id']}", "file_unique_id": f"u{message['message_id']}"}
+        if api_method == "sendPhoto":
+            message["photo"] = [dict(file, width=320, height=320)]
+        elif api_method == "sendDocument":
+            message["document"] = file
+        elif api_method == "sendMediaGroup":
+            return [dict(message, message_id=next(self._message_ids)) for _ in params.get("media") or [None]]
+        return message
+
+
+def _form_params(content_type: str, body: bytes) -> Dict[str, Any]:
+    """
+    Parse Bot API request parameters (urlencoded or multipart form).
+    
+    JSON-encoded values (reply_markup, media...) are decoded, uploaded
+    files are replaced by their size.
+    """
+    params: Dict[str, Any] = {}
+    if content_type.startswith("multipart/form-data"):
+        message = BytesParser(policy=HTTP).parsebytes(
+            b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body
+        )
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            payload = part.get_payload(decode=True) or b""
+            if part.get_filename():
+                params[name] = f"<file {len(payload)} bytes>"
+            else:
+                params[name] = payload.decode("utf-8")
+    elif content_type.startswith("application/json"):
+        params = json.loads(body or b"{}")
+    else:
+        params = {key: values[-1] for key, values in parse_qs(body.decode("utf-8")).items()}
+    
+    for key, value in params.items():
+        if isinstance(value, str) and value[:1] in "[{":
+            try:
+                params[key] = json.loads(value)
+            except ValueError:
+                pass
+    return params
+
+
+def redact_posting(posting: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep only the posting and product fields the bot uses (no personal data)."""
+    redacted = {key: posting[key] for key in RECORDED_POSTING_FIELDS if key in posting}
+    redacted["products"] = [
+        {key: product[key] for key in RECORDED_PRODUCT_FIELDS if key in product}
+        for product in posting.get("products", [])
+    ]
+    return redacted
+
+
+class _Redactor:
+    """Consistent replacement of secrets: the same value always gets the same placeholder."""
+    
+    def __init__(self):
+        self._values: Dict[Tuple[str, str], str] = {}
+    
+    def replace(self, kind: str, value: Any) -> str:
+        value = str(value).strip()
+        if not value:
+            return ""
+        key = (kind, value)
+        if key not in self._values:
+            number = sum(1 for known_kind, _ in self._values if known_kind == kind) + 1
+            self._values[key] = str(1000 + number) if kind == "chat" else f"{kind}-{number}"
+        return self._values[key]
+    
+    def placeholders(self, kind: str) -> List[str]:
+        return [placeholder for (known_kind, _), placeholder in self._values.items() if known_kind == kind]
+
+
+def _redact_cell(redactor: _Redactor, kind: Optional[str], value: Any) -> Any:
+    """Replace a cell of a redacted column, Tasks links are reduced to the spreadsheet id first."""
+    if kind is None:
+        return value
+    if kind == "tasks":
+        value = SheetsManager._parse_spreadsheet_id(value)
+    return redactor.replace(kind, value)
+
+
+def record_fixture(sheets_manager: SheetsManager, path: str, names: Optional[List[str]] = None) -> Dict[str, int]:
+    """
+    Record "Ozon"/"Access" sheets and postings of warehouses into a fixture (blocking).
+    
+    Client ids, API keys, Tasks spreadsheet ids and chat ids are replaced
+    by placeholders consistently in both the sheets and the postings;
+    postings keep only RECORDED_POSTING_FIELDS. The main spreadsheet
+    is stored as FIXTURE_SHEETS_ID, Tasks spreadsheets are recorded empty.
+    
+    Args:
+        sheets_manager: Connected SheetsManager of the real spreadsheet
+        path: Output JSON file
+        names: Warehouse names to record postings of (None: all)
+    
+    Returns:
+        Numbers of recorded warehouses, postings and access rows
+    """
+    redactor = _Redactor()
+    sheets: Dict[str, List[List[str]]] = {}
+    for title in ("Ozon", "Access"):
+        rows = sheets_manager.spreadsheet.worksheet(title).get_all_values()
+        header = rows[0] if rows else []
+        columns = {
+            index: _REDACTED_COLUMNS[name]
+            for index, name in enumerate(header) if name in _REDACTED_COLUMNS
+        }
+        sheets[title] = [header] + [
+            [_redact_cell(redactor, columns.get(index), value) for index, value in enumerate(row)]
+            for row in rows[1:]
+        ]
+    
+    postings: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    warehouses = [
+        warehouse for warehouse in sheets_manager.get_warehouses()
+        if not names or warehouse["warehouse_name"] in names
+    ]
+    for warehouse in warehouses:
+        client = get_client(client_id=warehouse["client_id"], api_key=warehouse["api_key"])
+        recorded = postings.setdefault(redactor.replace("client", warehouse["client_id"]), {})
+        for posting in client.get_all_postings(filter_dict=OzonClient.filter_for_warehouse(warehouse)):
+            recorded[posting.get("posting_number", "")] = redact_posting(posting)
+        logger.info(f"Recorded postings of warehouse {warehouse['warehouse_name']}")
+    
+    # Only the header of the processed orders log
+    sheets["ProcessedOrders"] = [PROCESSED_ORDERS_HEADERS]
+    fixture_sheets = {FIXTURE_SHEETS_ID: {"title": "Offline", "sheets": sheets}}
+    for placeholder in redactor.placeholders("tasks"):
+        fixture_sheets[placeholder] = {"title": placeholder, "sheets": {}}
+    fixture = {
+        "ozon": {client_id: list(by_number.values()) for client_id, by_number in postings.items()},
+        "sheets": fixture_sheets
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(fixture, f, ensure_ascii=False, indent=1)
+    return {
+        "warehouses": len(warehouses),
+        "postings": sum(len(by_number) for by_number in postings.values()),
+        "access_rows": max(0, len(sheets["Access"]) - 1)
+    }
+
+
+def generate_fixture(
+    warehouses: int = 2,
+    postings: int = 500,
+    chat_id: str = "1001",
+    seed: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Build a synthetic fixture for load tests without recorded data.
+    
+    Every warehouse gets its own client id, postings with 1-3 products and
+    offer_ids with shelf codes; chat_id has access to all warehouses.
+    
+    Args:
+        warehouses: Number of warehouses
+        postings: Postings per warehouse
+        chat_id: Chat listed in the "Access" sheet
+        seed: Random seed
+    
+    Returns:
+        Fixture dictionary as from load_fixture()
+    """
+    rng = random.Random(seed)
+    ozon_rows = [[
+        "Город", "Название склада", "Client_id", "API_KEY", "Delivery_method_ids",
+        "Warehouse_ids", "Provider_ids", "Дней назад", "Дней вперёд", "Таблица задач", "Лист задач"
+    ]]
+    access_rows = [["Название склада", "Chat_id"]]
+    ozon: Dict[str, List[Dict[str, Any]]] = {}
+    for number in range(1, warehouses + 1):
+        name, client_id = f"Склад {number}", f"client-{number}"
+        ozon_rows.append(["Москва", name, client_id, f"key-{number}", "", "", "", "", "", "", ""])
+        access_rows.append([name, chat_id])
+        ozon[client_id] = [
+            {
+                "posting_number": f"{10000000 + number * 100000 + index}-0001-1",
+                "status": "awaiting_packaging",
+                "delivery_method": {"id": number, "warehouse_id": number, "name": name},
+                "products": [
+                    {
+                        "sku": sku,
+                        "offer_id": f"{rng.choice('ABCDE')}{rng.randint(1, 40)}-{sku}",
+                        "product_name": f"Товар {sku}",
+                        "quantity": rng.randint(1, 3),
+                        "picture_url": ""
+                    }
+                    for sku in rng.sample(range(100000, 100000 + postings * 2), rng.randint(1, 3))
+                ]
+            }
+            for index in range(postings)
+        ]
+    return {
+        "ozon": ozon,
+        "sheets": {FIXTURE_SHEETS_ID: {"title": "Offline", "sheets": {
+            "Ozon": ozon_rows,
+            "Access": access_rows,
+            "ProcessedOrders": [PROCESSED_ORDERS_HEADERS]
+        }}}
+    }
+
+
+def start_standins(
+    fixture: Dict[str, Any],
+    host: str = "127.0.0.1",
+    ports: Tuple[int, int, int] = (0, 0, 0),
+    **ozon_options: Any
+) -> Tuple[OzonStandIn, SheetsStandIn, TelegramStandIn]:
+    """
+    Start all three stand-ins and point Config at them.
+    
+    Args:
+        fixture: Fixture from load_fixture()
+        host: Listen address
+        ports: Ozon, Sheets and Telegram ports (0 picks free ones)
+        **ozon_options: page_size, latency, error_rate, throttle_rate, seed of OzonStandIn
+    
+    Returns:
+        Running (ozon, sheets, telegram) stand-ins
+    """
+    ozon = OzonStandIn(fixture.get("ozon", {}), host, ports[0], **ozon_options).start()
+    sheets = SheetsStandIn(fixture.get("sheets", {}), host, ports[1]).start()
+    telegram = TelegramStandIn(host, ports[2]).start()
+    Config.OZON_API_BASE_URL = ozon.url
+    Config.SHEETS_API_BASE_URL = sheets.url
+    Config.TELEGRAM_API_BASE_URL = telegram.url
+    return ozon, sheets, telegram
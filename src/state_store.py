@@ -0,0 +1,361 @@
+"""Local SQLite storage for bot state that must survive restarts."""
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set
+from .config import Config
+
+
+logger = logging.getLogger(__name__)
+
+
+class StateStore:
+    """Thread-safe SQLite store for delivery state."""
+    
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        Open (and create if needed) the state database.
+        
+        Args:
+            db_path: Path to SQLite file (defaults to Config.STATE_DB_PATH)
+        """
+        self.db_path = db_path or Config.STATE_DB_PATH
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._create_tables()
+        logger.info(f"State store opened: {self.db_path}")
+    
+    def _create_tables(self) -> None:
+        """Create tables if they don't exist."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS delivered_postings (
+                    warehouse_name TEXT NOT NULL,
+                    posting_number TEXT NOT NULL,
+                    delivered_at TEXT NOT NULL,
+                    PRIMARY KEY (warehouse_name, posting_number)
+                )
+                """
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS snapshots (
+                    name TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    saved_at TEXT NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS delivery_runs (
+                    chat_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    cursor INTEGER NOT NULL DEFAULT 0,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (chat_id, name)
+                )
+                """
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS task_postings (
+                    worksheet TEXT NOT NULL,
+                    warehouse_name TEXT NOT NULL,
+                    posting_number TEXT NOT NULL,
+                    written_at TEXT NOT NULL,
+                    PRIMARY KEY (worksheet, warehouse_name, posting_number)
+                )
+                """
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS poll_baselines (
+                    warehouse_name TEXT PRIMARY KEY,
+                    taken_at TEXT NOT NULL
+                )
+                """
+            )
+            # Databases from before poll_baselines: warehouses with delivered
+            # postings have been polled already
+            self._conn.execute(
+                "INSERT OR IGNORE INTO poll_baselines (warehouse_name, taken_at) "
+                "SELECT warehouse_name, MIN(delivered_at) FROM delivered_postings GROUP BY warehouse_name"
+            )
+    
+    def get_delivered(self, warehouse_name: str) -> Set[str]:
+        """
+        Get posting numbers already delivered for a warehouse.
+        
+        Args:
+            warehouse_name: Name of the warehouse
+        
+        Returns:
+            Set of posting numbers
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT posting_number FROM delivered_postings WHERE warehouse_name = ?",
+                (warehouse_name,)
+            ).fetchall()
+        return {row[0] for row in rows}
+    
+    def mark_delivered(self, warehouse_name: str, posting_numbers: Iterable[str]) -> None:
+        """
+        Remember postings as delivered for a warehouse.
+        
+        Args:
+            warehouse_name: Name of the warehouse
+            posting_numbers: Posting numbers to mark
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        rows = [(warehouse_name, str(number), now) for number in posting_numbers if number]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO delivered_postings "
+                "(warehouse_name, posting_number, delivered_at) VALUES (?, ?, ?)",
+                rows
+            )
+    
+    def has_baseline(self, warehouse_name: str) -> bool:
+        """
+        Check whether the poller has taken the first poll of a warehouse.
+        
+        Args:
+            warehouse_name: Name of the warehouse
+        
+        Returns:
+            True if the backlog of the warehouse was already recorded
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM poll_baselines WHERE warehouse_name = ?", (warehouse_name,)
+            ).fetchone()
+        return row is not None
+    
+    def mark_baseline(self, warehouse_name: str) -> None:
+        """
+        Remember that the first poll of a warehouse was taken (never pruned).
+        
+        Args:
+            warehouse_name: Name of the warehouse
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO poll_baselines (warehouse_name, taken_at) VALUES (?, ?)",
+                (warehouse_name, now)
+            )
+    
+    def get_task_postings(self, worksheet: str, warehouse_name: str) -> Set[str]:
+        """
+        Get posting numbers a warehouse has rows for in a Tasks worksheet.
+        
+        Args:
+            worksheet: Tasks worksheet as "spreadsheet_id/worksheet name"
+            warehouse_name: Name of the warehouse
+        
+        Returns:
+            Set of posting numbers
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT posting_number FROM task_postings WHERE worksheet = ? AND warehouse_name = ?",
+                (worksheet, warehouse_name)
+            ).fetchall()
+        return {row[0] for row in rows}
+    
+    def add_task_postings(self, worksheet: str, warehouse_name: str, posting_numbers: Iterable[str]) -> None:
+        """
+        Remember postings written to a Tasks worksheet for a warehouse.
+        
+        Args:
+            worksheet: Tasks worksheet as "spreadsheet_id/worksheet name"
+            warehouse_name: Name of the warehouse
+            posting_numbers: Posting numbers of the written rows
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        rows = [(worksheet, warehouse_name, str(number), now) for number in posting_numbers if number]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO task_postings "
+                "(worksheet, warehouse_name, posting_number, written_at) VALUES (?, ?, ?, ?)",
+                rows
+            )
+    
+    def forget_task_postings(self, worksheet: str, warehouse_name: str, posting_numbers: Iterable[str]) -> None:
+        """
+        Forget postings whose Tasks rows were marked as no longer relevant.
+        
+        Args:
+            worksheet: Tasks worksheet as "spreadsheet_id/worksheet name"
+            warehouse_name: Name of the warehouse
+            posting_numbers: Posting numbers to forget
+        """
+        rows = [(worksheet, warehouse_name, str(number)) for number in posting_numbers]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM task_postings WHERE worksheet = ? AND warehouse_name = ? AND posting_number = ?",
+                rows
+            )
+    
+    def prune_delivered(self, max_age_days: float) -> int:
+        """
+        Forget delivered postings older than max_age_days.
+        
+        Args:
+            max_age_days: Age in days (0 or less keeps everything)
+        
+        Returns:
+            Number of postings forgotten
+        """
+        if max_age_days <= 0:
+            return 0
+        cutoff = (datetime.now() - timedelta(days=max_age_days)).strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM delivered_postings WHERE delivered_at < ?", (cutoff,)
+            )
+        return cursor.rowcount
+    
+    def save_snapshot(self, name: str, data: Any) -> None:
+        """
+        Store JSON-serializable data under a name, replacing the previous one.
+        
+        Args:
+            name: Snapshot name
+            data: Data to store
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO snapshots (name, data, saved_at) VALUES (?, ?, ?)",
+                (name, json.dumps(data, ensure_ascii=False), now)
+            )
+    
+    def load_snapshot(self, name: str) -> Optional[Any]:
+        """
+        Load data stored by save_snapshot().
+        
+        Args:
+            name: Snapshot name
+        
+        Returns:
+            Stored data or None if there is no snapshot
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM snapshots WHERE name = ?", (name,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def save_run(self, chat_id: str, name: str, kind: str, data: Dict[str, Any]) -> None:
+        """
+        Checkpoint a delivery run before its first message is sent.
+        
+        Args:
+            chat_id: Telegram chat ID
+            name: Warehouse name (or aggregated run name)
+            kind: Job type used to restart the run ("warehouse", "all_warehouses" or "poller")
+            data: JSON-serializable run: sorted items, postings, progress messages
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO delivery_runs (chat_id, name, kind, data, cursor, updated_at) "
+                "VALUES (?, ?, ?, ?, 0, ?)",
+                (str(chat_id), name, kind, json.dumps(data, ensure_ascii=False), now)
+            )
+    
+    def advance_run(self, chat_id: str, name: str, cursor: int) -> None:
+        """
+        Remember that items before cursor were delivered.
+        
+        Args:
+            chat_id: Telegram chat ID
+            name: Run name
+            cursor: Index of the next item to send
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE delivery_runs SET cursor = ?, updated_at = ? WHERE chat_id = ? AND name = ?",
+                (cursor, now, str(chat_id), name)
+            )
+    
+    def finish_run(self, chat_id: str, name: str) -> None:
+        """Drop the checkpoint of a delivered (or cancelled) run."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM delivery_runs WHERE chat_id = ? AND name = ?",
+                (str(chat_id), name)
+            )
+    
+    def get_run_postings(self, kind: str, warehouse_name: str) -> Set[str]:
+        """
+        Get posting numbers of a warehouse in runs still being delivered.
+        
+        Args:
+            kind: Job type of the runs
+            warehouse_name: Name of the warehouse
+        
+        Returns:
+            Set of posting numbers
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM delivery_runs WHERE kind = ?", (kind,)
+            ).fetchall()
+        numbers: Set[str] = set()
+        for (data,) in rows:
+            numbers.update(json.loads(data).get("postings", {}).get(warehouse_name, []))
+        return numbers
+    
+    def load_runs(
+        self,
+        max_age_hours: float,
+        chat_id: Optional[str] = None,
+        name: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Get unfinished runs, dropping those not advanced for max_age_hours.
+        
+        Args:
+            max_age_hours: Older runs are stale (the user has moved on)
+            chat_id: Only runs of this chat
+            name: Only runs with this name
+        
+        Returns:
+            Runs as dictionaries with chat_id, name, kind, cursor and the saved data
+        """
+        cutoff = (datetime.now() - timedelta(hours=max_age_hours)).strftime("%Y-%m-%d %H:%M:%S")
+        query = "SELECT chat_id, name, kind, data, cursor FROM delivery_runs WHERE updated_at >= ?"
+        args: List[Any] = [cutoff]
+        if chat_id is not None:
+            query += " AND chat_id = ?"
+            args.append(str(chat_id))
+        if name is not None:
+            query += " AND name = ?"
+            args.append(name)
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM delivery_runs WHERE updated_at < ?", (cutoff,))
+            rows = self._conn.execute(query, args).fetchall()
+        return [
+            dict(json.loads(data), chat_id=row_chat_id, name=row_name, kind=kind, cursor=cursor)
+            for row_chat_id, row_name, kind, data, cursor in rows
+        ]
+    
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,250 @@
+"""Headless batch sync of warehouse postings into "Tasks" sheets."""
+import csv
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from .catalog import ProductCatalog
+from .config import Config
+from .metrics import PARSE_SECONDS
+from .ozon_client import OzonClient, get_client
+from .sheets_manager import TASKS_HEADERS, SheetsManager
+from .sort_keys import ShelfBuckets
+from .tracing import bind, start_trace
+
+
+logger = logging.getLogger(__name__)
+
+# Columns of the dry-run file: warehouse name followed by the Tasks columns
+DRY_RUN_HEADERS = ["Склад"] + TASKS_HEADERS
+
+
+class WarehouseSyncResult:
+    """Outcome and per-stage timings of syncing one warehouse."""
+    
+    def __init__(self, warehouse_name: str):
+        """
+        Create empty result.
+        
+        Args:
+            warehouse_name: Name of the warehouse
+        """
+        self.warehouse_name = warehouse_name
+        self.postings = 0
+        self.products: List[Dict[str, Any]] = []
+        self.posting_numbers: List[str] = []
+        self.fetch_seconds = 0.0
+        self.parse_seconds = 0.0
+        self.write_seconds = 0.0
+        self.error = ""
+    
+    @property
+    def total_seconds(self) -> float:
+        """Time spent on all stages."""
+        return self.fetch_seconds + self.parse_seconds + self.write_seconds
+
+
+class BatchSync:
+    """
+    Fetches postings of many warehouses concurrently and writes them to Tasks.
+    
+    Every warehouse runs fetch -> parse -> write in its own worker thread, so
+    writes of finished warehouses overlap with fetches of the others and a
+    failing warehouse does not affect the rest. Postings are not marked as
+    delivered, the bot still sends them to the warehouse chats.
+    """
+    
+    def __init__(
+        self,
+        sheets_manager: SheetsManager,
+        concurrency: Optional[int] = None,
+        catalog: Optional[ProductCatalog] = None
+    ):
+        """
+        Initialize sync.
+        
+        Args:
+            sheets_manager: Sheets manager for warehouse configs and Tasks writes
+            concurrency: Warehouses processed at once (defaults to Config.FETCH_CONCURRENCY)
+            catalog: Optional product catalog resolving repeated SKUs
+        """
+        self.sheets_manager = sheets_manager
+        self.concurrency = max(1, concurrency or Config.FETCH_CONCURRENCY)
+        self.catalog = catalog
+    
+    def select_warehouses(self, names: Iterable[str]) -> List[Dict[str, Any]]:
+        """
+        Resolve warehouse names from the command line.
+        
+        Args:
+            names: Warehouse names, "all" selects every warehouse of the "Ozon" sheet
+        
+        Returns:
+            Warehouse configs in "Ozon" sheet order
+        
+        Raises:
+            ValueError: If a name is not in the "Ozon" sheet
+        """
+        warehouses = self.sheets_manager.get_warehouses()
+        names = [name.strip() for name in names if name.strip()]
+        if not names or "all" in names:
+            return warehouses
+        known = {warehouse["warehouse_name"] for warehouse in warehouses}
+        unknown = [name for name in names if name not in known]
+        if unknown:
+            raise ValueError(f"Unknown warehouses: {', '.join(unknown)}")
+        return [warehouse for warehouse in warehouses if warehouse["warehouse_name"] in names]
+    
+    def run(
+        self,
+        warehouses: List[Dict[str, Any]],
+        dry_run: Optional[str] = None
+    ) -> List[WarehouseSyncResult]:
+        """
+        Sync warehouses (blocking).
+        
+        Args:
+            warehouses: Warehouse configs from the "Ozon" sheet
+            dry_run: Write rows to this CSV file instead of Google Sheets
+        
+        Returns:
+            Results in the order of warehouses
+        """
+        write = self._write_tasks if dry_run is None else None
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(warehouses) or 1)) as executor:
+            results = list(executor.map(
+                bind(lambda warehouse: self.sync_warehouse(warehouse, write)),
+                warehouses
+            ))
+        if dry_run is not None:
+            started = time.perf_counter()
+            rows = write_dry_run(dry_run, results)
+            logger.info(
+                f"Dry run: {rows} rows written to {dry_run} "
+                f"in {time.perf_counter() - started:.2f}s"
+            )
+        if self.catalog is not None:
+            self.catalog.flush()
+        return results
+    
+    def sync_warehouse(
+        self,
+        warehouse: Dict[str, Any],
+        write: Optional[Callable[[WarehouseSyncResult], None]] = None
+    ) -> WarehouseSyncResult:
+        """
+        Fetch, parse and (optionally) write one warehouse.
+        
+        Args:
+            warehouse: Warehouse config from the "Ozon" sheet
+            write: Called with the result to store its products (None skips writing)
+        
+        Returns:
+            Result with timings, error is set instead of raising
+        """
+        warehouse_name = warehouse["warehouse_name"]
+        result = WarehouseSyncResult(warehouse_name)
+        with start_trace("sync", warehouse=warehouse_name):
+            try:
+                started = time.perf_counter()
+                ozon_client = get_client(
+                    client_id=warehouse["client_id"],
+                    api_key=warehouse["api_key"]
+                )
+                postings = ozon_client.get_all_postings(
+                    filter_dict=OzonClient.filter_for_warehouse(warehouse)
+                )
+                result.fetch_seconds = time.perf_counter() - started
+                result.postings = len(postings)
+                
+                started = time.perf_counter()
+                buckets = ShelfBuckets()
+                posting_numbers = set()
+                with PARSE_SECONDS.time(mode="sync"):
+                    for posting in postings:
+                        buckets.extend(OzonClient.parse_posting_products(posting, self.catalog))
+                        if posting.get("posting_number"):
+                            posting_numbers.add(posting["posting_number"])
+                # Tasks keeps one row per posting even in aggregated mode
+                result.products = buckets.pop_all()
+                result.posting_numbers = sorted(posting_numbers)
+                result.parse_seconds = time.perf_counter() - started
+                
+                if write is not None:
+                    started = time.perf_counter()
+                    write(result)
+                    result.write_seconds = time.perf_counter() - started
+            except Exception as e:
+                result.error = str(e) or type(e).__name__
+                logger.error(f"Sync of warehouse {warehouse_name} failed: {e}", exc_info=True)
+        return result
+    
+    def _write_tasks(self, result: WarehouseSyncResult) -> None:
+        """
+        Write products of a warehouse to its Tasks worksheet and log its postings.
+        
+        Rows of postings the warehouse no longer returns are marked stale.
+        
+        Raises:
+            RuntimeError: If Tasks could not be written
+        """
+        if result.products:
+            if not self.sheets_manager.add_to_tasks(result.products, result.warehouse_name):
+                raise RuntimeError("writing Tasks failed")
+            self.sheets_manager.log_processed_orders({result.warehouse_name: result.posting_numbers})
+        self.sheets_manager.mark_stale_tasks({result.warehouse_name: result.posting_numbers})
+
+
+def write_dry_run(path: str, results: List[WarehouseSyncResult]) -> int:
+    """
+    Write rows that would be added to Tasks as CSV (UTF-8 with BOM, ";"-separated).
+    
+    Args:
+        path: Output file
+        results: Sync results
+    
+    Returns:
+        Number of rows written
+    """
+    count = 0
+    with open(Path(path), "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(DRY_RUN_HEADERS)
+        for result in results:
+            for product in result.products:
+                writer.writerow([result.warehouse_name] + SheetsManager.task_row(product))
+                count += 1
+    return count
+
+
+def format_report(results: List[WarehouseSyncResult], elapsed: float) -> str:
+    """
+    Build the per-warehouse timing table printed by the sync command.
+    
+    Args:
+        results: Sync results
+        elapsed: Wall-clock seconds of the whole run
+    
+    Returns:
+        Multi-line report
+    """
+    width = max([len("Склад")] + [len(result.warehouse_name) for result in results])
+    lines = [
+        f"{'Склад':<{width}}  {'отпр.':>6}  {'товары':>6}  "
+        f"{'fetch, с':>8}  {'parse, с':>8}  {'write, с':>8}  {'всего, с':>8}  статус"
+    ]
+    for result in results:
+        status = f"❌ {result.error}" if result.error else "✅"
+        lines.append(
+            f"{result.warehouse_name:<{width}}  {result.postings:>6}  {len(result.products):>6}  "
+            f"{result.fetch_seconds:>8.2f}  {result.parse_seconds:>8.2f}  "
+            f"{result.write_seconds:>8.2f}  {result.total_seconds:>8.2f}  {status}"
+        )
+    failed = sum(1 for result in results if result.error)
+    lines.append(
+        f"Складов: {len(results)}, с ошибкой: {failed}, "
+        f"товаров: {sum(len(result.products) for result in results)}, "
+        f"время: {elapsed:.2f} с"
+    )
+    return "\n".join(lines)
@@ -0,0 +1,378 @@
+"""Request-scoped tracing spans exported as JSON lines or OTLP/HTTP."""
+import contextvars
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import requests
+from .config import Config
+
+
+logger = logging.getLogger(__name__)
+
+# Spans waiting for export, new spans are dropped when the queue is full
+EXPORT_QUEUE_SIZE = 10000
+
+# Max spans per export call and max seconds a finished span waits for export
+EXPORT_BATCH_SIZE = 256
+EXPORT_INTERVAL = 1.0
+
+SERVICE_NAME = "ozonbot"
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+def _new_id(size: int) -> str:
+    """Random hex id of size bytes."""
+    return os.urandom(size).hex()
+
+
+class Span:
+    """One timed operation of a trace."""
+    
+    __slots__ = (
+        "name", "trace_id", "span_id", "parent_id", "attributes",
+        "start_time", "end_time", "_started", "duration", "error"
+    )
+    
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        """
+        Start span.
+        
+        Args:
+            name: Operation name, e.g. "ozon.request"
+            trace_id: Id shared by all spans of the trace (32 hex chars)
+            parent_id: Id of the enclosing span or None for the root span
+            attributes: Initial attributes (warehouse, page, rows, status...)
+        """
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        self.end_time = 0.0
+        self.duration = 0.0
+        self.error = ""
+    
+    def set_attribute(self, key: str, value: Any) -> None:
+        """Set attribute of the span."""
+        self.attributes[key] = value
+    
+    def end(self) -> None:
+        """Finish span and hand it to the exporter."""
+        self.duration = time.perf_counter() - self._started
+        self.end_time = self.start_time + self.duration
+        if _processor is not None:
+            _processor.submit(self)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Span as a JSON-serializable dict (one JSON line)."""
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start_time,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error or None,
+        }
+
+
+class _NoopSpan:
+    """Span used while tracing is disabled."""
+    
+    trace_id = ""
+    span_id = ""
+    
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def tracing_enabled() -> bool:
+    """Whether spans are recorded (an exporter is configured)."""
+    return _processor is not None
+
+
+def current_span() -> Optional[Span]:
+    """Span of the running operation, if any."""
+    return _current_span.get()
+
+
+def set_attributes(**attributes: Any) -> None:
+    """Set attributes of the current span (no-op outside of a span)."""
+    span_ = _current_span.get()
+    if span_ is not None:
+        span_.attributes.update(attributes)
+
+
+@contextmanager
+def _run_span(name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]) -> Iterator[Span]:
+    """Make span current for the with-block and end it afterwards."""
+    span_ = Span(name, trace_id, parent_id, attributes)
+    token = _current_span.set(span_)
+    try:
+        yield span_
+    except BaseException as e:
+        span_.error = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        span_.end()
+
+
+@contextmanager
+def start_trace(name: str, **attributes: Any) -> Iterator[Span]:
+    """
+    Start a new trace with a root span (one per callback or background run).
+    
+    Args:
+        name: Root span name
+        **attributes: Span attributes
+    """
+    if _processor is None:
+        yield _NOOP_SPAN
+        return
+    with _run_span(name, _new_id(16), None, attributes) as span_:
+        yield span_
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """
+    Time the with-block as a child of the current span.
+    
+    Outside of a trace a new trace is started, so calls made from
+    background threads are recorded too.
+    
+    Args:
+        name: Span name
+        **attributes: Span attributes
+    """
+    if _processor is None:
+        yield _NOOP_SPAN
+        return
+    parent = _current_span.get()
+    if parent is None:
+        trace_id, parent_id = _new_id(16), None
+    else:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    with _run_span(name, trace_id, parent_id, attributes) as span_:
+        yield span_
+
+
+def traced(name: str, **attributes: Any):
+    """Decorator wrapping every call of a function in a span."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def bind(func: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Bind function to the current trace for running it in another thread.
+    
+    asyncio.to_thread() does this itself, plain threads and executors don't.
+    Each call runs in its own copy of the context, so the result may be
+    called from several threads at once.
+    """
+    context = contextvars.copy_context()
+    
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+    return wrapper
+
+
+class JsonLinesExporter:
+    """Appends finished spans to a file, one JSON object per line."""
+    
+    def __init__(self, path: str):
+        """
+        Initialize exporter.
+        
+        Args:
+            path: Output file (appended to)
+        """
+        self.path = path
+    
+    def export(self, spans: List[Span]) -> None:
+        """Write spans to the file."""
+        with open(self.path, "a", encoding="utf-8") as f:
+            for span_ in spans:
+                f.write(json.dumps(span_.to_dict(), ensure_ascii=False, default=str) + "\n")
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    """Convert attribute value to OTLP AnyValue."""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OtlpHttpExporter:
+    """Sends spans to an OTLP/HTTP collector as JSON (POST /v1/traces)."""
+    
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        """
+        Initialize exporter.
+        
+        Args:
+            endpoint: Collector traces URL, e.g. http://127.0.0.1:4318/v1/traces
+            timeout: Request timeout in seconds
+        """
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.session = requests.Session()
+    
+    @staticmethod
+    def _otlp_span(span_: Span) -> Dict[str, Any]:
+        """Convert span to OTLP JSON."""
+        data = {
+            "traceId": span_.trace_id,
+            "spanId": span_.span_id,
+            "name": span_.name,
+            # SPAN_KIND_INTERNAL
+            "kind": 1,
+            "startTimeUnixNano": str(int(span_.start_time * 1e9)),
+            "endTimeUnixNano": str(int(span_.end_time * 1e9)),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in span_.attributes.items()
+            ],
+            # STATUS_CODE_ERROR / STATUS_CODE_OK
+            "status": {"code": 2, "message": span_.error} if span_.error else {"code": 1},
+        }
+        if span_.parent_id:
+            data["parentSpanId"] = span_.parent_id
+        return data
+    
+    def export(self, spans: List[Span]) -> None:
+        """Send spans in one request."""
+        body = {
+            "resourceSpans": [{
+                "resource": {
+                    "attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]
+                },
+                "scopeSpans": [{
+                    "scope": {"name": SERVICE_NAME},
+                    "spans": [self._otlp_span(span_) for span_ in spans],
+                }],
+            }]
+        }
+        response = self.session.post(self.endpoint, json=body, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class _SpanProcessor:
+    """Exports finished spans in batches from a background thread."""
+    
+    def __init__(self, exporters: List[Any]):
+        """Start export thread."""
+        self.exporters = exporters
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._worker, name="trace-export", daemon=True)
+        self._thread.start()
+    
+    def submit(self, span_: Span) -> None:
+        """Queue finished span, never blocks the caller."""
+        try:
+            self._queue.put_nowait(span_)
+        except queue.Full:
+            self.dropped += 1
+    
+    def _worker(self) -> None:
+        """Collect spans into batches and export them."""
+        stopping = False
+        while not stopping:
+            batch: List[Span] = []
+            deadline = time.monotonic() + EXPORT_INTERVAL
+            while len(batch) < EXPORT_BATCH_SIZE:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            if batch:
+                self._export(batch)
+    
+    def _export(self, batch: List[Span]) -> None:
+        """Hand batch to every exporter, failures only lose this batch."""
+        for exporter in self.exporters:
+            try:
+                exporter.export(batch)
+            except Exception as e:
+                logger.warning(f"Exporting {len(batch)} spans with {type(exporter).__name__} failed: {e}")
+    
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Export queued spans and stop the thread."""
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+
+_processor: Optional[_SpanProcessor] = None
+
+
+def configure_tracing(file: Optional[str] = None, otlp_endpoint: Optional[str] = None) -> bool:
+    """
+    Enable tracing with the configured exporters.
+    
+    Args:
+        file: JSON lines output file (defaults to Config.TRACE_FILE)
+        otlp_endpoint: OTLP/HTTP traces URL (defaults to Config.TRACE_OTLP_ENDPOINT)
+    
+    Returns:
+        True if tracing is enabled (at least one exporter configured)
+    """
+    global _processor
+    file = Config.TRACE_FILE if file is None else file
+    otlp_endpoint = Config.TRACE_OTLP_ENDPOINT if otlp_endpoint is None else otlp_endpoint
+    
+    exporters: List[Any] = []
+    if file:
+        exporters.append(JsonLinesExporter(file))
+    if otlp_endpoint:
+        exporters.append(OtlpHttpExporter(otlp_endpoint))
+    
+    shutdown_tracing()
+    if exporters:
+        _processor = _SpanProcessor(exporters)
+        logger.info(f"Tracing enabled: {', '.join(type(exporter).__name__ for exporter in exporters)}")
+    return bool(exporters)
+
+
+def shutdown_tracing() -> None:
+    """Export pending spans and disable tracing."""
+    global _processor
+    processor, _processor = _processor, None
+    if processor is not None:
+        processor.shutdown()
+        if processor.dropped:
+            logger.warning(f"Tracing: {processor.dropped} spans dropped (export queue full)")
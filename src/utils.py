@@ -1,35 +1,187 @@
 """Helper utility functions."""
+import atexit
+import copy
+import hashlib
+import itertools
+import json
 import logging
-from typing import Optional
+import logging.handlers
+import queue
+from datetime import datetime, timezone
+from typing import Optional, List, Dict, Any, Iterable
+from .config import Config
+from .sort_keys import get_default_engine
+from .tracing import current_span
+
+
+logger = logging.getLogger(__name__)
+
+# Telegram rejects buttons whose callback_data is longer than this
+MAX_CALLBACK_DATA_BYTES = 64
+
+# Background thread writing log records queued by the application
+_log_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class _LogQueueHandler(logging.handlers.QueueHandler):
+    """Queues records for the listener thread without formatting them."""
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge arguments now (they may change later) and remember the trace,
+        # formatting and tracebacks are left to the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        span = current_span()
+        record.trace_id = span.trace_id if span is not None else ""
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats log records as one JSON object per line."""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "trace_id", ""):
+            data["trace_id"] = record.trace_id
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class LogSampler:
+    """Lets through the first and then every n-th call (for per-page noise)."""
+    
+    def __init__(self, every: int):
+        """
+        Initialize sampler.
+        
+        Args:
+            every: Sampling period, 1 lets every call through
+        """
+        self.every = max(1, every)
+        self._counter = itertools.count()
+    
+    def __call__(self) -> bool:
+        """Whether this call should be logged."""
+        return next(self._counter) % self.every == 0
 
 
 def setup_logging(log_level: str = "INFO", log_file: str = "bot.log") -> None:
     """
     Configure logging for the application.
     
+    Records are put on a queue and written to the rotating log file and the
+    console by a background thread, so logging never blocks the event loop.
+    Rotation and JSON output follow the LOG_* settings.
+    
     Args:
         log_level: Logging level (DEBUG, INFO, WARNING, ERROR)
         log_file: Path to log file
     """
+    global _log_listener
+    
     # Convert string level to logging constant
     numeric_level = getattr(logging, log_level.upper(), logging.INFO)
     
     # Configure logging format
-    log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    date_format = "%Y-%m-%d %H:%M:%S"
+    if Config.LOG_JSON:
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S"
+        )
     
-    # Configure logging to both file and console
+    if Config.LOG_ROTATE_WHEN:
+        file_handler = logging.handlers.TimedRotatingFileHandler(
+            log_file,
+            when=Config.LOG_ROTATE_WHEN,
+            backupCount=Config.LOG_BACKUP_COUNT,
+            encoding="utf-8"
+        )
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file,
+            maxBytes=Config.LOG_MAX_BYTES,
+            backupCount=Config.LOG_BACKUP_COUNT,
+            encoding="utf-8"
+        )
+    handlers = [file_handler, logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    
+    if _log_listener is not None:
+        _log_listener.stop()
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    _log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+    
+    # Application threads only put records on the queue
     logging.basicConfig(
         level=numeric_level,
-        format=log_format,
-        datefmt=date_format,
-        handlers=[
-            logging.FileHandler(log_file, encoding="utf-8"),
-            logging.StreamHandler()
-        ]
+        handlers=[_LogQueueHandler(log_queue)],
+        force=True
     )
 
 
+@atexit.register
+def stop_logging() -> None:
+    """Write queued log records and stop the logging thread."""
+    global _log_listener
+    listener, _log_listener = _log_listener, None
+    if listener is not None:
+        listener.stop()
+
+
+def _callback_key(name: str) -> str:
+    """Short stable key standing for a name in callback_data."""
+    return "#" + hashlib.sha1(name.encode("utf-8")).hexdigest()[:16]
+
+
+def make_callback_data(prefix: str, name: str) -> str:
+    """
+    Build callback_data of a button referring to a warehouse or job name.
+    
+    Names that would exceed Telegram's 64-byte limit (Cyrillic letters
+    take two bytes each) are replaced with a short key, which
+    resolve_callback_name() maps back.
+    
+    Args:
+        prefix: Callback prefix, e.g. "warehouse_" or "exportfmt_csv_"
+        name: Warehouse or job name
+        
+    Returns:
+        callback_data of at most MAX_CALLBACK_DATA_BYTES bytes
+    """
+    data = f"{prefix}{name}"
+    if len(data.encode("utf-8")) <= MAX_CALLBACK_DATA_BYTES:
+        return data
+    return f"{prefix}{_callback_key(name)}"
+
+
+def resolve_callback_name(value: str, names: Iterable[str]) -> str:
+    """
+    Get the name a callback_data value built by make_callback_data() refers to.
+    
+    Args:
+        value: callback_data without its prefix
+        names: Names the value may stand for (warehouses, running jobs)
+        
+    Returns:
+        Name, or empty string if a shortened value matches none of the names
+    """
+    names = list(names)
+    if not value.startswith("#") or value in names:
+        return value
+    return next((name for name in names if _callback_key(name) == value), "")
+
+
 def safe_get(dictionary: dict, *keys, default=None):
     """
     Safely get nested dictionary values.
@@ -57,6 +209,8 @@ def extract_offer_id_number(offer_id: str) -> Optional[int]:
     
     Removes 1-2 prefix symbols, then extracts first number (1-99).
     Numbers must be exactly 1-2 digits and not part of a larger number.
+    Rules are configurable via Config.OFFER_ID_* settings, results are
+    memoized by the default SortKeyEngine.
     
     Examples:
         "р20-п5-33" -> 20
@@ -73,38 +227,49 @@ def extract_offer_id_number(offer_id: str) -> Optional[int]:
     Returns:
         Extracted number (1-99) or None if not found/invalid
     """
-    if not offer_id or not isinstance(offer_id, str):
-        return None
-    
-    import re
-    
-    # Try removing 1 symbol prefix first
-    if len(offer_id) > 1:
-        without_prefix = offer_id[1:]
-        # Match 1-2 digits followed by non-digit or end of string
-        # This ensures we don't match "10" from "100"
-        match = re.search(r'^(\d{1,2})(?:\D|$)', without_prefix)
-        if match:
-            num = int(match.group(1))
-            if 1 <= num <= 99:
-                return num
-    
-    # Try removing 2 symbol prefix
-    if len(offer_id) > 2:
-        without_prefix = offer_id[2:]
-        # Match 1-2 digits followed by non-digit or end of string
-        match = re.search(r'^(\d{1,2})(?:\D|$)', without_prefix)
-        if match:
-            num = int(match.group(1))
-            if 1 <= num <= 99:
-                return num
-    
-    # If no prefix removal worked, try to find number at start
-    match = re.search(r'^(\d{1,2})(?:\D|$)', offer_id)
-    if match:
-        num = int(match.group(1))
-        if 1 <= num <= 99:
-            return num
-    
-    return None
+    return get_default_engine().number(offer_id)
+
+
+def aggregate_products(products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Merge identical product lines (same offer_id and SKU) across postings.
+    
+    Quantities are summed and posting numbers are collected. The order of
+    first occurrence is kept, so a sorted input stays sorted.
+    
+    Args:
+        products: List of parsed product dictionaries
+        
+    Returns:
+        List of merged product dictionaries with extra "posting_numbers" key,
+        "posting_number" holds the comma-separated posting numbers
+    """
+    grouped: Dict[tuple, Dict[str, Any]] = {}
+    for product in products:
+        key = (product.get("offer_id", ""), product.get("sku", ""))
+        group = grouped.get(key)
+        if group is None:
+            group = dict(product)
+            group["quantity"] = 0
+            group["posting_numbers"] = []
+            grouped[key] = group
+        group["quantity"] += int(product.get("quantity", 0) or 0)
+        posting_number = product.get("posting_number", "")
+        if posting_number:
+            group["posting_numbers"].append(posting_number)
+    
+    for group in grouped.values():
+        # Remove duplicates keeping order
+        group["posting_numbers"] = list(dict.fromkeys(group["posting_numbers"]))
+        group["posting_number"] = ", ".join(group["posting_numbers"])
+    
+    return list(grouped.values())
+
 
+def prepare_pick_list(products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Merge identical offer_id/SKU lines if aggregated pick list mode is on."""
+    if Config.PICK_LIST_MODE == "aggregated":
+        aggregated = aggregate_products(products)
+        logger.info(f"Aggregated {len(products)} product lines into {len(aggregated)}")
+        return aggregated
+    return products
@@ -0,0 +1,302 @@
+"""Durable SQLite job queue shared by the bot front-end and worker processes."""
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from .config import Config
+
+
+logger = logging.getLogger(__name__)
+
+# Job states; "queued" and "running" jobs are active
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class QueuedJob:
+    """Job row of the work queue."""
+    
+    def __init__(
+        self,
+        job_id: int,
+        kind: str,
+        chat_id: str,
+        name: str,
+        payload: Dict[str, Any],
+        attempts: int = 0
+    ):
+        """
+        Create job.
+        
+        Args:
+            job_id: Queue row id
+            kind: Job type ("warehouse" or "all_warehouses")
+            chat_id: Telegram chat ID the job belongs to
+            name: Warehouse (or aggregated run) name, deduplicates jobs per chat
+            payload: JSON-serializable job arguments
+            attempts: Number of times a worker has taken the job
+        """
+        self.job_id = job_id
+        self.kind = kind
+        self.chat_id = chat_id
+        self.name = name
+        self.payload = payload
+        self.attempts = attempts
+
+
+class WorkQueue:
+    """
+    Jobs table in the state database, safe for several processes.
+    
+    Every process opens its own connection; taking a job is a single
+    UPDATE, so two workers never get the same job.
+    """
+    
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        Open (and create if needed) the queue table.
+        
+        Args:
+            db_path: Path to SQLite file (defaults to Config.STATE_DB_PATH)
+        """
+        self.db_path = db_path or Config.STATE_DB_PATH
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS work_queue (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    chat_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    worker TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS work_queue_status ON work_queue (status, id)"
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS worker_metrics (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    worker TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    created_at TEXT NOT NULL
+                )
+                """
+            )
+    
+    @staticmethod
+    def _now() -> str:
+        """Current time as stored in the table."""
+        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    
+    def enqueue(self, kind: str, chat_id: str, name: str, payload: Dict[str, Any]) -> Optional[int]:
+        """
+        Add job unless the same chat already has an active job with that name.
+        
+        Args:
+            kind: Job type
+            chat_id: Telegram chat ID
+            name: Warehouse (or aggregated run) name
+            payload: JSON-serializable job arguments
+        
+        Returns:
+            Id of the new job or None if an active job already exists
+        """
+        now = self._now()
+        with self._lock, self._conn:
+            active = self._conn.execute(
+                "SELECT id FROM work_queue WHERE chat_id = ? AND name = ? AND status IN (?, ?)",
+                (str(chat_id), name, QUEUED, RUNNING)
+            ).fetchone()
+            if active:
+                return None
+            cursor = self._conn.execute(
+                "INSERT INTO work_queue (kind, chat_id, name, payload, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (kind, str(chat_id), name, json.dumps(payload, ensure_ascii=False), QUEUED, now, now)
+            )
+        return cursor.lastrowid
+    
+    def claim(self, worker: str) -> Optional[QueuedJob]:
+        """
+        Take the oldest queued job.
+        
+        Args:
+            worker: Name of the worker taking the job
+        
+        Returns:
+            Job or None if the queue is empty
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "UPDATE work_queue SET status = ?, worker = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE id = (SELECT id FROM work_queue WHERE status = ? ORDER BY id LIMIT 1) "
+                "RETURNING id, kind, chat_id, name, payload, attempts",
+                (RUNNING, worker, self._now(), QUEUED)
+            ).fetchone()
+        if row is None:
+            return None
+        return QueuedJob(row[0], row[1], row[2], row[3], json.loads(row[4]), row[5])
+    
+    def finish(self, job_id: int, error: str = "") -> None:
+        """
+        Mark job as done (or failed with an error message).
+        
+        Args:
+            job_id: Queue row id
+            error: Error message, empty if the job succeeded
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE work_queue SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (FAILED if error else DONE, error or None, self._now(), job_id)
+            )
+    
+    def release(self, job_id: int) -> None:
+        """
+        Put job interrupted by a worker shutdown back into the queue.
+        
+        Unlike requeue() after a crash, this does not count as an attempt.
+        
+        Args:
+            job_id: Queue row id
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE work_queue SET status = ?, worker = NULL, attempts = MAX(attempts - 1, 0), "
+                "updated_at = ? WHERE id = ? AND status = ?",
+                (QUEUED, self._now(), job_id, RUNNING)
+            )
+    
+    def requeue(self, worker: Optional[str] = None, max_attempts: Optional[int] = None) -> List[QueuedJob]:
+        """
+        Put running jobs of a dead worker back into the queue.
+        
+        Jobs taken max_attempts times already are failed instead, so a job
+        crashing every worker does not loop forever.
+        
+        Args:
+            worker: Worker name (None: jobs of all workers, e.g. after a restart)
+            max_attempts: Attempts limit (defaults to Config.WORKER_MAX_ATTEMPTS)
+        
+        Returns:
+            Jobs given up
+        """
+        max_attempts = Config.WORKER_MAX_ATTEMPTS if max_attempts is None else max_attempts
+        query = "SELECT id, kind, chat_id, name, payload, attempts FROM work_queue WHERE status = ?"
+        args: List[Any] = [RUNNING]
+        if worker is not None:
+            query += " AND worker = ?"
+            args.append(worker)
+        
+        now = self._now()
+        with self._lock, self._conn:
+            rows = self._conn.execute(query, args).fetchall()
+            given_up = [
+                QueuedJob(row[0], row[1], row[2], row[3], json.loads(row[4]), row[5])
+                for row in rows if row[5] >= max_attempts or self._is_cancelled(row[0])
+            ]
+            failed_ids = {job.job_id for job in given_up}
+            self._conn.executemany(
+                "UPDATE work_queue SET status = ?, worker = NULL, error = ?, updated_at = ? WHERE id = ?",
+                [
+                    (FAILED, "worker died", now, row[0]) if row[0] in failed_ids
+                    else (QUEUED, None, now, row[0])
+                    for row in rows
+                ]
+            )
+        if rows:
+            logger.warning(
+                f"Work queue: {len(rows) - len(given_up)} jobs of {worker or 'all workers'} "
+                f"requeued, {len(given_up)} failed"
+            )
+        return given_up
+    
+    def request_cancel(self, chat_id: str, name: str) -> bool:
+        """
+        Cancel active job of a chat: queued jobs are dropped, running ones flagged.
+        
+        Returns:
+            True if an active job was found
+        """
+        now = self._now()
+        with self._lock, self._conn:
+            dropped = self._conn.execute(
+                "UPDATE work_queue SET status = ?, error = 'cancelled', updated_at = ? "
+                "WHERE chat_id = ? AND name = ? AND status = ?",
+                (FAILED, now, str(chat_id), name, QUEUED)
+            ).rowcount
+            flagged = self._conn.execute(
+                "UPDATE work_queue SET cancel_requested = 1, updated_at = ? "
+                "WHERE chat_id = ? AND name = ? AND status = ?",
+                (now, str(chat_id), name, RUNNING)
+            ).rowcount
+        return bool(dropped or flagged)
+    
+    def _is_cancelled(self, job_id: int) -> bool:
+        """Check the cancel flag (caller holds the lock)."""
+        row = self._conn.execute(
+            "SELECT cancel_requested FROM work_queue WHERE id = ?", (job_id,)
+        ).fetchone()
+        return bool(row and row[0])
+    
+    def is_cancelled(self, job_id: int) -> bool:
+        """Check if cancellation of a running job was requested."""
+        with self._lock:
+            return self._is_cancelled(job_id)
+    
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per state."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM work_queue GROUP BY status"
+            ).fetchall()
+        return {status: count for status, count in rows}
+    
+    def publish_metrics(self, worker: str, deltas: Dict[str, Any]) -> None:
+        """
+        Hand metric changes of a worker to the front-end.
+        
+        Args:
+            worker: Worker name
+            deltas: Changes from REGISTRY.collect_delta()
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO worker_metrics (worker, data, created_at) VALUES (?, ?, ?)",
+                (worker, json.dumps(deltas), self._now())
+            )
+    
+    def collect_metrics(self) -> List[Dict[str, Any]]:
+        """
+        Take metric changes published by workers (oldest first).
+        
+        Returns:
+            Changes to pass to REGISTRY.apply_delta()
+        """
+        with self._lock, self._conn:
+            rows = self._conn.execute("SELECT id, data FROM worker_metrics ORDER BY id").fetchall()
+            if rows:
+                self._conn.execute("DELETE FROM worker_metrics WHERE id <= ?", (rows[-1][0],))
+        return [json.loads(data) for _, data in rows]
+    
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,208 @@
+"""Worker processes running warehouse jobs taken from the work queue."""
+import asyncio
+import logging
+import multiprocessing
+import signal
+from pathlib import Path
+from typing import Dict, List, Optional
+from telegram import Bot
+from .config import Config
+from .metrics import REGISTRY
+from .tracing import configure_tracing, shutdown_tracing
+from .utils import setup_logging
+from .work_queue import QueuedJob, WorkQueue
+
+
+logger = logging.getLogger(__name__)
+
+# Workers are started fresh instead of forked from the threaded bot process
+_mp = multiprocessing.get_context("spawn")
+
+# Seconds between hand-overs of worker metrics to the front-end
+METRICS_PUBLISH_INTERVAL = 5
+
+
+def worker_log_file(worker: str) -> str:
+    """Own log file per worker, rotating one file from several processes breaks."""
+    path = Path(Config.LOG_FILE)
+    return str(path.with_name(f"{path.stem}.{worker}{path.suffix}"))
+
+
+class WorkerPool:
+    """
+    Starts worker processes and replaces those that died.
+    
+    Used by the bot front-end; check() is called periodically and puts
+    jobs of dead workers back into the queue before starting a new worker.
+    """
+    
+    def __init__(self, work_queue: WorkQueue, processes: Optional[int] = None):
+        """
+        Initialize pool.
+        
+        Args:
+            work_queue: Queue of the front-end process
+            processes: Number of workers (defaults to Config.WORKER_PROCESSES)
+        """
+        self.work_queue = work_queue
+        self.size = max(1, processes or Config.WORKER_PROCESSES)
+        self.restarts = 0
+        self._processes: Dict[str, multiprocessing.process.BaseProcess] = {}
+    
+    def start(self) -> None:
+        """Requeue jobs left running by the previous run and start all workers."""
+        self.work_queue.requeue()
+        for index in range(1, self.size + 1):
+            self._spawn(f"worker-{index}")
+        logger.info(f"Started {self.size} worker processes")
+    
+    def _spawn(self, name: str) -> None:
+        """Start worker process."""
+        process = _mp.Process(target=worker_main, args=(name,), name=name, daemon=True)
+        process.start()
+        self._processes[name] = process
+    
+    def alive(self) -> int:
+        """Number of running workers."""
+        return sum(1 for process in self._processes.values() if process.is_alive())
+    
+    def check(self) -> List[QueuedJob]:
+        """
+        Replace dead workers (blocking).
+        
+        Returns:
+            Jobs given up because their workers kept dying
+        """
+        given_up: List[QueuedJob] = []
+        for name, process in list(self._processes.items()):
+            if process.is_alive():
+                continue
+            logger.error(f"Worker {name} (pid {process.pid}) died with exit code {process.exitcode}")
+            given_up.extend(self.work_queue.requeue(name))
+            self.restarts += 1
+            self._spawn(name)
+        return given_up
+    
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Stop workers: they finish the current job within timeout, then are killed.
+        
+        Args:
+            timeout: Seconds to wait (defaults to Config.WORKER_STOP_TIMEOUT)
+        """
+        timeout = Config.WORKER_STOP_TIMEOUT if timeout is None else timeout
+        processes, self._processes = list(self._processes.values()), {}
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"Worker {process.name} did not stop in {timeout}s, killing it")
+                process.kill()
+                process.join()
+
+
+def worker_main(name: str) -> None:
+    """Entry point of a worker process."""
+    # Ctrl+C reaches the whole process group, the front-end stops workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logging(Config.LOG_LEVEL, worker_log_file(name))
+    configure_tracing()
+    try:
+        asyncio.run(_serve(name))
+    except Exception as e:
+        # Exit code is seen by WorkerPool.check(), which starts a new worker
+        logger.critical(f"Worker {name} crashed: {e}", exc_info=True)
+        raise SystemExit(1)
+    finally:
+        shutdown_tracing()
+
+
+def _telegram_bot() -> Bot:
+    """Bot a worker sends messages with (updates are received by the front-end)."""
+    if Config.TELEGRAM_API_BASE_URL:
+        # Local Bot API stand-in instead of api.telegram.org
+        base_url = Config.TELEGRAM_API_BASE_URL.rstrip("/")
+        return Bot(Config.TELEGRAM_BOT_TOKEN, base_url=f"{base_url}/bot", base_file_url=f"{base_url}/file/bot")
+    return Bot(Config.TELEGRAM_BOT_TOKEN)
+
+
+async def _publish_metrics(name: str, work_queue: WorkQueue) -> None:
+    """Hand metric changes of this worker to the front-end (see Registry.collect_delta)."""
+    deltas = REGISTRY.collect_delta()
+    if deltas:
+        try:
+            await asyncio.to_thread(work_queue.publish_metrics, name, deltas)
+        except Exception as e:
+            logger.warning(f"Worker {name}: could not publish metrics: {e}")
+
+
+async def _publish_metrics_forever(name: str, work_queue: WorkQueue) -> None:
+    """Publish metrics every METRICS_PUBLISH_INTERVAL seconds, also during long jobs."""
+    while True:
+        await asyncio.sleep(METRICS_PUBLISH_INTERVAL)
+        await _publish_metrics(name, work_queue)
+
+
+async def _serve(name: str) -> None:
+    """
+    Take jobs from the queue until SIGTERM, one at a time.
+    
+    On SIGTERM the current job gets Config.SHUTDOWN_DRAIN_SECONDS to finish;
+    an interrupted job goes back to the queue.
+    """
+    # Imported here: the bot module imports this one for the pool
+    from .bot import WarehouseJobs
+    
+    stopping = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopping.set)
+    
+    # Only what the runs need: no Application, handlers, poller or pool
+    jobs = WarehouseJobs(_telegram_bot())
+    jobs.work_queue = WorkQueue()
+    try:
+        await asyncio.to_thread(jobs.sheets_manager.connect)
+    except Exception as e:
+        # The warm-start snapshot serves warehouse configs meanwhile
+        logger.error(f"Worker {name}: Sheets connection failed: {e}")
+    
+    logger.info(f"Worker {name} started")
+    publisher = asyncio.create_task(_publish_metrics_forever(name, jobs.work_queue))
+    async with jobs.bot:
+        while not stopping.is_set():
+            queued = await asyncio.to_thread(jobs.work_queue.claim, name)
+            if queued is None:
+                try:
+                    await asyncio.wait_for(stopping.wait(), Config.WORKER_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            logger.info(f"Worker {name} took job {queued.job_id}: {queued.kind} {queued.name}")
+            task = asyncio.create_task(jobs.run_queued_job(queued))
+            stop = asyncio.create_task(stopping.wait())
+            await asyncio.wait({task, stop}, return_when=asyncio.FIRST_COMPLETED)
+            stop.cancel()
+            if not task.done():
+                # Let the job finish, interrupt it after the drain timeout
+                await jobs.job_manager.shutdown(Config.SHUTDOWN_DRAIN_SECONDS)
+            
+            error = ""
+            try:
+                job = await task
+            except Exception as e:
+                job = None
+                error = str(e) or type(e).__name__
+                logger.error(f"Worker {name}: job {queued.job_id} failed: {e}", exc_info=True)
+            if job is not None and job.interrupted:
+                # Continued from its checkpoint by the next worker
+                await asyncio.to_thread(jobs.work_queue.release, queued.job_id)
+            else:
+                await asyncio.to_thread(jobs.work_queue.finish, queued.job_id, error)
+            await asyncio.to_thread(jobs.catalog.flush)
+            await _publish_metrics(name, jobs.work_queue)
+    
+    publisher.cancel()
+    await _publish_metrics(name, jobs.work_queue)
+    await asyncio.to_thread(jobs.catalog.close)
+    logger.info(f"Worker {name} stopped")
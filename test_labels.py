@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Test script for package label download against a local Ozon stand-in."""
+import io
+import json
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pypdf import PdfReader, PdfWriter
+from src.config import Config
+from src.labels import LabelStore
+from src.ozon_client import OzonClient, PACKAGE_LABEL_BATCH_SIZE
+
+
+requests_seen = []
+# Postings whose label has two pages (several boxes)
+MULTI_BOX = {"posting-7"}
+
+
+class LabelStandIn(BaseHTTPRequestHandler):
+    """Serves /v2/posting/fbs/package-label with blank pages per posting."""
+    
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        numbers = body["posting_number"]
+        requests_seen.append(numbers)
+        writer = PdfWriter()
+        for number in numbers:
+            # Page width encodes the posting index so pages can be matched
+            width = 100 + int(number.split("-")[1])
+            for _ in range(2 if number in MULTI_BOX else 1):
+                writer.add_blank_page(width=width, height=100)
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        content = buffer.getvalue()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+    
+    def log_message(self, *args):
+        pass
+
+
+all_passed = True
+
+
+def check(description, result, expected):
+    global all_passed
+    status = "✅" if result == expected else "❌"
+    if result != expected:
+        all_passed = False
+    print(f"{status} {description} -> {result} (expected {expected})")
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), LabelStandIn)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+Config.OZON_API_BASE_URL = f"http://127.0.0.1:{server.server_port}"
+
+print("Testing package labels:")
+print("=" * 60)
+with tempfile.TemporaryDirectory() as cache_dir:
+    client = OzonClient("test-client", "test-key")
+    store = LabelStore(cache_dir=cache_dir, concurrency=3)
+    numbers = [f"posting-{index}" for index in range(45)]
+    
+    labels = store.get_labels(client, numbers[:5] + numbers[10:])
+    check("labels downloaded", len(labels), 40)
+    check("max batch size", max(len(batch) for batch in requests_seen), PACKAGE_LABEL_BATCH_SIZE)
+    check(
+        "cached page belongs to its posting",
+        float(PdfReader(str(labels["posting-33"])).pages[0].mediabox.width),
+        133.0
+    )
+    
+    requests_seen.clear()
+    labels = store.get_labels(client, numbers)
+    check(
+        "only missing labels requested, multi-box batch refetched one by one",
+        requests_seen,
+        [numbers[5:10]] + [[number] for number in numbers[5:10]]
+    )
+    check("multi-box label kept whole", len(PdfReader(str(labels["posting-7"])).pages), 2)
+    
+    merged = store.merge(list(labels.values()), "labels test")
+    check("merged pages", len(PdfReader(str(merged)).pages), 46)
+    merged.unlink()
+
+server.shutdown()
+
+print("=" * 60)
+if all_passed:
+    print("✅ All tests passed!")
+else:
+    print("❌ Some tests failed!")
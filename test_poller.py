@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""Offline test of the background poller against the API stand-ins."""
+import asyncio
+import os
+import sqlite3
+import tempfile
+from src.bot import OzonBot
+from src.config import Config
+from src.poller import PostingPoller
+from src.sheets_manager import SheetsManager
+from src.standins import FIXTURE_SHEETS_ID, generate_fixture, start_standins
+from src.state_store import StateStore
+
+
+all_passed = True
+
+
+def check(description, result, expected):
+    global all_passed
+    status = "✅" if result == expected else "❌"
+    if result != expected:
+        all_passed = False
+    print(f"{status} {description} -> {result} (expected {expected})")
+
+
+workdir = tempfile.mkdtemp()
+Config.STATE_DB_PATH = os.path.join(workdir, "state.db")
+Config.CATALOG_DB_PATH = os.path.join(workdir, "catalog.db")
+Config.GOOGLE_SHEETS_ID = FIXTURE_SHEETS_ID
+Config.TELEGRAM_BOT_TOKEN = "1:offline"
+Config.POLL_INTERVAL_SECONDS = 0
+Config.CONFIG_WATCH_INTERVAL = 0
+Config.OZON_RATE_LIMIT_RPS = 0
+
+print("Testing background poller:")
+print("=" * 60)
+
+fixture = generate_fixture(warehouses=2, postings=5, chat_id="1001", seed=2)
+ozon, sheets, telegram = start_standins(fixture, page_size=10)
+
+state_store = StateStore()
+sheets_manager = SheetsManager(state_store, connect=True)
+warehouse, other_warehouse = sheets_manager.get_warehouses()
+pushed = []
+
+
+async def deliver(warehouse_name, chat_ids, products, posting_numbers):
+    pushed.append((warehouse_name, sorted(posting_numbers)))
+    state_store.mark_delivered(warehouse_name, posting_numbers)
+
+
+poller = PostingPoller(sheets_manager, state_store, deliver, interval=0)
+
+
+def poll(warehouse):
+    asyncio.run(poller._poll_warehouse(warehouse, ["1001"]))
+
+
+# Empty first poll, then a new posting is pushed
+backlog = list(ozon.postings["client-1"])
+ozon.postings["client-1"].clear()
+poll(warehouse)
+check("empty first poll takes the baseline", state_store.has_baseline("Склад 1"), True)
+check("empty first poll pushes nothing", pushed, [])
+ozon.postings["client-1"].append(backlog[0])
+poll(warehouse)
+check("new posting after empty first poll pushed", pushed, [("Склад 1", [backlog[0]["posting_number"]])])
+check("pushed posting marked delivered", state_store.get_delivered("Склад 1"), {backlog[0]["posting_number"]})
+poll(warehouse)
+check("pushed posting not pushed again", len(pushed), 1)
+
+# First poll with a backlog only remembers it
+pushed.clear()
+poll(other_warehouse)
+check("backlog not pushed", pushed, [])
+check("backlog marked delivered", len(state_store.get_delivered("Склад 2")), 5)
+ozon.postings["client-2"].append(dict(backlog[1], posting_number="99999999-0001-1"))
+poll(other_warehouse)
+check("posting after backlog pushed", pushed, [("Склад 2", ["99999999-0001-1"])])
+
+# Pruning delivered postings keeps the baseline
+with state_store._conn:
+    state_store._conn.execute("UPDATE delivered_postings SET delivered_at = '2000-01-01 00:00:00'")
+check("old delivered postings pruned", state_store.prune_delivered(45), 7)
+check("baseline kept after pruning", state_store.has_baseline("Склад 1"), True)
+
+# Databases from before the baseline table: polled warehouses keep their baseline
+old_path = os.path.join(workdir, "old_state.db")
+with sqlite3.connect(old_path) as conn:
+    conn.execute(
+        "CREATE TABLE delivered_postings (warehouse_name TEXT NOT NULL, posting_number TEXT NOT NULL, "
+        "delivered_at TEXT NOT NULL, PRIMARY KEY (warehouse_name, posting_number))"
+    )
+    conn.execute("INSERT INTO delivered_postings VALUES ('Склад 1', '1', '2026-01-01 00:00:00')")
+conn.close()
+old_store = StateStore(old_path)
+check("baseline of polled warehouse migrated", old_store.has_baseline("Склад 1"), True)
+check("unpolled warehouse has no baseline", old_store.has_baseline("Склад 2"), False)
+old_store.close()
+state_store.close()
+
+
+# Pushes through the bot are checkpointed per chat
+def new_postings(prefix, count):
+    return [dict(posting, posting_number=f"{prefix}{index}-0001-1") for index, posting in enumerate(backlog[:count])]
+
+
+def product_messages():
+    return sum("Номер отправления" in str(call.get("text", "")) for call in telegram.calls("sendMessage"))
+
+
+async def wait_for(condition):
+    for _ in range(200):
+        if condition():
+            return True
+        await asyncio.sleep(0.05)
+    return False
+
+
+async def run_pushes():
+    Config.STATE_DB_PATH = os.path.join(workdir, "bot_state.db")
+    Config.CATALOG_DB_PATH = os.path.join(workdir, "bot_catalog.db")
+    bot = OzonBot()
+    await asyncio.to_thread(bot.sheets_manager.connect)
+    warehouse = bot.sheets_manager.get_warehouses()[0]
+    ozon.postings["client-1"][:] = []
+    async with bot.bot:
+        await bot.poller._poll_warehouse(warehouse, ["1001"])
+        
+        # Postings are marked delivered only after the last item
+        telegram.latency = 0.1
+        sent = product_messages()
+        ozon.postings["client-1"].extend(new_postings("7100000", 3))
+        await bot.poller._poll_warehouse(warehouse, ["1001"])
+        job = bot.job_manager.active_jobs()[0]
+        runs = bot.state_store.load_runs(24, "1001")
+        check("push checkpointed", [run["kind"] for run in runs], ["poller"])
+        check("not delivered before it is sent", bot.state_store.get_delivered("Склад 1"), set())
+        await bot.poller._poll_warehouse(warehouse, ["1001"])
+        check("pending push not pushed again", len(bot.job_manager.active_jobs()), 1)
+        await job.task
+        check("every product sent", product_messages() - sent, len(runs[0]["items"]) - 1)
+        check("delivered after the last item", len(bot.state_store.get_delivered("Склад 1")), 3)
+        check("checkpoint dropped when sent", bot.state_store.load_runs(24, "1001"), [])
+        
+        # An interrupted push keeps its checkpoint
+        ozon.postings["client-1"].extend(new_postings("7200000", 3))
+        await bot.poller._poll_warehouse(warehouse, ["1001"])
+        job = bot.job_manager.active_jobs()[0]
+        sent = product_messages()
+        await wait_for(lambda: product_messages() >= sent + 2)
+        await bot.job_manager.shutdown(0)
+        # A send cancelled in flight still reaches the stand-in after its latency
+        await asyncio.sleep(0.3)
+        check("interrupted push stopped", job.interrupted, True)
+        runs = bot.state_store.load_runs(24, "1001")
+        check("interrupted push keeps its checkpoint", [run["name"] for run in runs], [job.warehouse_name])
+        cursor, items = runs[0]["cursor"], len(runs[0]["items"])
+        check("cursor after the sent items", 0 < cursor < items, True)
+        check("interrupted push not delivered", len(bot.state_store.get_delivered("Склад 1")), 3)
+    await asyncio.to_thread(bot.catalog.close)
+    
+    # After a restart it continues at the cursor
+    telegram.latency = 0
+    bot = OzonBot()
+    await asyncio.to_thread(bot.sheets_manager.connect)
+    async with bot.bot:
+        sent = product_messages()
+        await bot._resume_runs()
+        job = bot.job_manager.active_jobs()[0]
+        await job.task
+        check("resumed push sends the rest", product_messages() - sent, items - cursor)
+        check("resumed push delivered", len(bot.state_store.get_delivered("Склад 1")), 6)
+        check("resumed checkpoint dropped", bot.state_store.load_runs(24, "1001"), [])
+        
+        # A push cancelled by the user drops its checkpoint and is not pushed again
+        telegram.latency = 0.1
+        ozon.postings["client-1"].extend(new_postings("7300000", 3))
+        await bot.poller._poll_warehouse(warehouse, ["1001"])
+        job = bot.job_manager.active_jobs()[0]
+        sent = product_messages()
+        await wait_for(lambda: product_messages() > sent)
+        bot.job_manager.cancel("1001", job.warehouse_name)
+        await asyncio.wait({job.task})
+        check("cancelled push checkpoint dropped", bot.state_store.load_runs(24, "1001"), [])
+        await bot.poller._poll_warehouse(warehouse, ["1001"])
+        check("cancelled push not pushed again", bot.job_manager.active_jobs(), [])
+        telegram.latency = 0
+    await asyncio.to_thread(bot.catalog.close)
+
+
+asyncio.run(run_pushes())
+for server in (ozon, sheets, telegram):
+    server.stop()
+
+print("=" * 60)
+if all_passed:
+    print("✅ All tests passed!")
+else:
+    print("❌ Some tests failed!")
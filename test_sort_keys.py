@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Test script for the offer_id sort-key engine."""
+import random
+import re
+from src.sort_keys import SortKeyEngine, ShelfBuckets
+
+
+def legacy_extract_offer_id_number(offer_id):
+    """Original three-step implementation used as reference."""
+    if not offer_id or not isinstance(offer_id, str):
+        return None
+    for without_prefix in (offer_id[1:] if len(offer_id) > 1 else None,
+                           offer_id[2:] if len(offer_id) > 2 else None,
+                           offer_id):
+        if without_prefix is None:
+            continue
+        match = re.search(r'^(\d{1,2})(?:\D|$)', without_prefix)
+        if match and 1 <= int(match.group(1)) <= 99:
+            return int(match.group(1))
+    return None
+
+
+all_passed = True
+
+
+def check(description, result, expected):
+    global all_passed
+    status = "✅" if result == expected else "❌"
+    if result != expected:
+        all_passed = False
+    print(f"{status} {description} -> {result} (expected {expected})")
+
+
+print("Testing multi-part sort keys:")
+print("=" * 60)
+engine = SortKeyEngine(key_parts=3)
+check("'р20-п5-33'", engine.key("р20-п5-33"), (20, 5, 33))
+check("'мд33-п2-30'", engine.key("мд33-п2-30"), (33, 2, 30))
+check("'р5'", engine.key("р5"), (5, 0, 0))
+check("'р100-п5-33'", engine.key("р100-п5-33"), None)
+check("batch keys", engine.keys(["р1-п2-3", "x", ""]), [(1, 2, 3), None, None])
+
+products = [
+    {"offer_id": "р20-п5-33"},
+    {"offer_id": "р20-п1-40"},
+    {"offer_id": "invalid"},
+    {"offer_id": "р3-п9-1"},
+]
+check(
+    "sort_products",
+    [p["offer_id"] for p in engine.sort_products(products)],
+    ["р3-п9-1", "р20-п1-40", "р20-п5-33"]
+)
+
+print("\nTesting custom rules:")
+print("=" * 60)
+wide = SortKeyEngine(prefix_max_len=3, number_min=1, number_max=999)
+check("'абв120-1' (3 symbol prefix, max 999)", wide.number("абв120-1"), 120)
+check("'р1000' (over 999)", wide.number("р1000"), None)
+
+print("\nTesting shelf buckets:")
+print("=" * 60)
+buckets = ShelfBuckets(SortKeyEngine(key_parts=1))
+page_1 = [{"offer_id": "р30-а"}, {"offer_id": "р5-а"}, {"offer_id": "bad"}, {"offer_id": "р5-б"}]
+check("accepted from page 1", buckets.extend(page_1), 3)
+buckets.extend([{"offer_id": "р2-в"}, {"offer_id": "р12-г"}])
+check(
+    "all shelves in order",
+    [p["offer_id"] for p in buckets.pop_all()],
+    ["р2-в", "р5-а", "р5-б", "р12-г", "р30-а"]
+)
+check("buckets empty", len(buckets), 0)
+check("input not modified", page_1[0], {"offer_id": "р30-а"})
+
+print("\nComparing default engine with the legacy implementation:")
+print("=" * 60)
+default = SortKeyEngine(prefix_max_len=2, number_min=1, number_max=99, key_parts=1)
+alphabet = "рмдп0123456789-_ а٣"
+random.seed(42)
+mismatches = 0
+for _ in range(20000):
+    offer_id = "".join(random.choice(alphabet) for _ in range(random.randint(0, 8)))
+    if default.number(offer_id) != legacy_extract_offer_id_number(offer_id):
+        mismatches += 1
+        if mismatches <= 5:
+            print(f"❌ '{offer_id}': {default.number(offer_id)} != "
+                  f"{legacy_extract_offer_id_number(offer_id)}")
+check("random offer_ids mismatches", mismatches, 0)
+print(f"   cache: {default.cache_info()}")
+
+print("=" * 60)
+if all_passed:
+    print("✅ All tests passed!")
+else:
+    print("❌ Some tests failed!")
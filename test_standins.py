@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""Offline test of OzonClient, SheetsManager and OzonBot against the API stand-ins."""
+import asyncio
+import json
+import os
+import tempfile
+from src.bot import OzonBot
+from src.config import Config
+from src.ozon_client import OzonClient, get_client, invalidate_clients
+from src.sheets_manager import SheetsManager
+from src.standins import (
+    FIXTURE_SHEETS_ID, OzonStandIn, generate_fixture, load_fixture, record_fixture, start_standins
+)
+from src.state_store import StateStore
+from src.sync import BatchSync
+from src.utils import make_callback_data, resolve_callback_name
+
+
+all_passed = True
+
+
+def check(description, result, expected):
+    global all_passed
+    status = "✅" if result == expected else "❌"
+    if result != expected:
+        all_passed = False
+    print(f"{status} {description} -> {result} (expected {expected})")
+
+
+workdir = tempfile.mkdtemp()
+Config.STATE_DB_PATH = os.path.join(workdir, "state.db")
+Config.CATALOG_DB_PATH = os.path.join(workdir, "catalog.db")
+Config.GOOGLE_SHEETS_ID = FIXTURE_SHEETS_ID
+Config.TELEGRAM_BOT_TOKEN = "1:offline"
+Config.POLL_INTERVAL_SECONDS = 0
+Config.CONFIG_WATCH_INTERVAL = 0
+Config.OZON_RATE_LIMIT_RPS = 0
+
+print("Testing API stand-ins:")
+print("=" * 60)
+
+fixture = generate_fixture(warehouses=2, postings=30, chat_id="1001", seed=1)
+ozon, sheets, telegram = start_standins(fixture, page_size=10)
+
+# Ozon: cursor pagination and package labels
+warehouse_client = get_client("client-1", "key-1")
+postings = warehouse_client.get_all_postings()
+check("all postings over pages", len(postings), 30)
+check("no duplicates", len({posting["posting_number"] for posting in postings}), 30)
+check("one request per page", ozon.statuses, {"200": 3})
+labels = warehouse_client.get_package_labels([posting["posting_number"] for posting in postings[:2]])
+check("labels are a PDF", labels[:5], b"%PDF-")
+
+flaky = OzonStandIn(fixture["ozon"], page_size=10, error_rate=0.2, throttle_rate=0.1, seed=1).start()
+postings = OzonClient("client-2", "key-2", base_url=flaky.url).get_all_postings()
+check("injected 429/5xx are retried", len(postings), 30)
+check("errors were injected", flaky.statuses, {"503": 2, "200": 3})
+flaky.stop()
+
+# Sheets: warehouse configs and Tasks writes through gspread
+sheets_manager = SheetsManager(StateStore(), connect=True)
+warehouses = sheets_manager.get_warehouses()
+check("warehouses", [warehouse["warehouse_name"] for warehouse in warehouses], ["Склад 1", "Склад 2"])
+check("access", sheets_manager.get_warehouse_chat_ids()["Склад 2"], ["1001"])
+results = BatchSync(sheets_manager).run(warehouses)
+check("sync errors", [result.error for result in results], ["", ""])
+tasks = sheets.values(FIXTURE_SHEETS_ID, "Tasks")
+check("Tasks rows", len(tasks) - 1, sum(len(result.products) for result in results))
+BatchSync(sheets_manager).run(warehouses[:1])
+check("repeated sync updates rows in place", len(sheets.values(FIXTURE_SHEETS_ID, "Tasks")), len(tasks))
+check(
+    "processed orders logged",
+    len(sheets.values(FIXTURE_SHEETS_ID, "ProcessedOrders")) - 1,
+    sum(result.postings for result in results) + results[0].postings
+)
+
+# A posting packed meanwhile keeps its rows, marked in column H
+packed_number = results[0].products[0]["posting_number"]
+packed = next(posting for posting in ozon.postings["client-1"] if posting["posting_number"] == packed_number)
+ozon.postings["client-1"].remove(packed)
+BatchSync(sheets_manager).run(warehouses[:1])
+tasks = sheets.values(FIXTURE_SHEETS_ID, "Tasks")
+check("packed posting rows marked", {row[7] for row in tasks[1:] if row[0] == packed_number}, {"Неактуально"})
+check("other rows not marked", sum(len(row) > 7 and row[7] != "" for row in tasks[1:] if row[0] != packed_number), 0)
+check("status header", tasks[0][7], "Статус")
+ozon.postings["client-1"].append(packed)
+
+# Recorder: secrets are replaced consistently, personal data dropped
+fixture["ozon"]["client-1"][0]["customer"] = {"name": "Покупатель", "phone": "+70000000000"}
+with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+    fixture_path = f.name
+counts = record_fixture(sheets_manager, fixture_path)
+with open(fixture_path, encoding="utf-8") as f:
+    recorded_text = f.read()
+recorded = load_fixture(fixture_path)
+check("recorded warehouses and postings", (counts["warehouses"], counts["postings"]), (2, 60))
+check("personal data dropped", "Покупатель" in recorded_text or "customer" in recorded_text, False)
+check("API keys replaced", json.dumps(recorded["sheets"][FIXTURE_SHEETS_ID]["sheets"]["Ozon"]).count("key-"), 2)
+check("postings keyed by replaced client id", sorted(recorded["ozon"]), ["client-1", "client-2"])
+os.unlink(fixture_path)
+
+
+# Telegram: a warehouse tap runs the whole delivery offline
+async def run_bot():
+    invalidate_clients(set())
+    bot = OzonBot()
+    application = bot.application
+    async with application:
+        await application.start()
+        await application.updater.start_polling(poll_interval=0, timeout=1)
+        telegram.message_update(1001, "/start")
+        telegram.callback_update(1001, "warehouse_Склад 2")
+        for _ in range(100):
+            await asyncio.sleep(0.1)
+            texts = [str(call.get("text")) for call in telegram.calls("sendMessage")]
+            if any("Обработка завершена" in text for text in texts):
+                break
+        await application.updater.stop()
+        await application.stop()
+        await bot._post_stop(application)
+    return bot
+
+
+bot = asyncio.run(run_bot())
+texts = [str(call.get("text", "")) for call in telegram.calls("sendMessage")]
+check("menu sent", "Выберите склад" in texts[0], True)
+check("summary sent", any("Обработка завершена для склада: Склад 2" in text for text in texts), True)
+check(
+    "one message per product",
+    sum("Номер отправления" in text for text in texts),
+    len(results[1].products)
+)
+check("postings marked delivered", len(bot.state_store.get_delivered("Склад 2")), results[1].postings)
+
+# Buttons of long Cyrillic warehouse names stay within Telegram's 64 bytes
+long_name = "Распределительный центр Подольск (крупногабарит)"
+long_data = make_callback_data("exportfmt_xlsx_", long_name)
+check("long name shortened", len(long_data.encode("utf-8")) <= 64, True)
+check(
+    "shortened name resolved",
+    resolve_callback_name(long_data.replace("exportfmt_xlsx_", "", 1), ["Склад 1", long_name]),
+    long_name
+)
+check("short name kept", make_callback_data("warehouse_", "Склад 2"), "warehouse_Склад 2")
+buttons = [
+    button.get("callback_data", "")
+    for call in telegram.calls("sendMessage") + telegram.calls("editMessageText")
+    for row in (call.get("reply_markup") or {}).get("inline_keyboard", [])
+    for button in row
+]
+check("buttons sent", len(buttons) > 0, True)
+check("callback_data within 64 bytes", max(len(data.encode("utf-8")) for data in buttons) <= 64, True)
+
+for server in (ozon, sheets, telegram):
+    server.stop()
+
+print("=" * 60)
+if all_passed:
+    print("✅ All tests passed!")
+else:
+    print("❌ Some tests failed!")
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Test script for tracing spans with Ozon and OTLP collector stand-ins."""
+import json
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.config import Config
+from src.ozon_client import OzonClient
+from src.tracing import bind, configure_tracing, shutdown_tracing, span, start_trace
+
+
+collected = []
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """Serves two posting list pages and collects OTLP/HTTP traces."""
+    
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path == "/v1/traces":
+            for resource_spans in body["resourceSpans"]:
+                for scope_spans in resource_spans["scopeSpans"]:
+                    collected.extend(scope_spans["spans"])
+            response = {}
+        else:
+            page = 2 if body.get("cursor") else 1
+            response = {
+                "postings": [{"posting_number": f"{page}-{i}", "products": []} for i in range(3)],
+                "cursor": "next" if page == 1 else "",
+            }
+        content = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+    
+    def log_message(self, *args):
+        pass
+
+
+all_passed = True
+
+
+def check(description, result, expected):
+    global all_passed
+    status = "✅" if result == expected else "❌"
+    if result != expected:
+        all_passed = False
+    print(f"{status} {description} -> {result} (expected {expected})")
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+base_url = f"http://127.0.0.1:{server.server_port}"
+Config.OZON_API_BASE_URL = base_url
+
+print("Testing tracing:")
+print("=" * 60)
+
+with tempfile.TemporaryDirectory() as tmp:
+    trace_file = os.path.join(tmp, "traces.jsonl")
+    check("tracing enabled", configure_tracing(trace_file, f"{base_url}/v1/traces"), True)
+    
+    client = OzonClient("trace-client", "key")
+    with start_trace("test", warehouse="Склад 1") as root:
+        pages = list(client.iter_pages(filter_dict={"cutoff_from": "x", "cutoff_to": "y"}))
+        
+        def in_thread():
+            with span("worker", rows=5):
+                pass
+        
+        thread = threading.Thread(target=bind(in_thread))
+        thread.start()
+        thread.join()
+    
+    shutdown_tracing()
+    
+    with open(trace_file, encoding="utf-8") as f:
+        spans = [json.loads(line) for line in f]
+    by_name = {}
+    for item in spans:
+        by_name.setdefault(item["name"], []).append(item)
+    
+    check("pages fetched", len(pages), 2)
+    check(
+        "span names",
+        sorted(by_name),
+        ["ozon.page", "ozon.request", "test", "worker"]
+    )
+    check("one trace", {item["trace_id"] for item in spans}, {root.trace_id})
+    check("page attributes", [item["attributes"]["page"] for item in by_name["ozon.page"]], [1, 2])
+    check(
+        "request spans are children of page spans",
+        [item["parent_id"] for item in by_name["ozon.request"]],
+        [item["span_id"] for item in by_name["ozon.page"]]
+    )
+    check("request status", {item["attributes"]["status"] for item in by_name["ozon.request"]}, {"200"})
+    check("thread span bound to trace", by_name["worker"][0]["parent_id"], root.span_id)
+    check("root attributes", by_name["test"][0]["attributes"], {"warehouse": "Склад 1"})
+    check("OTLP collector received spans", len(collected), len(spans))
+    check("OTLP root has no parent", sum("parentSpanId" not in item for item in collected), 1)
+    
+    with start_trace("disabled") as disabled:
+        pass
+    check("disabled tracing is a no-op", disabled.trace_id, "")
+
+server.shutdown()
+
+print("=" * 60)
+if all_passed:
+    print("✅ All tests passed!")
+else:
+    print("❌ Some tests failed!")
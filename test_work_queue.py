@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Test of the work queue, the worker metrics hand-off and queued runs against the API stand-ins."""
+import asyncio
+import os
+import tempfile
+from src.bot import WarehouseJobs
+from src.config import Config
+from src.metrics import Counter, Histogram, Registry
+from src.standins import FIXTURE_SHEETS_ID, generate_fixture, start_standins
+from src.work_queue import DONE, FAILED, QUEUED, RUNNING, WorkQueue
+from src.workers import _telegram_bot
+
+
+all_passed = True
+
+
+def check(description, result, expected):
+    global all_passed
+    status = "✅" if result == expected else "❌"
+    if result != expected:
+        all_passed = False
+    print(f"{status} {description} -> {result} (expected {expected})")
+
+
+workdir = tempfile.mkdtemp()
+Config.STATE_DB_PATH = os.path.join(workdir, "state.db")
+Config.CATALOG_DB_PATH = os.path.join(workdir, "catalog.db")
+Config.GOOGLE_SHEETS_ID = FIXTURE_SHEETS_ID
+Config.TELEGRAM_BOT_TOKEN = "1:offline"
+Config.OZON_RATE_LIMIT_RPS = 0
+
+print("Testing work queue:")
+print("=" * 60)
+
+queue = WorkQueue(os.path.join(workdir, "queue.db"))
+
+# Claim: oldest job first, one worker per job
+first = queue.enqueue("warehouse", "1001", "Склад 1", {})
+check("duplicate active job not queued", queue.enqueue("warehouse", "1001", "Склад 1", {}), None)
+second = queue.enqueue("warehouse", "1001", "Склад 2", {})
+job = queue.claim("w1")
+check("oldest job claimed", (job.job_id, job.name, job.attempts), (first, "Склад 1", 1))
+check("next claim gets the next job", queue.claim("w2").job_id, second)
+check("empty queue", queue.claim("w3"), None)
+check("both running", queue.counts(), {RUNNING: 2})
+
+# Release after a worker shutdown does not count as an attempt
+queue.release(first)
+check("released job queued", queue.counts(), {QUEUED: 1, RUNNING: 1})
+job = queue.claim("w1")
+check("released job claimed again, attempts not counted", (job.job_id, job.attempts), (first, 1))
+
+# Requeue after a crash counts attempts and gives up at max_attempts
+check("crashed job requeued", queue.requeue("w1", max_attempts=2), [])
+job = queue.claim("w1")
+check("second attempt", (job.job_id, job.attempts), (first, 2))
+given_up = queue.requeue("w1", max_attempts=2)
+check("job given up after max attempts", [job.job_id for job in given_up], [first])
+check("given up job failed, other worker's job untouched", queue.counts(), {FAILED: 1, RUNNING: 1})
+
+# Cancel: queued jobs are dropped, running ones flagged
+third = queue.enqueue("warehouse", "1002", "Склад 1", {})
+check("cancel of queued job", queue.request_cancel("1002", "Склад 1"), True)
+check("cancelled queued job dropped", (queue.claim("w1"), queue.counts()[FAILED]), (None, 2))
+check("cancel of running job", queue.request_cancel("1001", "Склад 2"), True)
+check("running job flagged", (queue.is_cancelled(second), queue.is_cancelled(third)), (True, False))
+check("cancelled running job of a dead worker given up", len(queue.requeue("w2", max_attempts=5)), 1)
+check("cancel without active job", queue.request_cancel("1001", "Склад 3"), False)
+
+# Metrics hand-off: workers publish changes, the front-end adds them
+worker_registry, front_registry = Registry(), Registry()
+for registry in (worker_registry, front_registry):
+    registry.register(Counter("test_sends_total", "Sends", ["kind"]))
+    registry.register(Histogram("test_send_seconds", "Send time", ["kind"], window=100))
+worker_sends, worker_seconds = worker_registry._metrics
+front_sends, front_seconds = front_registry._metrics
+worker_sends.inc(3, kind="photo")
+worker_seconds.observe(0.2, kind="photo")
+worker_seconds.observe(0.4, kind="photo")
+queue.publish_metrics("w1", worker_registry.collect_delta())
+check("nothing new to publish", worker_registry.collect_delta(), {})
+for deltas in queue.collect_metrics():
+    front_registry.apply_delta(deltas)
+check("counter handed over", front_sends.get(kind="photo"), 3)
+check("histogram handed over", front_seconds.count(kind="photo"), 2)
+check("percentiles include worker observations", front_seconds.percentiles(60)[0], 2)
+check("published changes taken once", queue.collect_metrics(), [])
+worker_sends.inc(2, kind="photo")
+queue.publish_metrics("w1", worker_registry.collect_delta())
+for deltas in queue.collect_metrics():
+    front_registry.apply_delta(deltas)
+check("only changes are added", front_sends.get(kind="photo"), 5)
+queue.close()
+
+# Queued runs in a worker context: a plain Bot, no Application or poller
+fixture = generate_fixture(warehouses=1, postings=8, chat_id="1001", seed=3)
+ozon, sheets, telegram = start_standins(fixture, page_size=10)
+
+
+def product_messages():
+    return sum("Номер отправления" in str(call.get("text", "")) for call in telegram.calls("sendMessage"))
+
+
+async def run_jobs():
+    jobs = WarehouseJobs(_telegram_bot())
+    jobs.work_queue = WorkQueue()
+    await asyncio.to_thread(jobs.sheets_manager.connect)
+    async with jobs.bot:
+        jobs.work_queue.enqueue("warehouse", "1001", "Склад 1", {"message": None})
+        queued = jobs.work_queue.claim("w1")
+        job = await jobs.run_queued_job(queued)
+        jobs.work_queue.finish(queued.job_id)
+        sent = product_messages()
+        check("queued run finished", job.is_running() or job.cancel_requested, False)
+        check("queued run sent products", sent > 0, True)
+        check("queued run delivered postings", len(jobs.state_store.get_delivered("Склад 1")), 8)
+        
+        # A cancel tap in the front-end stops the job in the worker
+        telegram.latency = 0.3
+        jobs.work_queue.enqueue("warehouse", "1001", "Склад 1", {"message": None})
+        task = asyncio.create_task(jobs.run_queued_job(jobs.work_queue.claim("w1")))
+        for _ in range(200):
+            await asyncio.sleep(0.05)
+            if product_messages() > sent:
+                break
+        jobs.work_queue.request_cancel("1001", "Склад 1")
+        job = await task
+        telegram.latency = 0
+        check("job left for the worker to finish", jobs.work_queue.counts(), {DONE: 1, RUNNING: 1})
+        check("cancelled queued run stopped", job.cancel_requested and product_messages() < 2 * sent, True)
+        check("cancelled run checkpoint dropped", jobs.state_store.load_runs(24, "1001", "Склад 1"), [])
+    jobs.work_queue.close()
+    await asyncio.to_thread(jobs.catalog.close)
+
+
+asyncio.run(run_jobs())
+for server in (ozon, sheets, telegram):
+    server.stop()
+
+print("=" * 60)
+if all_passed:
+    print("✅ All tests passed!")
+else:
+    print("❌ Some tests failed!")